@@ -0,0 +1,162 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .models import Favorite, Fund
+
+# Versões assíncronas das funções de crud usadas nas rotas mais acessadas
+# (/funds, /favorites, /recommendations). Mesma semântica das equivalentes em
+# crud.py; as rotas de métricas continuam síncronas, porque o custo delas é
+# cálculo NumPy e não espera pelo banco.
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    """
+    Busca um usuário pelo ID.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        user_id (int): ID do usuário.
+
+    Returns:
+        models.User | None: Usuário encontrado ou None.
+    """
+    return await db.get(models.User, user_id)
+
+async def list_funds(db: AsyncSession, skip=0, limit=100):
+    """
+    Lista os fundos disponíveis com paginação.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        skip (int): Quantidade de registros a pular.
+        limit (int): Quantidade máxima de registros a retornar.
+
+    Returns:
+        List[models.Fund]: Lista de fundos.
+    """
+    result = await db.scalars(select(Fund).order_by(Fund.id).offset(skip).limit(limit))
+    return result.all()
+
+async def get_fund_by_cnpj(db: AsyncSession, cnpj: str):
+    """
+    Busca um fundo pelo CNPJ.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        cnpj (str): CNPJ do fundo.
+
+    Returns:
+        models.Fund | None: Fundo encontrado ou None.
+    """
+    return await db.scalar(select(Fund).where(Fund.cnpj == str(cnpj)).limit(1))
+
+async def list_history_for_fund(db: AsyncSession, fund_id: int, limit: int = 100):
+    """
+    Lista o histórico de cotas (NAV) de um fundo.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        fund_id (int): ID do fundo.
+        limit (int): Número máximo de registros.
+
+    Returns:
+        list: Linhas com "date" e "nav", em ordem de data.
+    """
+    h = models.FundHistory
+    result = await db.execute(select(h.date, h.nav).where(h.fund_id == fund_id).order_by(h.date).limit(limit))
+    return result.all()
+
+async def add_favorite(db: AsyncSession, user_id: int, fund_id: int):
+    """
+    Adiciona um fundo à lista de favoritos do usuário.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        user_id (int): ID do usuário.
+        fund_id (int): ID do fundo.
+
+    Returns:
+        models.Favorite: Favorito criado ou existente.
+    """
+    fav = await db.scalar(select(Favorite).filter_by(user_id=user_id, fund_id=fund_id).limit(1))
+    if not fav:
+        fav = Favorite(user_id=user_id, fund_id=fund_id)
+        db.add(fav)
+        await db.commit()
+    return fav
+
+async def remove_favorite(db: AsyncSession, user_id: int, fund_id: int):
+    """
+    Remove um fundo da lista de favoritos do usuário.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        user_id (int): ID do usuário.
+        fund_id (int): ID do fundo.
+
+    Returns:
+        bool: True se removido, False se não encontrado.
+    """
+    fav = await db.scalar(select(Favorite).filter_by(user_id=user_id, fund_id=fund_id).limit(1))
+    if fav:
+        await db.delete(fav)
+        await db.commit()
+        return True
+    return False
+
+async def list_favorites(db: AsyncSession, user_id: int):
+    """
+    Lista os fundos favoritados por um usuário.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        user_id (int): ID do usuário.
+
+    Returns:
+        List[models.Fund]: Lista de fundos favoritados.
+    """
+    result = await db.scalars(
+        select(Fund).join(Favorite, Favorite.fund_id == Fund.id).where(Favorite.user_id == user_id)
+    )
+    return result.all()
+
+async def get_recommendations(db: AsyncSession, user_id: int):
+    """
+    Retorna recomendações de fundos com base na classe mais favoritada pelo usuário.
+
+    Mesmas regras de crud.get_recommendations: até 5 fundos da classe mais
+    favoritada que ainda não são favoritos; sem favoritos (ou sem candidatos),
+    fundos genéricos.
+
+    Args:
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+        user_id (int): ID do usuário.
+
+    Returns:
+        List[models.Fund]: Fundos recomendados.
+    """
+    top_class_row = (await db.execute(
+        select(Fund.class_name, func.count(Fund.id).label("total"))
+        .join(Favorite, Favorite.fund_id == Fund.id)
+        .where(Favorite.user_id == user_id)
+        .group_by(Fund.class_name)
+        .order_by(func.count(Fund.id).desc())
+        .limit(1)
+    )).first()
+
+    generic = select(Fund).limit(5)
+    if not top_class_row:
+        return (await db.scalars(generic)).all()
+
+    user_favorites_ids = select(Favorite.fund_id).where(Favorite.user_id == user_id)
+    recommendations = (await db.scalars(
+        select(Fund)
+        .where(Fund.class_name == top_class_row.class_name)
+        .where(Fund.id.not_in(user_favorites_ids))
+        .limit(5)
+    )).all()
+
+    if len(recommendations) == 0:
+        return (await db.scalars(generic)).all()
+    return recommendations
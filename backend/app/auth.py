@@ -4,9 +4,10 @@ from jose import JWTError, jwt
 from typing import Optional
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import crud
-from .db import get_db
+from . import async_crud, crud
+from .db import AsyncSessionLocal, get_async_db, get_async_read_db, get_db, replicas
 import os
 
 
@@ -93,6 +94,66 @@ def get_current_user_from_token(token: str = Depends(oauth2_scheme), db: Session
     Raises:
         HTTPException: Se o token for inválido, expirado ou o usuário não existir.
     """
+    user = crud.get_user(db, _token_user_id(token))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não encontrado")
+
+    return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """
+    Versão assíncrona de get_current_user_from_token, para as rotas async que escrevem.
+
+    Usa a mesma sessão de get_async_db da rota (o FastAPI reaproveita a
+    dependência na requisição): uma conexão por requisição.
+
+    Args:
+        token (str): Token JWT extraído do cabeçalho Authorization.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
+
+    Returns:
+        models.User: Instância do usuário autenticado.
+
+    Raises:
+        HTTPException: Se o token for inválido, expirado ou o usuário não existir.
+    """
+    user = await async_crud.get_user(db, _token_user_id(token))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não encontrado")
+
+    return user
+
+async def get_current_user_async_read(token: str = Depends(oauth2_scheme),
+                                      db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Como get_current_user_async, para as rotas async de leitura.
+
+    Busca o usuário na sessão de get_async_read_db da própria rota, em vez
+    de abrir outra no primário. Se a réplica ainda não tiver o usuário (ex:
+    recém-cadastrado), confirma no primário.
+
+    Args:
+        token (str): Token JWT extraído do cabeçalho Authorization.
+        db (AsyncSession): Sessão assíncrona de leitura da rota.
+
+    Returns:
+        models.User: Instância do usuário autenticado.
+
+    Raises:
+        HTTPException: Se o token for inválido, expirado ou o usuário não existir.
+    """
+    user_id = _token_user_id(token)
+    user = await async_crud.get_user(db, user_id)
+    if not user and replicas.engines:
+        async with AsyncSessionLocal() as primary:
+            user = await async_crud.get_user(primary, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não encontrado")
+
+    return user
+
+def _token_user_id(token: str) -> int:
+    """Valida o token e devolve o ID do usuário (claim "sub")."""
     payload = decode_token(token)
     if not payload or "sub" not in payload:
         raise HTTPException(
@@ -100,10 +161,4 @@ def get_current_user_from_token(token: str = Depends(oauth2_scheme), db: Session
             detail="Token inválido ou expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-
-    user_id = int(payload["sub"])
-    user = crud.get_user(db, user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não encontrado")
-
-    return user
+    return int(payload["sub"])
@@ -0,0 +1,206 @@
+import csv
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from backend.app import models
+
+# diretório com um CSV por índice (ex: CDI.csv, IBOV.csv); o nome do arquivo é o código
+BENCHMARK_DIR = os.getenv("BENCHMARK_DIR", "data/benchmarks")
+
+# índice usado nas métricas relativas pré-calculadas (fund_metrics)
+DEFAULT_BENCHMARK = os.getenv("DEFAULT_BENCHMARK", "CDI")
+
+# nomes da segunda coluna que indicam taxa diária em % (ex: CDI), acumulada em número-índice na carga
+RATE_COLUMNS = ("taxa", "rate", "taxa_dia")
+
+
+def _parse_date(value: str) -> datetime:
+    value = value.strip()
+    if "/" in value:
+        return datetime.strptime(value, "%d/%m/%Y")
+    return datetime.strptime(value[:10], "%Y-%m-%d")
+
+
+def _parse_number(value: str) -> float:
+    value = value.strip()
+    if "," in value:
+        # formato brasileiro: 1.234,56
+        value = value.replace(".", "").replace(",", ".")
+    return float(value)
+
+
+def read_benchmark_file(path: str):
+    """
+    Lê um arquivo de índice de referência.
+
+    Formato: CSV separado por ";" com cabeçalho e duas colunas, data
+    (AAAA-MM-DD ou DD/MM/AAAA) e valor (aceita vírgula decimal). Se a
+    segunda coluna se chamar "taxa"/"rate", os valores são taxas diárias em %
+    e viram um número-índice começando em 1.0; senão, já são o número-índice
+    (ex: pontos do Ibovespa).
+
+    Args:
+        path (str): Caminho do arquivo.
+
+    Returns:
+        list: Tuplas (datetime, valor) em ordem de data, uma por dia.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f, delimiter=";")
+        header = next(reader, None) or []
+        by_day = {}
+        for line in reader:
+            if len(line) < 2 or not line[0].strip() or not line[1].strip():
+                continue
+            by_day[_parse_date(line[0])] = _parse_number(line[1])
+
+    days = sorted(by_day)
+    values = np.array([by_day[d] for d in days], dtype=np.float64)
+    if len(header) > 1 and header[1].strip().lower() in RATE_COLUMNS:
+        values = np.cumprod(1.0 + values / 100.0)
+    return list(zip(days, values.tolist()))
+
+
+def load_benchmarks(db: Session, directory: str = BENCHMARK_DIR):
+    """
+    Carrega os arquivos de índices de um diretório para `benchmarks`/`benchmark_history`.
+
+    Arquivos com o mesmo hash da última carga são ignorados; os demais
+    substituem toda a série do índice. Depois da carga o cache em memória
+    é invalidado.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        directory (str): Diretório com os arquivos <CÓDIGO>.csv.
+
+    Returns:
+        dict: Código → quantidade de valores carregados (só índices recarregados).
+    """
+    if not os.path.isdir(directory):
+        return {}
+
+    loaded = {}
+    for name in sorted(os.listdir(directory)):
+        code, ext = os.path.splitext(name)
+        if ext.lower() != ".csv":
+            continue
+        path = os.path.join(directory, name)
+        with open(path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+
+        code = code.upper()
+        benchmark = db.scalar(select(models.Benchmark).where(models.Benchmark.code == code))
+        if benchmark and benchmark.source_hash == content_hash:
+            continue
+
+        rows = read_benchmark_file(path)
+        if benchmark is None:
+            benchmark = models.Benchmark(code=code)
+            db.add(benchmark)
+            db.flush()
+        db.execute(delete(models.BenchmarkHistory).where(models.BenchmarkHistory.benchmark_id == benchmark.id))
+        if rows:
+            db.execute(insert(models.BenchmarkHistory), [
+                {"benchmark_id": benchmark.id, "date": day, "value": value} for day, value in rows
+            ])
+        benchmark.source_hash = content_hash
+        benchmark.updated_at = datetime.utcnow()
+        db.commit()
+        loaded[code] = len(rows)
+        logging.info(f"[benchmarks] {code}: {len(rows)} valores carregados de {path}")
+
+    if loaded:
+        registry.clear()
+    return loaded
+
+
+class BenchmarkRegistry:
+    """
+    Séries dos índices de referência em memória, compartilhadas entre requisições.
+
+    Cada série é lida do banco uma vez e reaproveitada enquanto o
+    updated_at do índice não mudar (a checagem é uma consulta por chave
+    única, então outros processos que recarregam os arquivos também
+    invalidam o cache deste).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def get(self, db: Session, code: str):
+        """
+        Busca a série de um índice.
+
+        Args:
+            db (Session): Sessão do banco de dados.
+            code (str): Código do índice (ex: "CDI").
+
+        Returns:
+            tuple | None: (datas como ordinais, valores), ou None se o índice não existir.
+        """
+        code = code.upper()
+        row = db.execute(
+            select(models.Benchmark.id, models.Benchmark.updated_at).where(models.Benchmark.code == code)
+        ).first()
+        if row is None:
+            return None
+
+        with self._lock:
+            cached = self._series.get(code)
+        if cached is not None and cached[0] == row.updated_at:
+            return cached[1]
+
+        h = models.BenchmarkHistory
+        points = db.execute(select(h.date, h.value).where(h.benchmark_id == row.id).order_by(h.date)).all()
+        series = (
+            np.fromiter((p[0].toordinal() for p in points), dtype=np.int64, count=len(points)),
+            np.fromiter((p[1] for p in points), dtype=np.float64, count=len(points)),
+        )
+        with self._lock:
+            self._series[code] = (row.updated_at, series)
+        return series
+
+    def aligned(self, db: Session, code: str, dates: np.ndarray):
+        """
+        Alinha a série de um índice às datas de uma matriz de cotas.
+
+        Cada data recebe o último valor do índice até ela (NaN antes do
+        primeiro valor ou depois do último).
+
+        Args:
+            db (Session): Sessão do banco de dados.
+            code (str): Código do índice.
+            dates (np.ndarray): Datas como ordinais.
+
+        Returns:
+            np.ndarray | None: Valores alinhados, ou None se o índice não existir.
+        """
+        series = self.get(db, code)
+        if series is None:
+            return None
+        bench_dates, values = series
+        dates = np.asarray(dates, dtype=np.int64)
+        aligned = np.full(len(dates), np.nan)
+        if len(bench_dates) == 0:
+            return aligned
+        pos = np.searchsorted(bench_dates, dates, side="right") - 1
+        inside = (pos >= 0) & (dates <= bench_dates[-1])
+        aligned[inside] = values[pos[inside]]
+        return aligned
+
+    def clear(self):
+        """Descarta as séries em memória."""
+        with self._lock:
+            self._series.clear()
+
+
+# instância compartilhada pela API, pela ingestão e pelo recálculo de métricas
+registry = BenchmarkRegistry()
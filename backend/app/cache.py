@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Cache em memória com descarte do item menos usado recentemente.
+
+    Compartilhado entre as threads do servidor, por isso todo acesso passa
+    por um lock. As chaves devem incluir tudo o que invalida o valor (ex: a
+    versão do histórico), já que não há expiração por tempo.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Busca um valor e o marca como usado recentemente.
+
+        Args:
+            key: Chave (hashable).
+            default: Valor devolvido se a chave não estiver no cache.
+
+        Returns:
+            O valor armazenado ou `default`.
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        """
+        Armazena um valor, descartando o mais antigo se o cache estiver cheio.
+
+        Args:
+            key: Chave (hashable).
+            value: Valor a armazenar.
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """Remove todos os itens."""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
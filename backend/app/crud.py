@@ -1,11 +1,68 @@
 from datetime import datetime
+from itertools import islice
+import hashlib
+import io
+import numpy as np
 from sqlalchemy.orm import Session
 from . import models
 from .auth import hash_password
-from .metrics import calculate_returns, calculate_volatility, calculate_sharpe, total_return
+from .cache import LRUCache
+from .history_schema import ensure_history_partitions
+from .nav_matrix import (
+    NAV_MATRIX_PATH, NAV_MATRIX_VERSION_MARGIN, SharedNavMatrix, shared_nav_matrix, version_key, write_nav_matrix,
+)
+from .benchmarks import DEFAULT_BENCHMARK, registry as benchmark_registry
+from .metrics import (
+    OnlineMetrics, batch_metrics, pairwise_covariance, relative_metrics, rolling_metrics, stream_metrics,
+)
+from .series import SERIES_EPOCH, daily_series, pack_series, series_days, series_matrix, unpack_series
+from .portfolio import backtest, estimate_moments, optimize_allocation, portfolio_returns, simulate_portfolio
 from decimal import Decimal
 from .models import Favorite, Fund
-from sqlalchemy import func
+from sqlalchemy import (
+    Column, DateTime, Float, Integer, LargeBinary, MetaData, Table, bindparam, delete, func, insert, literal_column, or_,
+    select, text, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+
+# quantidade de fundos enviados em cada INSERT ... ON CONFLICT
+FUND_UPSERT_BATCH_SIZE = 2000
+
+# quantidade de cotas enviadas em cada COPY / executemany
+HISTORY_LOAD_BATCH_SIZE = 50_000
+
+# quantidade de fundos carregados em cada matriz de cotas ao recalcular métricas
+METRICS_BATCH_SIZE = 2000
+
+# cotas buscadas por vez ao ler o histórico de um fundo em streaming
+HISTORY_STREAM_BATCH_SIZE = 10_000
+
+# acumuladores de métricas gravados em cada INSERT ... ON CONFLICT
+FUND_STATS_BATCH_SIZE = 1000
+
+# quantidade de fundos lidos de `fund_series` em cada bloco da exportação da matriz de cotas
+NAV_MATRIX_EXPORT_BATCH_SIZE = 1000
+
+# matrizes de correlação recentes, por conjunto de fundos e versão do histórico
+correlation_cache = LRUCache(maxsize=16)
+
+# limite de fundos em uma matriz de correlação (memória: ~fundos² floats por matriz)
+MAX_CORRELATION_FUNDS = 5000
+
+# momentos estimados por conjunto de fundos e versão do histórico
+moments_cache = LRUCache(maxsize=16)
+
+# últimos pesos por (perfil, método, fundos), usados como ponto de partida do otimizador
+allocation_warm_start = LRUCache(maxsize=256)
+
+# limite de fundos candidatos em uma alocação (cada passo do otimizador é ~fundos² operações)
+MAX_ALLOCATION_FUNDS = 1000
+
+# simulações recentes, por fundos, versão do histórico e parâmetros
+simulation_cache = LRUCache(maxsize=64)
+
+# limite de trajetórias x dias em uma simulação (memória: ~8 bytes por célula no pico)
+MAX_SIMULATION_CELLS = 20_000_000
 
 
 def get_user_by_email(db: Session, email: str):
@@ -173,6 +230,199 @@ def upsert_fund(db: Session, cnpj: str, name: str, class_name: str, rentability:
     db.refresh(fund)
     return fund
 
+def upsert_funds_bulk(db: Session, rows, batch_size: int = FUND_UPSERT_BATCH_SIZE):
+    """
+    Cria ou atualiza fundos em lote com INSERT ... ON CONFLICT (cnpj).
+
+    Cada lote é gravado em um único comando e uma única transação. Fundos cujos
+    campos não mudaram não são reescritos (nem têm o updated_at alterado).
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        rows (iterable): Dicionários com "cnpj" e os campos a gravar
+            (ex: name, class_name). Todos devem ter as mesmas chaves.
+        batch_size (int): Quantidade de fundos por comando.
+
+    Returns:
+        dict: Contadores "inserted", "updated", "unchanged" e a lista
+        "inserted_ids" com os IDs dos fundos criados.
+    """
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0, "inserted_ids": []}
+    batch = {}
+    for row in rows:
+        # o mesmo CNPJ não pode aparecer duas vezes no mesmo ON CONFLICT
+        batch[row["cnpj"]] = row
+        if len(batch) >= batch_size:
+            _upsert_funds_batch(db, list(batch.values()), stats)
+            batch = {}
+    if batch:
+        _upsert_funds_batch(db, list(batch.values()), stats)
+    return stats
+
+def _upsert_funds_batch(db: Session, batch, stats):
+    """
+    Grava um lote de fundos e acumula os contadores em `stats`.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        batch (list): Dicionários de fundos com CNPJs distintos.
+        stats (dict): Contadores acumulados de upsert_funds_bulk.
+    """
+    fields = [k for k in batch[0] if k != "cnpj"]
+    now = datetime.utcnow()
+    values = [{**row, "updated_at": now} for row in batch]
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(models.Fund).values(values)
+    else:
+        stmt = sqlite.insert(models.Fund).values(values)
+
+    changed = or_(*[getattr(models.Fund, f).is_distinct_from(stmt.excluded[f]) for f in fields])
+    set_ = {f: stmt.excluded[f] for f in fields}
+    set_["updated_at"] = stmt.excluded.updated_at
+    stmt = stmt.on_conflict_do_update(index_elements=[models.Fund.cnpj], set_=set_, where=changed)
+
+    if dialect == "postgresql":
+        # xmax = 0 identifica linhas recém-inseridas (não houve conflito)
+        stmt = stmt.returning(models.Fund.id, literal_column("xmax = 0"))
+        returned = db.execute(stmt).all()
+        inserted_ids = [fund_id for fund_id, inserted in returned if inserted]
+    else:
+        existing = set(db.scalars(
+            select(models.Fund.cnpj).where(models.Fund.cnpj.in_([row["cnpj"] for row in batch]))
+        ))
+        stmt = stmt.returning(models.Fund.id, models.Fund.cnpj)
+        returned = db.execute(stmt).all()
+        inserted_ids = [fund_id for fund_id, cnpj in returned if cnpj not in existing]
+    db.commit()
+
+    stats["inserted"] += len(inserted_ids)
+    stats["updated"] += len(returned) - len(inserted_ids)
+    stats["unchanged"] += len(batch) - len(returned)
+    stats["inserted_ids"].extend(inserted_ids)
+
+def get_fund_hashes(db: Session):
+    """
+    Retorna o hash de cadastro de todos os fundos com uma única consulta.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        dict: CNPJ → source_hash (None se o fundo ainda não tiver hash).
+    """
+    return dict(db.execute(select(models.Fund.cnpj, models.Fund.source_hash)).all())
+
+def get_source_state(db: Session, source: str):
+    """
+    Busca o estado da última ingestão de um arquivo de origem.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        source (str): URL ou caminho do arquivo.
+
+    Returns:
+        models.SourceState | None: Estado encontrado ou None.
+    """
+    return db.query(models.SourceState).filter(models.SourceState.source == source).first()
+
+def save_source_state(db: Session, source: str, etag: str = None, last_modified: str = None, content_hash: str = None,
+                      commit: bool = True):
+    """
+    Registra os validadores de um arquivo de origem após uma ingestão bem-sucedida.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        source (str): URL ou caminho do arquivo.
+        etag (str): ETag devolvido pelo servidor.
+        last_modified (str): Last-Modified (ou mtime/tamanho do arquivo local).
+        content_hash (str): SHA-256 do conteúdo.
+        commit (bool): Se False, apenas adiciona à transação corrente.
+
+    Returns:
+        models.SourceState: Estado atualizado ou criado.
+    """
+    state = get_source_state(db, source)
+    if not state:
+        state = models.SourceState(source=source)
+        db.add(state)
+    state.etag = etag
+    state.last_modified = last_modified
+    state.content_hash = content_hash
+    state.updated_at = datetime.utcnow()
+    if commit:
+        db.commit()
+        db.refresh(state)
+    else:
+        db.flush()
+    return state
+
+def get_job_run(db: Session, name: str):
+    """
+    Busca a última execução concluída de um job agendado.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        name (str): Nome do job.
+
+    Returns:
+        models.JobRun | None: Registro da execução ou None se o job nunca terminou.
+    """
+    return db.get(models.JobRun, name)
+
+def save_job_run(db: Session, name: str, started_at: datetime, finished_at: datetime = None):
+    """
+    Registra (e faz commit) a conclusão de um job agendado.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        name (str): Nome do job.
+        started_at (datetime): Início da execução.
+        finished_at (datetime | None): Fim da execução (default: agora).
+
+    Returns:
+        models.JobRun: Registro atualizado ou criado.
+    """
+    run = db.get(models.JobRun, name)
+    if run is None:
+        run = models.JobRun(name=name)
+        db.add(run)
+    run.started_at = started_at
+    run.finished_at = finished_at or datetime.utcnow()
+    db.commit()
+    return run
+
+def get_fund_set_version(db: Session) -> str:
+    """
+    Identifica a versão do cadastro de fundos: muda quando fundos entram ou saem.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        str: Quantidade de fundos e maior id, como "quantidade:id".
+    """
+    count, max_id = db.execute(select(func.count(models.Fund.id), func.max(models.Fund.id))).one()
+    return f"{count}:{max_id or 0}"
+
+def fund_keyed_hash(content_hash: str, fund_version: str) -> str:
+    """
+    Combina o hash de um arquivo com a versão do cadastro de fundos.
+
+    Gravado no lugar do hash do conteúdo quando cotas do arquivo foram
+    ignoradas por CNPJ desconhecido: o arquivo volta a ser processado
+    quando o conteúdo ou o cadastro mudar.
+
+    Args:
+        content_hash (str): SHA-256 do conteúdo.
+        fund_version (str): Saída de get_fund_set_version.
+
+    Returns:
+        str: SHA-256 da combinação.
+    """
+    return hashlib.sha256(f"{content_hash}:{fund_version}".encode()).hexdigest()
+
 def list_funds(db: Session, skip=0, limit=100):
     """
     Lista os fundos disponíveis com paginação.
@@ -218,6 +468,8 @@ def add_history_entry(db: Session, fund_id: int, date: datetime, nav: float):
     """
     Adiciona uma entrada ao histórico de cotas de um fundo.
 
+    Se o fundo já tiver cota nessa data, o valor é substituído.
+
     Args:
         db (Session): Sessão do banco de dados.
         fund_id (int): ID do fundo.
@@ -225,67 +477,1317 @@ def add_history_entry(db: Session, fund_id: int, date: datetime, nav: float):
         nav (float): Valor da cota.
 
     Returns:
-        models.FundHistory: Entrada criada.
+        models.FundHistory: Entrada gravada.
     """
-    entry = models.FundHistory(fund_id=fund_id, date=date, nav=nav)
-    db.add(entry)
+    upsert_history(db, [{"fund_id": fund_id, "date": date, "nav": nav}])
+    update_fund_stats(db, [(fund_id, date, nav)])
     db.commit()
-    db.refresh(entry)
-    return entry
+    h = models.FundHistory
+    return db.scalar(select(h).where(h.fund_id == fund_id, h.date == date))
 
 def add_history_bulk(db: Session, fund_id: int, rows):
     """
     Adiciona múltiplas entradas ao histórico de cotas de um fundo.
 
+    Cotas em datas que o fundo já tem substituem as existentes.
+
     Args:
         db (Session): Sessão do banco de dados.
         fund_id (int): ID do fundo.
         rows (iterable): Tuplas (date, nav).
     """
-    for date, nav in rows:
-        entry = models.FundHistory(fund_id=fund_id, date=date, nav=nav)
-        db.add(entry)
+    rows = list(rows)
+    upsert_history(db, [{"fund_id": fund_id, "date": date, "nav": nav} for date, nav in rows])
+    update_fund_stats(db, [(fund_id, date, nav) for date, nav in rows])
+    db.commit()
+
+def add_history_rows(db: Session, rows):
+    """
+    Insere entradas de histórico de vários fundos com um único executemany.
+
+    Cotas em datas que o fundo já tem substituem as existentes.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        rows (list): Dicionários com fund_id, date e nav.
+    """
+    if rows:
+        upsert_history(db, rows)
+        update_fund_stats(db, [(row["fund_id"], row["date"], row["nav"]) for row in rows])
     db.commit()
 
-def compute_metrics_from_history(db: Session, cnpj: str, risk_free: float = 0.0):
+def _batched(rows, size):
+    """Agrupa um iterável em listas de até `size` itens."""
+    it = iter(rows)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def _copy_value(value):
+    """Formata um valor para o formato texto do COPY do PostgreSQL."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return str(value)
+
+def copy_rows(db: Session, table, columns, rows, batch_size: int = HISTORY_LOAD_BATCH_SIZE):
+    """
+    Carrega linhas em massa em uma tabela.
+
+    No PostgreSQL usa COPY FROM STDIN; nos demais bancos recorre a um
+    executemany por lote. Não faz commit: a transação fica com quem chama.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        table (Table): Tabela de destino.
+        columns (list): Nomes das colunas, na ordem das tuplas.
+        rows (iterable): Tuplas de valores.
+        batch_size (int): Quantidade de linhas por COPY / executemany.
+
+    Returns:
+        int: Quantidade de linhas carregadas.
+    """
+    total = 0
+    if db.get_bind().dialect.name == "postgresql":
+        copy_sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN"
+        cursor = db.connection().connection.cursor()
+        try:
+            for batch in _batched(rows, batch_size):
+                buf = io.StringIO()
+                buf.writelines("\t".join(map(_copy_value, row)) + "\n" for row in batch)
+                buf.seek(0)
+                cursor.copy_expert(copy_sql, buf)
+                total += len(batch)
+        finally:
+            cursor.close()
+    else:
+        for batch in _batched(rows, batch_size):
+            db.execute(insert(table), [dict(zip(columns, row)) for row in batch])
+            total += len(batch)
+    return total
+
+def upsert_history(db: Session, rows, batch_size: int = HISTORY_LOAD_BATCH_SIZE):
+    """
+    Grava cotas com INSERT ... ON CONFLICT (fund_id, date), sem commit.
+
+    Cota existente para o mesmo fundo e dia tem o valor substituído (e só é
+    reescrita se o valor mudou), então regravar as mesmas cotas não duplica
+    nem altera o histórico. Se `rows` repetir fundo e dia, vale a última.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        rows (iterable): Dicionários com fund_id, date e nav.
+        batch_size (int): Cotas por executemany.
+
+    Returns:
+        int: Quantidade de cotas distintas enviadas.
+    """
+    unique = {(row["fund_id"], row["date"]): row for row in rows}
+    if not unique:
+        return 0
+    days = [day for _, day in unique]
+    ensure_history_partitions(db, min(days), max(days))
+
+    h = models.FundHistory
+    insert_fn = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert_fn(h)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[h.fund_id, h.date],
+        set_={"nav": stmt.excluded.nav},
+        where=h.nav != stmt.excluded.nav,
+    )
+    for batch in _batched(unique.values(), batch_size):
+        db.execute(stmt, batch)
+    return len(unique)
+
+def merge_history(db: Session, source: str, replace=None, changed_funds: set = None):
     """
-    Calcula métricas financeiras com base no histórico de cotas de um fundo.
+    Aplica em `fund_history` as cotas de uma consulta SQL, sem commit.
 
-    Métricas incluem rentabilidade total, volatilidade e índice de Sharpe.
+    A consulta deve trazer as colunas seq, fund_id, date e nav (linhas com
+    fund_id nulo são ignoradas). A gravação é um upsert por (fund_id, date):
+    se a origem repetir fundo e dia, vale a linha de maior seq, e cotas iguais
+    às já gravadas não são reescritas.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        source (str): Consulta SQL de origem.
+        replace (tuple | bool | None): Intervalo [início, fim) em que as cotas
+            dos fundos presentes na origem que não vieram nela são removidas.
+            True usa o intervalo de cada linha da origem (colunas
+            replace_start e replace_end, ex: o mês do arquivo de cada cota
+            do staging); linhas sem intervalo não removem nada.
+        changed_funds (set | None): Se informado, recebe os IDs dos fundos que
+            tiveram cotas já contabilizadas em `fund_stats` (até last_date)
+            inseridas, alteradas ou removidas, isto é, os que precisam ser
+            recalculados; cotas posteriores a last_date não entram.
+
+    Returns:
+        int: Quantidade de cotas inseridas ou alteradas.
+    """
+    bounds = db.execute(
+        text(f"SELECT MIN(date) AS lo, MAX(date) AS hi FROM ({source}) s WHERE fund_id IS NOT NULL")
+        .columns(lo=DateTime, hi=DateTime)
+    ).first()
+    ensure_history_partitions(db, bounds.lo, bounds.hi)
+
+    latest = f"""
+        SELECT fund_id, date, nav FROM (
+            SELECT fund_id, date, nav,
+                   ROW_NUMBER() OVER (PARTITION BY fund_id, date ORDER BY seq DESC) AS rn
+            FROM ({source}) s
+            WHERE fund_id IS NOT NULL
+        ) r
+        WHERE rn = 1
+    """
+
+    if changed_funds is not None:
+        # antes do upsert: cotas novas ou diferentes dentro do período já contabilizado
+        changed_funds.update(db.scalars(text(f"""
+            SELECT DISTINCT r.fund_id FROM ({latest}) r
+            JOIN fund_stats st ON st.fund_id = r.fund_id AND r.date <= st.last_date
+            LEFT JOIN fund_history h ON h.fund_id = r.fund_id AND h.date = r.date
+            WHERE h.fund_id IS NULL OR h.nav <> r.nav
+        """)))
+
+    if replace:
+        # cotas removidas também obrigam a recalcular o fundo
+        returning = "RETURNING fund_id" if changed_funds is not None else ""
+        missing = f"""
+            NOT EXISTS (
+                SELECT 1 FROM ({source}) s
+                WHERE s.fund_id = fund_history.fund_id AND s.date = fund_history.date
+            )
+        """
+        if replace is True:
+            # parte dos intervalos (poucos por fundo) e busca as cotas pela chave (fund_id, date)
+            removed = db.execute(text(f"""
+                DELETE FROM fund_history
+                WHERE (fund_id, date) IN (
+                    SELECT h.fund_id, h.date
+                    FROM (
+                        SELECT DISTINCT fund_id, replace_start, replace_end FROM ({source}) s
+                        WHERE fund_id IS NOT NULL AND replace_start IS NOT NULL
+                    ) r
+                    JOIN fund_history h ON h.fund_id = r.fund_id
+                     AND h.date >= r.replace_start AND h.date < r.replace_end
+                )
+                  AND {missing}
+                {returning}
+            """))
+        else:
+            removed = db.execute(
+                text(f"""
+                    DELETE FROM fund_history
+                    WHERE date >= :start AND date < :end
+                      AND fund_id IN (SELECT fund_id FROM ({source}) s)
+                      AND {missing}
+                    {returning}
+                """).bindparams(bindparam("start", type_=DateTime), bindparam("end", type_=DateTime)),
+                {"start": replace[0], "end": replace[1]},
+            )
+        if changed_funds is not None:
+            changed_funds.update(removed.scalars())
+
+    return db.execute(text(f"""
+        INSERT INTO fund_history (fund_id, date, nav)
+        {latest}
+        ON CONFLICT (fund_id, date) DO UPDATE SET nav = excluded.nav
+        WHERE fund_history.nav <> excluded.nav
+    """)).rowcount
+
+# área de carga das cotas em massa: tabela temporária da conexão, fora do create_all
+history_load = Table(
+    "fund_history_load", MetaData(),
+    Column("seq", Integer, primary_key=True),  # ordem de chegada: desempata fundo/dia repetidos
+    Column("fund_id", Integer, nullable=False),
+    Column("date", DateTime, nullable=False),
+    Column("nav", Float, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+def bulk_load_history(db: Session, rows, batch_size: int = HISTORY_LOAD_BATCH_SIZE, replace=None,
+                      changed_funds: set = None):
+    """
+    Carrega cotas em massa em `fund_history`.
+
+    As cotas vão primeiro para uma tabela temporária (COPY no PostgreSQL)
+    e entram no histórico com merge_history, em uma instrução. Não faz
+    commit: a transação fica com quem chama.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        rows (iterable): Tuplas (fund_id, date, nav).
+        batch_size (int): Quantidade de cotas por COPY / executemany.
+        replace (tuple | None): Intervalo [início, fim) substituído para os
+            fundos presentes na carga (ver merge_history).
+        changed_funds (set | None): Recebe os fundos a recalcular (ver merge_history).
+
+    Returns:
+        int: Quantidade de cotas carregadas.
+    """
+    conn = db.connection()
+    history_load.drop(conn, checkfirst=True)
+    history_load.create(conn)
+    loaded = copy_rows(db, history_load, ["fund_id", "date", "nav"], rows, batch_size)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"ANALYZE {history_load.name}"))
+    merge_history(db, f"SELECT seq, fund_id, date, nav FROM {history_load.name}", replace=replace,
+                  changed_funds=changed_funds)
+    history_load.drop(conn)
+    return loaded
+
+def purge_simulated_history(db: Session, fund_ids):
+    """
+    Remove o histórico simulado de fundos que passaram a ter cotas reais, sem commit.
+
+    As cotas simuladas (cvm_ingest.simulate_nav_rows) são gravadas com
+    hora do dia; as do informe diário da CVM, só com a data (meia-noite).
+    A consulta usa o índice parcial das cotas simuladas
+    (models.SIMULATED_NAV_WHERE), então fundos sem elas custam uma busca no índice.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+
+    Returns:
+        set: IDs dos fundos que tinham cotas simuladas (precisam ter os acumuladores recalculados).
+    """
+    ids = sorted({int(i) for i in fund_ids})
+    if not ids:
+        return set()
+    h = models.FundHistory
+    simulated = text(models.SIMULATED_NAV_WHERE[db.get_bind().dialect.name])
+    purged = set()
+    for batch in _batched(ids, FUND_UPSERT_BATCH_SIZE):
+        purged.update(db.scalars(delete(h).where(h.fund_id.in_(batch), simulated).returning(h.fund_id)))
+    return purged
+
+def get_fund_id_map(db: Session):
+    """
+    Retorna o mapeamento CNPJ → id de todos os fundos com uma única consulta.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        dict: CNPJ (como armazenado) → id do fundo.
+    """
+    return {cnpj: fund_id for fund_id, cnpj in db.execute(select(models.Fund.id, models.Fund.cnpj))}
+
+def iter_history_navs(db: Session, fund_id: int, batch_size: int = HISTORY_STREAM_BATCH_SIZE):
+    """
+    Percorre as cotas de um fundo em ordem cronológica sem carregar tudo em memória.
+
+    Uma cota por dia (a última do dia), como em load_history_series.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_id (int): ID do fundo.
+        batch_size (int): Cotas buscadas por vez no cursor.
+
+    Yields:
+        float: Valor de cada cota.
+    """
+    h = models.FundHistory
+    stmt = (
+        select(h.date, h.nav)
+        .where(h.fund_id == fund_id)
+        .order_by(h.date)
+        .execution_options(yield_per=batch_size)
+    )
+    day = nav = None
+    for date, value in db.execute(stmt):
+        if day is not None and date.date() != day:
+            yield nav
+        day, nav = date.date(), value
+    if day is not None:
+        yield nav
+
+def load_history_series(db: Session, fund_ids):
+    """
+    Lê as séries de cotas de vários fundos direto de `fund_history`, em uma consulta.
+
+    É a fonte usada para (re)construir `fund_series`; as leituras
+    analíticas usam load_fund_series.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+
+    Returns:
+        dict: ID do fundo → (dias desde 1970-01-01, cotas), uma cota por dia
+            (a última do dia); fundos sem cotas ficam de fora.
+    """
+    h = models.FundHistory
+    ids = sorted({int(i) for i in fund_ids})
+    rows = db.execute(select(h.fund_id, h.date, h.nav).where(h.fund_id.in_(ids)).order_by(h.fund_id, h.date)).all()
+
+    count = len(rows)
+    row_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+    days = np.fromiter((r[1].toordinal() for r in rows), dtype=np.int64, count=count)
+    navs = np.fromiter((r[2] for r in rows), dtype=np.float64, count=count)
+
+    bounds = np.flatnonzero(np.diff(row_ids)) + 1
+    firsts = np.concatenate(([0], bounds)) if count else []
+    series = {}
+    for first, fund_days, fund_navs in zip(firsts, np.split(days, bounds), np.split(navs, bounds)):
+        fund_days, fund_navs = daily_series(fund_days, fund_navs)
+        series[int(row_ids[first])] = (series_days(fund_days), fund_navs)
+    return series
+
+def load_fund_series(db: Session, fund_ids):
+    """
+    Lê as séries colunares (`fund_series`) de vários fundos em uma consulta.
+
+    Os vetores apontam para os buffers devolvidos pelo driver (np.frombuffer),
+    sem cópia. Fundos que ainda não têm série (ex: base anterior à tabela,
+    até o próximo ensure_fund_stats) são lidos de `fund_history`.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+
+    Returns:
+        dict: ID do fundo → (dias desde 1970-01-01, cotas).
+    """
+    s = models.FundSeries
+    ids = sorted({int(i) for i in fund_ids})
+    series = {
+        fund_id: unpack_series(days, navs)
+        for fund_id, days, navs in db.execute(select(s.fund_id, s.days, s.navs).where(s.fund_id.in_(ids)))
+    }
+    missing = [i for i in ids if i not in series]
+    if missing:
+        series.update(load_history_series(db, missing))
+    return series
+
+def load_nav_matrix(db: Session, fund_ids, start: datetime = None, end: datetime = None):
+    """
+    Carrega as cotas de vários fundos em uma matriz alinhada por data.
+
+    Usa a matriz exportada em NAV_MATRIX_PATH (mapeada em memória, sem
+    consulta às cotas) quando ela contém todos os fundos e está atualizada
+    para eles; senão lê as séries colunares de `fund_series` (uma consulta,
+    sem um objeto por cota). Datas em que um fundo não tem cota ficam como NaN.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+        start (datetime | None): Primeira data incluída.
+        end (datetime | None): Última data incluída.
+
+    Returns:
+        tuple: (ids dos fundos, datas como ordinais, matriz fundos x datas de cotas).
+    """
+    ids = np.unique(np.fromiter(fund_ids, dtype=np.int64))
+    start = start.toordinal() if start is not None else None
+    end = end.toordinal() if end is not None else None
+    if shared_nav_matrix.snapshot() is not None:
+        mapped = shared_nav_matrix.load(ids, _history_updated_at(db, ids.tolist()), start, end)
+        if mapped is not None:
+            return mapped
+    return series_matrix(ids, load_fund_series(db, ids.tolist()), start, end)
+
+def export_nav_matrix(db: Session, path: str = None, only_if_stale: bool = False):
+    """
+    Exporta as cotas de todos os fundos para o arquivo da matriz compartilhada (ver nav_matrix).
+
+    A matriz é montada em blocos a partir de `fund_series` e gravada com
+    troca atômica; os workers do host passam a usá-la na próxima leitura.
+
+    A versão gravada é o maior updated_at de `fund_stats`, limitado ao
+    início da exportação menos NAV_MATRIX_VERSION_MARGIN. O updated_at vem
+    do relógio de quem escreve, no momento da escrita: uma transação que
+    ainda não fez commit quando as séries são lidas pode ter updated_at
+    menor que o de outras já gravadas. Com a folga, a exportação só se
+    declara em dia até um instante em que essas escritas já terminaram;
+    fundos alterados depois disso continuam sendo lidos do banco, e a
+    próxima exportação com `only_if_stale` refaz o arquivo.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        path (str | None): Caminho do arquivo (default: NAV_MATRIX_PATH; vazio desativa).
+        only_if_stale (bool): Só exporta se o arquivo não existir ou estiver desatualizado.
+
+    Returns:
+        dict | None: "funds", "dates" e "bytes" do arquivo gravado, ou None se nada foi exportado.
+    """
+    path = NAV_MATRIX_PATH if path is None else path
+    if not path:
+        return None
+    started = datetime.utcnow()
+    latest = _history_updated_at(db)
+    if only_if_stale:
+        current = SharedNavMatrix(path).version()
+        if current is not None and current >= version_key(latest):
+            return None
+    version = min(latest, started - NAV_MATRIX_VERSION_MARGIN) if latest is not None else None
+
+    funds = db.execute(select(models.Fund.id, models.Fund.cnpj).order_by(models.Fund.id)).all()
+    fund_ids = [fund_id for fund_id, _ in funds]
+
+    # 1ª passada: índice de datas (união das datas de todos os fundos)
+    days = np.empty(0, dtype=np.int64)
+    for batch in _batched(fund_ids, NAV_MATRIX_EXPORT_BATCH_SIZE):
+        batch_days = [d for d, _ in load_fund_series(db, batch).values() if len(d)]
+        if batch_days:
+            days = np.union1d(days, np.concatenate(batch_days))
+
+    # 2ª passada: linhas da matriz, um bloco de fundos por vez
+    def blocks():
+        for batch in _batched(fund_ids, NAV_MATRIX_EXPORT_BATCH_SIZE):
+            series = load_fund_series(db, batch)
+            block = np.full((len(batch), len(days)), np.nan)
+            for row, fund_id in enumerate(batch):
+                fund_days, navs = series.get(fund_id, ((), ()))
+                if not len(fund_days):
+                    continue
+                cols = np.searchsorted(days, fund_days)
+                # datas gravadas depois da 1ª passada: o fundo já tem versão mais nova que a exportada
+                known = cols < len(days)
+                known[known] = days[cols[known]] == fund_days[known]
+                block[row, cols[known]] = navs[known]
+            yield block
+
+    size = write_nav_matrix(path, np.array(fund_ids, dtype=np.int64), [cnpj for _, cnpj in funds],
+                            days + SERIES_EPOCH, blocks(), version)
+    return {"funds": len(fund_ids), "dates": len(days), "bytes": size}
+
+def refresh_fund_metrics(db: Session, fund_ids=None, batch_size: int = METRICS_BATCH_SIZE, on_batch=None):
+    """
+    Atualiza `fund_metrics` e as colunas de métricas de `funds` a partir de `fund_stats`.
+
+    Não lê o histórico: os acumuladores já estão em dia, então o custo é
+    uma linha por fundo. Faz commit a cada lote.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable | None): Fundos a atualizar (None = todos com acumuladores).
+        batch_size (int): Fundos por lote.
+        on_batch (callable | None): Chamado com a quantidade de fundos de cada lote.
+
+    Returns:
+        int: Quantidade de fundos atualizados.
+    """
+    s = models.FundStats
+    if fund_ids is None:
+        fund_ids = db.scalars(select(s.fund_id).order_by(s.fund_id)).all()
+
+    insert_fn = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    updated = 0
+    for batch in _batched(fund_ids, batch_size):
+        now = datetime.utcnow()
+        states = db.execute(select(*s.__table__.c).where(s.fund_id.in_(batch))).all()
+        values = [
+            {"fund_id": state.fund_id, **OnlineMetrics.from_state(state).result(), "computed_at": now}
+            for state in states
+        ]
+        if values:
+            stmt = insert_fn(models.FundMetrics)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.FundMetrics.fund_id],
+                set_={k: stmt.excluded[k] for k in values[0] if k != "fund_id"},
+            )
+            db.execute(stmt, values)
+            db.execute(update(models.Fund), [
+                {"id": v["fund_id"], "rentability": v["rentability"], "risk": v["volatility"],
+                 "sharpe": v["sharpe"], "updated_at": now}
+                for v in values
+            ])
+        db.commit()
+        updated += len(values)
+        if on_batch:
+            on_batch(len(batch))
+    return updated
+
+RELATIVE_FIELDS = ("alpha", "beta", "tracking_error", "information_ratio")
+
+def compute_relative_metrics(db: Session, fund_ids, benchmark: str = DEFAULT_BENCHMARK, risk_free: float = 0.0,
+                             nav_matrix=None):
+    """
+    Calcula alfa, beta, tracking error e information ratio de vários fundos contra um índice.
+
+    A série do índice vem do cache em memória (benchmarks.registry) e é
+    alinhada às datas da matriz de cotas; o cálculo é vetorizado.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+        benchmark (str): Código do índice.
+        risk_free (float): Taxa livre de risco por período (usada no alfa).
+        nav_matrix (tuple | None): Resultado de load_nav_matrix já carregado para esses fundos.
+
+    Returns:
+        dict: ID do fundo → {"benchmark", "alpha", "beta", "tracking_error",
+            "information_ratio"}; valores None se o índice não existir ou não
+            houver períodos suficientes.
+    """
+    ids, dates, matrix = nav_matrix if nav_matrix is not None else load_nav_matrix(db, fund_ids)
+    aligned = benchmark_registry.aligned(db, benchmark, dates)
+    if aligned is None:
+        return {int(i): {"benchmark": None, **{f: None for f in RELATIVE_FIELDS}} for i in ids}
+
+    computed = relative_metrics(matrix, aligned, risk_free)
+    return {
+        int(fund_id): {
+            "benchmark": benchmark.upper(),
+            **{f: (None if np.isnan(computed[f][i]) else computed[f][i].item()) for f in RELATIVE_FIELDS},
+        }
+        for i, fund_id in enumerate(ids)
+    }
+
+def refresh_benchmark_metrics(db: Session, fund_ids=None, batch_size: int = METRICS_BATCH_SIZE, on_batch=None,
+                              benchmark: str = DEFAULT_BENCHMARK):
+    """
+    Atualiza as métricas relativas ao índice padrão em `fund_metrics`.
+
+    Diferente de refresh_fund_metrics, precisa do histórico: lê a matriz de
+    cotas de cada lote. Só atualiza fundos que já têm linha em `fund_metrics`.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable | None): Fundos a atualizar (None = todos com métricas).
+        batch_size (int): Fundos por matriz de cotas.
+        on_batch (callable | None): Chamado com a quantidade de fundos de cada lote.
+        benchmark (str): Código do índice.
+
+    Returns:
+        int: Quantidade de fundos atualizados.
+    """
+    m = models.FundMetrics
+    if fund_ids is None:
+        fund_ids = db.scalars(select(m.fund_id).order_by(m.fund_id)).all()
+
+    updated = 0
+    for batch in _batched(fund_ids, batch_size):
+        existing = set(db.scalars(select(m.fund_id).where(m.fund_id.in_(batch))))
+        relative = compute_relative_metrics(db, existing, benchmark) if existing else {}
+        if relative:
+            db.execute(update(m), [{"fund_id": fund_id, **values} for fund_id, values in relative.items()])
+        db.commit()
+        updated += len(relative)
+        if on_batch:
+            on_batch(len(batch))
+    return updated
+
+def recompute_all_metrics(db: Session, batch_size: int = METRICS_BATCH_SIZE, on_batch=None):
+    """
+    Recalcula do zero os acumuladores e as métricas de todos os fundos a partir do histórico.
+
+    Corrige eventuais divergências dos acumuladores incrementais; usado pelo
+    job periódico de recálculo.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        batch_size (int): Fundos por matriz de cotas.
+        on_batch (callable | None): Chamado com a quantidade de fundos de cada lote.
+
+    Returns:
+        int: Quantidade de fundos atualizados.
+    """
+    all_ids = db.scalars(select(models.Fund.id).order_by(models.Fund.id)).all()
+    updated = 0
+    for batch in _batched(all_ids, batch_size):
+        rebuild_fund_stats(db, batch, batch_size)
+        updated += refresh_fund_metrics(db, batch, batch_size)
+        refresh_benchmark_metrics(db, batch, batch_size)
+        if on_batch:
+            on_batch(len(batch))
+    return updated
+
+def get_fund_metrics(db: Session, cnpj: str, risk_free: float = 0.0, benchmark: str = None):
+    """
+    Retorna as métricas de um fundo sem escrever no banco.
+
+    Com taxa livre de risco zero e o índice padrão, lê as métricas
+    pré-calculadas de `fund_metrics`; caso contrário (ou se ainda não houver
+    cálculo), usa compute_metrics_from_history.
 
     Args:
         db (Session): Sessão do banco de dados.
         cnpj (str): CNPJ do fundo.
         risk_free (float): Taxa livre de risco.
+        benchmark (str | None): Índice das métricas relativas (None = índice padrão).
 
     Returns:
-        dict | None: Dicionário com métricas ou None se fundo não encontrado.
+        dict | None: Métricas com "computed_at" ou None se fundo não encontrado.
+    """
+    if risk_free == 0.0 and (benchmark is None or benchmark.upper() == DEFAULT_BENCHMARK.upper()):
+        row = db.execute(
+            select(models.FundMetrics)
+            .join(models.Fund, models.Fund.id == models.FundMetrics.fund_id)
+            .where(models.Fund.cnpj == str(cnpj))
+        ).scalar_one_or_none()
+        if row is not None:
+            return {c.name: getattr(row, c.name) for c in models.FundMetrics.__table__.c if c.name != "fund_id"}
+    return compute_metrics_from_history(db, cnpj, risk_free, benchmark or DEFAULT_BENCHMARK)
+
+def get_fund_metrics_batch(db: Session, cnpjs, risk_free: float = 0.0):
+    """
+    Retorna as métricas de vários fundos de uma vez, sem escrever no banco.
+
+    Com taxa livre de risco zero, lê `fund_metrics` em uma consulta. Os
+    demais fundos (outra taxa ou ainda sem métricas pré-calculadas) têm as
+    cotas carregadas em uma matriz e calculadas com batch_metrics.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        cnpjs (list): CNPJs dos fundos.
+        risk_free (float): Taxa livre de risco.
+
+    Returns:
+        dict: CNPJ → métricas com "computed_at"; CNPJs não encontrados ficam de fora.
+    """
+    cnpjs = list(dict.fromkeys(str(c) for c in cnpjs))
+    if not cnpjs:
+        return {}
+    ids = dict(db.execute(select(models.Fund.id, models.Fund.cnpj).where(models.Fund.cnpj.in_(cnpjs))).all())
+
+    result = {}
+    if risk_free == 0.0:
+        fields = [c.name for c in models.FundMetrics.__table__.c if c.name != "fund_id"]
+        for row in db.scalars(select(models.FundMetrics).where(models.FundMetrics.fund_id.in_(list(ids)))):
+            result[ids[row.fund_id]] = {f: getattr(row, f) for f in fields}
+
+    missing = [fund_id for fund_id, cnpj in ids.items() if cnpj not in result]
+    if missing:
+        now = datetime.utcnow()
+        nav_matrix = load_nav_matrix(db, missing)
+        fund_ids, _, matrix = nav_matrix
+        computed = batch_metrics(matrix, risk_free)
+        relative = compute_relative_metrics(db, fund_ids, risk_free=risk_free, nav_matrix=nav_matrix)
+        for i, fund_id in enumerate(fund_ids):
+            metrics = {name: values[i].item() for name, values in computed.items()}
+            metrics.update(relative[int(fund_id)])
+            metrics["computed_at"] = now
+            result[ids[int(fund_id)]] = metrics
+    return result
+
+def _json_floats(values):
+    """Converte um vetor NumPy em lista JSON, trocando NaN por None."""
+    return [None if np.isnan(v) else float(v) for v in values]
+
+def get_rolling_metrics(db: Session, cnpj: str, windows, risk_free: float = 0.0):
+    """
+    Calcula retorno, volatilidade e Sharpe móveis de um fundo para várias janelas.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        cnpj (str): CNPJ do fundo.
+        windows (list): Tamanhos das janelas, em pregões.
+        risk_free (float): Taxa livre de risco.
+
+    Returns:
+        dict | None: "dates" e, por janela, as séries "return", "volatility" e
+            "sharpe" (None onde a janela não está completa), ou None se o
+            fundo não for encontrado.
     """
     fund = get_fund_by_cnpj(db, cnpj)
     if not fund:
         return None
 
-    history = list_history_for_fund(db, fund.id, limit=1000)
-    prices = [h.nav for h in history]
-    if len(prices) < 2:
-        # sem histórico suficiente, retorna zeros
-        return {"rentability": 0.0, "volatility": 0.0, "sharpe": 0.0, "n": len(prices)}
-
-    returns = calculate_returns(prices)
-    vol = calculate_volatility(returns)
-    sharpe = calculate_sharpe(returns, risk_free)
-    rent = total_return(prices)
-
-    # opcional: atualizar os campos do Fund
-    fund.rentability = rent
-    fund.volatility = vol
-    fund.sharpe = sharpe
-    fund.updated_at = datetime.utcnow()
-    db.add(fund)
+    _, dates, matrix = load_nav_matrix(db, [fund.id])
+    rolling = rolling_metrics(matrix[0], windows, risk_free)
+    return {
+        "dates": [datetime.fromordinal(int(d)).date().isoformat() for d in dates],
+        "windows": {
+            str(window): {name: _json_floats(series) for name, series in values.items()}
+            for window, values in rolling.items()
+        },
+    }
+
+def _json_matrix(matrix):
+    """Converte uma matriz NumPy em listas JSON, trocando NaN por None."""
+    values = matrix.astype(object)
+    values[np.isnan(matrix)] = None
+    return values.tolist()
+
+def list_fund_ids(db: Session, cnpjs=None, class_name: str = None):
+    """
+    Busca os IDs dos fundos por lista de CNPJs ou por classe.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        cnpjs (list | None): CNPJs dos fundos.
+        class_name (str | None): Classe dos fundos (usada se `cnpjs` não for informado).
+
+    Returns:
+        List[int]: IDs encontrados.
+    """
+    stmt = select(models.Fund.id)
+    if cnpjs:
+        stmt = stmt.where(models.Fund.cnpj.in_([str(c) for c in cnpjs]))
+    else:
+        stmt = stmt.where(models.Fund.class_name == class_name)
+    return db.scalars(stmt.order_by(models.Fund.id)).all()
+
+def get_history_version(db: Session, fund_ids):
+    """
+    Identifica a versão do histórico de um conjunto de fundos.
+
+    Toda gravação em `fund_history` feita pelo crud ou pelos loaders também
+    atualiza `fund_stats`, então o maior updated_at dos acumuladores muda
+    sempre que o histórico de algum dos fundos muda.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (list): IDs dos fundos.
+
+    Returns:
+        str | None: Versão (None se nenhum fundo tiver acumuladores).
+    """
+    version = _history_updated_at(db, fund_ids)
+    return version.isoformat() if version else None
+
+def _history_updated_at(db: Session, fund_ids=None):
+    """Maior updated_at de `fund_stats` dos fundos (de todos, sem `fund_ids`)."""
+    s = models.FundStats
+    stmt = select(func.max(s.updated_at))
+    if fund_ids is not None:
+        stmt = stmt.where(s.fund_id.in_(list(fund_ids)))
+    return db.scalar(stmt)
+
+def get_correlation(db: Session, fund_ids, min_periods: int = 2, include_covariance: bool = False):
+    """
+    Calcula as matrizes de correlação (e covariância) dos retornos diários entre fundos.
+
+    O resultado fica em cache por conjunto de fundos e versão do histórico.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+        min_periods (int): Mínimo de dias em comum para o par ter valor.
+        include_covariance (bool): Inclui a matriz de covariância na resposta.
+
+    Returns:
+        dict: "cnpjs" (ordem das linhas/colunas), "correlation", "observations"
+            (dias em comum por par), "history_version" e, opcionalmente, "covariance".
+    """
+    ids = sorted(set(int(i) for i in fund_ids))
+    cnpjs = dict(db.execute(select(models.Fund.id, models.Fund.cnpj).where(models.Fund.id.in_(ids))).all())
+    ids = [i for i in ids if i in cnpjs]
+    if not ids:
+        return {"cnpjs": [], "correlation": [], "observations": [], "history_version": None}
+
+    version = get_history_version(db, ids)
+    key = (tuple(ids), version, min_periods)
+    cached = correlation_cache.get(key)
+    if cached is None:
+        matrix_ids, _, matrix = load_nav_matrix(db, ids)
+        cov, corr, counts = pairwise_covariance(matrix, min_periods)
+        cached = (matrix_ids, cov, corr, counts)
+        correlation_cache.set(key, cached)
+
+    matrix_ids, cov, corr, counts = cached
+    result = {
+        "cnpjs": [cnpjs[int(i)] for i in matrix_ids],
+        "correlation": _json_matrix(corr),
+        "observations": counts.tolist(),
+        "history_version": version,
+    }
+    if include_covariance:
+        result["covariance"] = _json_matrix(cov)
+    return result
+
+def _portfolio_moments(db: Session, ids, version):
+    """Retornos esperados e covariância dos fundos com histórico suficiente, em cache por versão."""
+    key = (tuple(ids), version)
+    cached = moments_cache.get(key)
+    if cached is None:
+        matrix_ids, _, matrix = load_nav_matrix(db, ids)
+        usable, mu, cov = estimate_moments(matrix)
+        cached = (matrix_ids[usable], mu, cov)
+        moments_cache.set(key, cached)
+    return cached
+
+def _optimize_weights(used_ids, mu, cov, risk_profile: str, method: str):
+    """Otimiza os pesos partindo da última solução para o mesmo perfil, método e fundos."""
+    start_key = (risk_profile, method, tuple(used_ids.tolist()))
+    solution = optimize_allocation(mu, cov, risk_profile, method, start=allocation_warm_start.get(start_key))
+    allocation_warm_start.set(start_key, solution["weights"])
+    return solution
+
+def get_portfolio_allocation(db: Session, fund_ids, risk_profile: str, amount: float,
+                             method: str = "mean_variance"):
+    """
+    Distribui um valor entre fundos candidatos conforme o perfil de risco.
+
+    Retornos esperados e covariância ficam em cache por conjunto de fundos e
+    versão do histórico; os pesos da última otimização de cada perfil,
+    método e conjunto de fundos são usados como ponto de partida da próxima.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos candidatos.
+        risk_profile (str): "conservador", "moderado" ou "arrojado".
+        amount (float): Valor a distribuir.
+        method (str): "mean_variance" ou "risk_parity".
+
+    Returns:
+        dict: "allocations" (cnpj, name, weight, amount), "expected_return",
+            "expected_volatility" (anualizados), "excluded" (CNPJs sem histórico
+            suficiente), "iterations" e "history_version".
+    """
+    ids = sorted(set(int(i) for i in fund_ids))
+    funds = {
+        fund_id: (cnpj, name)
+        for fund_id, cnpj, name in db.execute(
+            select(models.Fund.id, models.Fund.cnpj, models.Fund.name).where(models.Fund.id.in_(ids))
+        )
+    }
+    ids = [i for i in ids if i in funds]
+    version = get_history_version(db, ids)
+    used_ids, mu, cov = _portfolio_moments(db, ids, version)
+
+    excluded = [funds[i][0] for i in ids if i not in set(used_ids.tolist())]
+    result = {
+        "allocations": [],
+        "expected_return": None,
+        "expected_volatility": None,
+        "excluded": excluded,
+        "iterations": 0,
+        "history_version": version,
+    }
+    if len(used_ids) == 0:
+        return result
+
+    solution = _optimize_weights(used_ids, mu, cov, risk_profile, method)
+    weights = solution["weights"]
+
+    for fund_id, weight in sorted(zip(used_ids.tolist(), weights.tolist()), key=lambda item: -item[1]):
+        if weight < 1e-6:
+            continue
+        cnpj, name = funds[fund_id]
+        result["allocations"].append({
+            "cnpj": cnpj,
+            "name": name,
+            "weight": round(weight, 6),
+            "amount": round(amount * weight, 2),
+        })
+    result["expected_return"] = solution["expected_return"]
+    result["expected_volatility"] = solution["expected_volatility"]
+    result["iterations"] = solution["iterations"]
+    return result
+
+def get_portfolio_simulation(db: Session, fund_ids, amount: float, horizon: int = 252, paths: int = 10_000,
+                             seed: int = 0, method: str = "bootstrap", weighting: str = "equal",
+                             risk_profile: str = None):
+    """
+    Projeta por Monte Carlo o valor de uma carteira com os fundos informados.
+
+    Os retornos diários históricos da carteira (pesos fixos) são amostrados
+    em `paths` trajetórias de `horizon` dias. O resultado fica em cache por
+    fundos, versão do histórico e parâmetros, então a mesma consulta com a
+    mesma semente não é recalculada.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos da carteira.
+        amount (float): Valor inicial.
+        horizon (int): Dias úteis projetados.
+        paths (int): Quantidade de trajetórias.
+        seed (int): Semente do gerador.
+        method (str): "bootstrap" ou "normal".
+        weighting (str): "equal" (pesos iguais), "mean_variance" ou "risk_parity".
+        risk_profile (str | None): Perfil usado pelos pesos otimizados.
+
+    Returns:
+        dict: "days", "bands" e "final" (ver portfolio.simulate_portfolio),
+            "weights" (CNPJ → peso), "observations" (dias históricos
+            amostrados) e "history_version".
+    """
+    ids = sorted(set(int(i) for i in fund_ids))
+    cnpjs = dict(db.execute(select(models.Fund.id, models.Fund.cnpj).where(models.Fund.id.in_(ids))).all())
+    ids = [i for i in ids if i in cnpjs]
+    version = get_history_version(db, ids)
+
+    key = (tuple(ids), version, amount, horizon, paths, seed, method, weighting,
+           risk_profile if weighting != "equal" else None)
+    cached = simulation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = {"days": [], "bands": {}, "final": None, "weights": {}, "observations": 0, "history_version": version}
+    if ids:
+        matrix_ids, _, matrix = load_nav_matrix(db, ids)
+        if weighting == "equal":
+            weights = np.full(len(matrix_ids), 1.0 / len(matrix_ids))
+        else:
+            used_ids, mu, cov = _portfolio_moments(db, ids, version)
+            weights = np.zeros(len(matrix_ids))
+            if len(used_ids):
+                solution = _optimize_weights(used_ids, mu, cov, risk_profile, weighting)
+                weights[np.searchsorted(matrix_ids, used_ids)] = solution["weights"]
+
+        daily_returns = portfolio_returns(matrix, weights)
+        if len(daily_returns) >= 2:
+            result.update(simulate_portfolio(daily_returns, amount, horizon, paths, seed, method))
+            result["weights"] = {
+                cnpjs[int(i)]: round(float(w), 6) for i, w in zip(matrix_ids, weights) if w >= 1e-6
+            }
+            result["observations"] = len(daily_returns)
+
+    simulation_cache.set(key, result)
+    return result
+
+def get_portfolio_backtest(db: Session, weights: dict, frequency: str = "monthly", start: datetime = None,
+                           end: datetime = None, initial: float = 1.0, risk_free: float = 0.0):
+    """
+    Executa o backtest de uma carteira com pesos fixos sobre o histórico de cotas.
+
+    As cotas de todos os fundos são carregadas de uma vez na matriz alinhada
+    por data; a simulação e as métricas são vetorizadas sobre ela.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        weights (dict): ID do fundo → peso-alvo (normalizado aqui).
+        frequency (str): Frequência de rebalanceamento (ver portfolio.REBALANCE_FREQUENCIES).
+        start (datetime | None): Início do backtest.
+        end (datetime | None): Fim do backtest.
+        initial (float): Valor inicial da carteira.
+        risk_free (float): Taxa livre de risco por período, usada nas métricas.
+
+    Returns:
+        dict: "dates", "equity" (valor da carteira por data), "rebalances"
+            (datas dos rebalanceamentos), "turnover", "weights" (CNPJ → peso)
+            e "metrics" (as mesmas de /funds/{cnpj}/metrics, para a carteira).
+    """
+    cnpjs = dict(db.execute(select(models.Fund.id, models.Fund.cnpj).where(models.Fund.id.in_(list(weights)))).all())
+    weights = {int(i): float(w) for i, w in weights.items() if i in cnpjs and w > 0}
+    total = sum(weights.values())
+    result = {"dates": [], "equity": [], "rebalances": [], "turnover": 0.0, "weights": {}, "metrics": None}
+    if total <= 0:
+        return result
+
+    ids, dates, matrix = load_nav_matrix(db, weights, start, end)
+    target = np.array([weights[int(i)] / total for i in ids])
+    equity, points, turnover = backtest(matrix, target, dates, frequency, initial)
+    keep = ~np.isnan(equity)
+    if not keep.any():
+        return result
+
+    metrics = batch_metrics(equity[keep][None, :], risk_free)
+    iso_dates = [datetime.fromordinal(int(d)).date().isoformat() for d in dates]
+    result.update({
+        "dates": [d for d, k in zip(iso_dates, keep) if k],
+        "equity": equity[keep].tolist(),
+        "rebalances": [iso_dates[p] for p in points],
+        "turnover": turnover,
+        "weights": {cnpjs[int(i)]: round(float(w), 6) for i, w in zip(ids, target)},
+        "metrics": {name: values[0].item() for name, values in metrics.items()},
+    })
+    return result
+
+def get_fund_stats(db: Session, fund_id: int):
+    """
+    Busca os acumuladores de métricas de um fundo.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_id (int): ID do fundo.
+
+    Returns:
+        models.FundStats | None: Acumuladores ou None se ainda não calculados.
+    """
+    return db.get(models.FundStats, fund_id)
+
+def get_stats_last_dates(db: Session):
+    """
+    Retorna a data da última cota contabilizada nos acumuladores de cada fundo.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        dict: ID do fundo → data da última cota.
+    """
+    s = models.FundStats
+    return dict(db.execute(select(s.fund_id, s.last_date)).all())
+
+def _save_fund_stats(db: Session, calcs: dict):
+    """
+    Grava acumuladores de métricas (INSERT ... ON CONFLICT), sem commit.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        calcs (dict): ID do fundo → (OnlineMetrics, data da última cota).
+    """
+    if not calcs:
+        return
+    now = datetime.utcnow()
+    insert_fn = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert_fn(models.FundStats)
+    fields = [*OnlineMetrics.STATE_FIELDS, "last_date", "updated_at"]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.FundStats.fund_id],
+        set_={f: stmt.excluded[f] for f in fields},
+    )
+    for batch in _batched(calcs.items(), FUND_STATS_BATCH_SIZE):
+        db.execute(stmt, [
+            {"fund_id": int(fund_id), **calc.state(), "last_date": last_date, "updated_at": now}
+            for fund_id, (calc, last_date) in batch
+        ])
+
+def _save_fund_series(db: Session, series: dict):
+    """
+    Grava séries colunares completas (INSERT ... ON CONFLICT), sem commit.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        series (dict): ID do fundo → (dias desde 1970-01-01, cotas).
+    """
+    if not series:
+        return
+    now = datetime.utcnow()
+    insert_fn = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert_fn(models.FundSeries)
+    fields = ["count", "first_date", "last_date", "days", "navs", "updated_at"]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.FundSeries.fund_id],
+        set_={f: stmt.excluded[f] for f in fields},
+    )
+    for batch in _batched(series.items(), FUND_STATS_BATCH_SIZE):
+        values = []
+        for fund_id, (days, navs) in batch:
+            packed_days, packed_navs = pack_series(days, navs)
+            values.append({
+                "fund_id": int(fund_id),
+                "count": len(days),
+                "first_date": datetime.fromordinal(int(days[0]) + SERIES_EPOCH) if len(days) else None,
+                "last_date": datetime.fromordinal(int(days[-1]) + SERIES_EPOCH) if len(days) else None,
+                "days": packed_days,
+                "navs": packed_navs,
+                "updated_at": now,
+            })
+        db.execute(stmt, values)
+
+def _append_fund_series(db: Session, appended: dict):
+    """
+    Anexa cotas novas ao fim das séries colunares, sem commit.
+
+    No PostgreSQL a concatenação é feita no banco (bytea ||), sem trazer a
+    série; nos demais bancos a série é lida e regravada.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        appended (dict): ID do fundo → [(date, nav)] em ordem de data.
+
+    Returns:
+        set: Fundos que não puderam ser anexados (sem série ou com cota no
+            mesmo dia ou antes da última) e precisam de reconstrução.
+    """
+    if not appended:
+        return set()
+    is_pg = db.get_bind().dialect.name == "postgresql"
+    t = models.FundSeries.__table__
+    columns = [t.c.fund_id, t.c.last_date] if is_pg else [t.c.fund_id, t.c.last_date, t.c.days, t.c.navs]
+    existing = {}
+    for batch in _batched(appended, FUND_STATS_BATCH_SIZE):
+        for row in db.execute(select(*columns).where(t.c.fund_id.in_(batch))):
+            existing[row.fund_id] = row
+
+    rebuild = set()
+    values = []
+    now = datetime.utcnow()
+    for fund_id, entries in appended.items():
+        current = existing.get(fund_id)
+        ordinals = np.fromiter((day.toordinal() for day, _ in entries), dtype=np.int64, count=len(entries))
+        days, navs = daily_series(ordinals, [nav for _, nav in entries])
+        if current is None or current.last_date is None or days[0] <= current.last_date.toordinal():
+            rebuild.add(fund_id)
+            continue
+        packed_days, packed_navs = pack_series(series_days(days), navs)
+        if not is_pg:
+            packed_days, packed_navs = bytes(current.days) + packed_days, bytes(current.navs) + packed_navs
+        values.append({
+            "b_fund_id": fund_id, "b_count": len(days), "b_last_date": datetime.fromordinal(int(days[-1])),
+            "b_days": packed_days, "b_navs": packed_navs, "b_updated_at": now,
+        })
+
+    if values:
+        new_days = bindparam("b_days", type_=LargeBinary)
+        new_navs = bindparam("b_navs", type_=LargeBinary)
+        stmt = update(t).where(t.c.fund_id == bindparam("b_fund_id")).values(
+            days=t.c.days.op("||")(new_days) if is_pg else new_days,
+            navs=t.c.navs.op("||")(new_navs) if is_pg else new_navs,
+            count=t.c.count + bindparam("b_count"),
+            last_date=bindparam("b_last_date"),
+            updated_at=bindparam("b_updated_at"),
+        )
+        for batch in _batched(values, FUND_STATS_BATCH_SIZE):
+            db.execute(stmt, batch)
+    return rebuild
+
+def rebuild_fund_stats(db: Session, fund_ids, batch_size: int = METRICS_BATCH_SIZE, commit: bool = False):
+    """
+    Recalcula do zero os acumuladores de métricas e a série colunar a partir do histórico.
+
+    Usado quando cotas entram fora de ordem ou substituem cotas existentes.
+    Por padrão não faz commit; com `commit`, faz um commit por lote
+    (transações curtas, para rodar depois da carga que as originou).
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (iterable): IDs dos fundos.
+        batch_size (int): Fundos lidos do histórico por consulta.
+        commit (bool): Fazer commit a cada lote (default: False).
+
+    Returns:
+        int: Quantidade de fundos recalculados.
+    """
+    rebuilt = 0
+    empty = (series_days([]), np.empty(0))
+    for batch in _batched(fund_ids, batch_size):
+        history = load_history_series(db, batch)
+        series = {int(fund_id): history.get(int(fund_id), empty) for fund_id in batch}
+        calcs = {}
+        for fund_id, (days, navs) in series.items():
+            last_date = datetime.fromordinal(int(days[-1]) + SERIES_EPOCH) if len(days) else None
+            calcs[fund_id] = (OnlineMetrics.from_array(navs), last_date)
+        _save_fund_stats(db, calcs)
+        _save_fund_series(db, series)
+        if commit:
+            db.commit()
+        rebuilt += len(calcs)
+    return rebuilt
+
+def update_fund_stats(db: Session, rows, rebuild=(), defer_rebuild: bool = False):
+    """
+    Atualiza os acumuladores de métricas e a série colunar com cotas recém-gravadas, sem commit.
+
+    Cotas posteriores à última contabilizada são somadas em O(1) cada e
+    anexadas à série; se algum fundo recebeu cota com data anterior ou
+    igual (ou ainda não tem acumuladores ou série), ele é recalculado a
+    partir do histórico.
+
+    Com `defer_rebuild`, esses fundos não são recalculados aqui: os
+    acumuladores e a série deles são removidos (as leituras passam a usar
+    `fund_history`) e quem chama os recalcula depois do commit, com
+    rebuild_fund_stats. Se isso não acontecer, o ensure_fund_stats da
+    próxima ingestão os recalcula.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        rows (iterable): Tuplas (fund_id, date, nav) já gravadas em `fund_history`.
+        rebuild (iterable): IDs de fundos a recalcular de qualquer forma.
+        defer_rebuild (bool): Adiar o recálculo dos fundos (default: False).
+
+    Returns:
+        list: IDs dos fundos recalculados (ou a recalcular, com `defer_rebuild`).
+    """
+    per_fund = {}
+    for fund_id, date, nav in rows:
+        per_fund.setdefault(fund_id, []).append((date, nav))
+    rebuild = set(rebuild)
+    for fund_id in rebuild:
+        per_fund.pop(fund_id, None)
+
+    s = models.FundStats
+    existing = {}
+    for batch in _batched(per_fund, FUND_STATS_BATCH_SIZE):
+        for row in db.execute(select(*s.__table__.c).where(s.fund_id.in_(batch))):
+            existing[row.fund_id] = row
+
+    calcs = {}
+    for fund_id, entries in per_fund.items():
+        state = existing.get(fund_id)
+        entries.sort(key=lambda entry: entry[0])
+        if state is None or state.last_date is None or entries[0][0] <= state.last_date:
+            rebuild.add(fund_id)
+            continue
+        calc = OnlineMetrics.from_state(state).consume(nav for _, nav in entries)
+        calcs[fund_id] = (calc, entries[-1][0])
+
+    _save_fund_stats(db, calcs)
+    rebuild |= _append_fund_series(db, {fund_id: per_fund[fund_id] for fund_id in calcs})
+    rebuild = sorted(rebuild)
+    if defer_rebuild:
+        _delete_fund_stats(db, rebuild)
+    else:
+        rebuild_fund_stats(db, rebuild)
+    return rebuild
+
+def _delete_fund_stats(db: Session, fund_ids):
+    """Remove os acumuladores e a série colunar de fundos a recalcular, sem commit."""
+    for batch in _batched(fund_ids, FUND_UPSERT_BATCH_SIZE):
+        db.execute(delete(models.FundStats).where(models.FundStats.fund_id.in_(batch)))
+        db.execute(delete(models.FundSeries).where(models.FundSeries.fund_id.in_(batch)))
+
+def ensure_fund_stats(db: Session):
+    """
+    Calcula os acumuladores e a série colunar dos fundos que ainda não os têm e faz commit.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        int: Quantidade de fundos calculados.
+    """
+    missing = db.scalars(
+        select(models.Fund.id)
+        .outerjoin(models.FundStats, models.FundStats.fund_id == models.Fund.id)
+        .outerjoin(models.FundSeries, models.FundSeries.fund_id == models.Fund.id)
+        .where(or_(models.FundStats.fund_id.is_(None), models.FundSeries.fund_id.is_(None)))
+        .order_by(models.Fund.id)
+    ).all()
+    rebuilt = rebuild_fund_stats(db, missing)
     db.commit()
-    db.refresh(fund)
+    return rebuilt
+
+def compute_metrics_from_history(db: Session, cnpj: str, risk_free: float = 0.0, benchmark: str = DEFAULT_BENCHMARK):
+    """
+    Calcula métricas financeiras com base no histórico de cotas de um fundo, sem escrever no banco.
+
+    Usa os acumuladores de `fund_stats` quando disponíveis. Com outra taxa
+    livre de risco, a série colunar do fundo (load_nav_matrix, já compacta)
+    é processada com NumPy; sem acumuladores (e portanto sem série), o
+    histórico é lido em streaming de `fund_history` e processado em uma
+    única passada (ver metrics.stream_metrics). Além de rentabilidade, volatilidade
+    e Sharpe, inclui Sortino, Calmar, retorno e volatilidade anualizados,
+    drawdown máximo (e sua duração), hit ratio e as métricas relativas ao
+    índice (alfa, beta, tracking error e information ratio).
 
-    return {"rentability": rent, "volatility": vol, "sharpe": sharpe, "n": len(prices)}
+    Args:
+        db (Session): Sessão do banco de dados.
+        cnpj (str): CNPJ do fundo.
+        risk_free (float): Taxa livre de risco.
+        benchmark (str): Índice das métricas relativas.
+
+    Returns:
+        dict | None: Dicionário com métricas e "computed_at", ou None se fundo não encontrado.
+    """
+    fund = get_fund_by_cnpj(db, cnpj)
+    if not fund:
+        return None
+
+    stats = get_fund_stats(db, fund.id)
+    if stats is not None and risk_free == 0.0:
+        # uma consulta: os acumuladores já estão atualizados com a última cota
+        metrics = OnlineMetrics.from_state(stats).result()
+        metrics["computed_at"] = stats.updated_at
+    elif stats is not None:
+        # taxa livre de risco diferente da usada nos acumuladores (Sortino)
+        _, _, matrix = load_nav_matrix(db, [fund.id])
+        metrics = OnlineMetrics.from_array(matrix[0], risk_free).result()
+        metrics["computed_at"] = datetime.utcnow()
+    else:
+        # sem acumuladores: o histórico ainda não virou série, lê fund_history sem materializá-lo
+        metrics = stream_metrics(iter_history_navs(db, fund.id), risk_free)
+        metrics["computed_at"] = datetime.utcnow()
+    if not metrics["n"]:
+        # fundo sem cotas: nada a comparar com o índice
+        metrics.update({"benchmark": None, **{f: None for f in RELATIVE_FIELDS}})
+        return metrics
+    metrics.update(compute_relative_metrics(db, [fund.id], benchmark, risk_free)[fund.id])
+    return metrics
 
 def add_favorite(db, user_id: int, fund_id: int):
     """
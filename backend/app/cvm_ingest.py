@@ -1,17 +1,33 @@
 import requests
 from backend.app.db import SessionLocal
+from backend.app.progress import progress
 from sqlalchemy.orm import Session
-from backend.app.crud import upsert_fund, get_fund_by_cnpj, add_history_bulk
+from backend.app.crud import (
+    upsert_funds_bulk, get_fund_by_cnpj, add_history_bulk, add_history_rows,
+    get_fund_hashes, get_source_state, save_source_state,
+)
 import logging
+import codecs
 import csv
-import io
+import hashlib
+import os
+import zlib
 from datetime import datetime, timedelta
+from itertools import islice
 import random
 
 logging.basicConfig(level=logging.INFO)
 #from backend.app.cvm_ingest import run_cvm_ingestion
 CVM_CSV_URL = "https://dados.cvm.gov.br/dados/FI/CAD/DADOS/cad_fi.csv"
 
+# origem do cadastro: URL http(s) ou caminho de um arquivo local (testes / benchmarks)
+CVM_CSV_SOURCE = os.getenv("CVM_CSV_SOURCE", CVM_CSV_URL)
+
+# quantidade de fundos por execução; 0 = cadastro completo (modo streaming)
+CVM_INGEST_LIMIT = int(os.getenv("CVM_INGEST_LIMIT", "50"))
+
+CHUNK_SIZE = 64 * 1024
+
 # 🔥 LISTA DE CLASSES ALEATÓRIAS
 RANDOM_CLASSES = [
     "Renda Fixa",
@@ -24,79 +40,371 @@ RANDOM_CLASSES = [
 ]
 
 
-def fetch_cvm_data(limit=50):
-    try:
-        resp = requests.get(CVM_CSV_URL, timeout=30)
-        resp.raise_for_status()
+def is_remote(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def probe_source(source: str):
+    """
+    Obtém os validadores atuais de uma origem sem baixar o conteúdo.
+
+    Para URLs faz um HEAD e devolve ETag / Last-Modified; se o HEAD falhar,
+    devolve tudo None e a origem é baixada normalmente. Para arquivos locais,
+    o "last_modified" é o mtime (ns) e o tamanho do arquivo.
+
+    Args:
+        source (str): URL http(s) ou caminho de arquivo local.
+
+    Returns:
+        tuple: (etag, last_modified, tamanho em bytes), qualquer um podendo ser None.
+    """
+    if is_remote(source):
+        try:
+            resp = requests.head(source, timeout=30, allow_redirects=True)
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Não foi possível consultar os validadores de {source}: {e}. Baixando o arquivo.")
+            return None, None, None
+        length = resp.headers.get("Content-Length")
+        return resp.headers.get("ETag"), resp.headers.get("Last-Modified"), int(length) if length else None
+    st = os.stat(source)
+    return None, f"{st.st_mtime_ns}:{st.st_size}", st.st_size
+
+
+def source_state_key(source: str, limit: int = 0) -> str:
+    """
+    Chave do estado salvo de uma origem.
+
+    Com limite só um prefixo do arquivo é processado, então o estado vale
+    apenas para aquele limite: mudar CVM_INGEST_LIMIT força uma nova leitura.
+
+    Args:
+        source (str): URL ou caminho do arquivo.
+        limit (int): Quantidade máxima de linhas processadas (0 = arquivo inteiro).
+
+    Returns:
+        str: `source`, ou `source` com o limite como sufixo.
+    """
+    return f"{source}#limit={limit}" if limit and limit > 0 else source
+
+
+def source_unchanged(state, etag: str, last_modified: str) -> bool:
+    """
+    Indica se os validadores batem com os da última ingestão bem-sucedida.
+
+    Args:
+        state (models.SourceState | None): Estado salvo da origem.
+        etag (str): ETag atual.
+        last_modified (str): Last-Modified atual.
+
+    Returns:
+        bool: True se a origem não mudou desde a última ingestão.
+    """
+    if state is None:
+        return False
+    if etag:
+        return etag == state.etag
+    return bool(last_modified) and last_modified == state.last_modified
+
 
-        content = resp.content.decode("latin1")
-        reader = csv.DictReader(io.StringIO(content), delimiter=';')
-        data = list(reader)
-        return data[:limit]
+def file_sha256(path: str) -> str:
+    """Calcula o SHA-256 de um arquivo local lendo-o em blocos."""
+    digest = hashlib.sha256()
+    for chunk in iter_source_chunks(path):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_chunks(chunks, digest):
+    """
+    Repassa os blocos de bytes atualizando um hash pelo caminho.
+
+    Args:
+        chunks (iterable): Blocos de bytes.
+        digest: Objeto de hashlib a atualizar.
+
+    Yields:
+        bytes: Os mesmos blocos recebidos.
+    """
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def iter_source_chunks(source: str = CVM_CSV_SOURCE, chunk_size: int = CHUNK_SIZE):
+    """
+    Lê uma origem de dados em blocos de bytes, sem carregar o arquivo inteiro.
+
+    Args:
+        source (str): URL http(s) ou caminho de arquivo local.
+        chunk_size (int): Tamanho de cada bloco em bytes.
+
+    Yields:
+        bytes: Blocos do conteúdo bruto.
+    """
+    if is_remote(source):
+        with requests.get(source, stream=True, timeout=30) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    yield chunk
+    else:
+        with open(source, "rb") as fh:
+            while True:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+def iter_decoded_lines(chunks, encoding: str = "latin1"):
+    """
+    Decodifica blocos de bytes incrementalmente e os quebra em linhas.
+
+    As quebras de linha são preservadas para que o módulo csv trate
+    corretamente campos entre aspas que ocupam mais de uma linha.
+
+    Args:
+        chunks (iterable): Blocos de bytes.
+        encoding (str): Codificação do arquivo (a CVM publica em latin1).
+
+    Yields:
+        str: Linhas do arquivo, com o terminador.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        start = 0
+        end = pending.find("\n")
+        while end != -1:
+            yield pending[start:end + 1]
+            start = end + 1
+            end = pending.find("\n", start)
+        pending = pending[start:]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_cvm_rows(source: str = CVM_CSV_SOURCE, digest=None, on_chunk=None):
+    """
+    Percorre as linhas do cadastro da CVM como dicionários, em streaming.
+
+    Args:
+        source (str): URL ou caminho local do cad_fi.csv.
+        digest: Objeto de hashlib atualizado com o conteúdo bruto (opcional).
+        on_chunk (callable): Chamado com o tamanho de cada bloco lido (opcional).
+
+    Yields:
+        dict: Uma linha do CSV indexada pelo cabeçalho.
+    """
+    chunks = iter_source_chunks(source)
+    if digest is not None:
+        chunks = hash_chunks(chunks, digest)
+    if on_chunk is not None:
+        chunks = (on_chunk(len(chunk)) or chunk for chunk in chunks)
+    lines = iter_decoded_lines(chunks)
+    yield from csv.DictReader(lines, delimiter=';')
+
+
+def fetch_cvm_data(limit=50, source: str = CVM_CSV_SOURCE):
+    try:
+        # islice encerra o download assim que o limite é atingido
+        return list(islice(iter_cvm_rows(source), limit))
 
     except Exception as e:
         logging.error(f"Erro ao consultar API CVM: {e}")
         return []
 
 
-def generate_simulated_history(db: Session, cnpj: str):
-    fund = get_fund_by_cnpj(db, cnpj)
-    if not fund:
-        logging.warning(f"[history] Fundo não encontrado: {cnpj}")
-        return
+def simulate_nav_rows(days: int = 30):
+    """
+    Gera uma série de cotas simulada com variações diárias de até ±2%.
 
-    # evita criar histórico duplicado
-    if hasattr(fund, "history") and len(fund.history) > 0:
-        logging.info(f"[history] Fundo {cnpj} já possui histórico. Pulando.")
-        return
+    Args:
+        days (int): Quantidade de dias a simular (terminando hoje).
 
+    Returns:
+        list: Tuplas (date, nav).
+    """
     base = 100.0
     rows = []
-    start_date = datetime.utcnow() - timedelta(days=29)
+    start_date = datetime.utcnow() - timedelta(days=days - 1)
     nav = base
 
-    for i in range(30):
+    for i in range(days):
         change = random.uniform(-0.02, 0.02)
         nav = max(0.01, nav * (1 + change))
         date = start_date + timedelta(days=i)
         rows.append((date, nav))
+    return rows
+
+
+def generate_simulated_history(db: Session, cnpj: str):
+    fund = get_fund_by_cnpj(db, cnpj)
+    if not fund:
+        logging.warning(f"[history] Fundo não encontrado: {cnpj}")
+        return
+
+    # evita criar histórico duplicado
+    if hasattr(fund, "history") and len(fund.history) > 0:
+        logging.info(f"[history] Fundo {cnpj} já possui histórico. Pulando.")
+        return
 
+    rows = simulate_nav_rows()
     add_history_bulk(db, fund.id, rows)
     logging.info(f"[history] Gerado histórico simulado para {cnpj} ({len(rows)} dias)")
 
 
-def run_cvm_ingestion():
+def generate_simulated_history_bulk(db: Session, fund_ids):
+    """
+    Gera histórico simulado para fundos recém-criados em um único executemany.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        fund_ids (list): IDs de fundos que ainda não têm histórico.
+    """
+    for i in range(0, len(fund_ids), 1000):
+        rows = [
+            {"fund_id": fund_id, "date": date, "nav": nav}
+            for fund_id in fund_ids[i:i + 1000]
+            for date, nav in simulate_nav_rows()
+        ]
+        add_history_rows(db, rows)
+        progress.advance(len(fund_ids[i:i + 1000]))
+    logging.info(f"[history] Gerado histórico simulado para {len(fund_ids)} fundos")
+
+
+def fund_records(rows):
+    """
+    Converte linhas do cad_fi.csv nos campos gravados em `funds`.
+
+    Args:
+        rows (iterable): Linhas do CSV como dicionários.
+
+    Yields:
+        dict: Campos cnpj, name e class_name de cada fundo válido.
+    """
+    for f in rows:
+        cnpj = (f.get("CNPJ_FUNDO") or "").strip()
+        nome = (f.get("DENOM_SOCIAL") or "").strip()
+        if not cnpj or not nome:
+            continue
+
+        classe_cvm = f.get("CLASSE")
+
+        # 🔥 Se a CVM não tiver classe → escolher uma a partir do CNPJ,
+        # sempre a mesma para o mesmo fundo (senão toda execução o "alteraria")
+        if classe_cvm and classe_cvm.strip():
+            classe = classe_cvm
+        else:
+            classe = RANDOM_CLASSES[zlib.crc32(cnpj.encode()) % len(RANDOM_CLASSES)]
+
+        row_hash = hashlib.md5(f"{nome}\x1f{classe}".encode()).hexdigest()
+        yield {"cnpj": cnpj, "name": nome, "class_name": classe, "source_hash": row_hash}
+
+
+def changed_records(records, known_hashes: dict, stats: dict):
+    """
+    Descarta fundos cujo hash de cadastro é igual ao já gravado.
+
+    Args:
+        records (iterable): Saída de fund_records.
+        known_hashes (dict): CNPJ → source_hash atual no banco.
+        stats (dict): Contadores; "unchanged" é incrementado a cada descarte.
+
+    Yields:
+        dict: Apenas os fundos novos ou alterados.
+    """
+    for record in records:
+        if known_hashes.get(record["cnpj"]) == record["source_hash"]:
+            stats["unchanged"] += 1
+            continue
+        yield record
+
+
+def run_cvm_ingestion(limit: int = CVM_INGEST_LIMIT, source: str = CVM_CSV_SOURCE, staging=None,
+                      simulate_history: bool = True):
+    """
+    Ingere o cadastro de fundos da CVM.
+
+    Args:
+        limit (int): Quantidade máxima de linhas (0 = cadastro completo).
+        source (str): URL ou caminho local do cad_fi.csv.
+        staging (StagedLoad | None): Se informado, os fundos vão para o staging
+            e só chegam a `funds` no merge (o histórico simulado fica para depois dele).
+        simulate_history (bool): Gera histórico simulado para os fundos novos
+            (desligado quando há origem de cotas reais).
+
+    Returns:
+        bool: True se a ingestão terminou (ou foi pulada) sem erros.
+    """
     session: Session = SessionLocal()
     logging.info("Iniciando job de ingestão da CVM...")
 
-    funds = fetch_cvm_data(limit=50)
-    logging.info(f"{len(funds)} fundos encontrados na CVM")
+    try:
+        # 1. Se ETag / Last-Modified não mudaram, nem baixa o arquivo
+        etag, last_modified, size = probe_source(source)
+        state_key = source_state_key(source, limit)
+        state = get_source_state(session, state_key)
+        if source_unchanged(state, etag, last_modified):
+            logging.info("Cadastro da CVM inalterado desde a última ingestão. Pulando.")
+            return True
 
-    for f in funds:
-        try:
-            cnpj = f.get("CNPJ_FUNDO")
-            nome = f.get("DENOM_SOCIAL")
+        # 2. Sem validadores confiáveis, arquivos locais ainda podem ser comparados pelo hash
+        content_hash = None
+        if not is_remote(source):
+            content_hash = file_sha256(source)
+            if state and state.content_hash == content_hash:
+                save_source_state(session, state_key, etag, last_modified, content_hash)
+                logging.info("Conteúdo do cadastro idêntico ao da última ingestão. Pulando.")
+                return True
 
-            classe_cvm = f.get("CLASSE")
+        # limit <= 0 → percorre o cadastro completo sem materializar a lista
+        progress.begin_phase("cadastro", total=None if limit and limit > 0 else size, unit="bytes")
+        digest = hashlib.sha256()
+        rows = progress.track(iter_cvm_rows(source, digest, on_chunk=progress.advance))
+        if limit and limit > 0:
+            rows = islice(rows, limit)
+        # com limite o download para no meio: o hash parcial não identifica o arquivo
+        partial = bool(limit and limit > 0) and content_hash is None
 
-            # 🔥 Se a CVM não tiver classe → gerar uma aleatória
-            if classe_cvm and classe_cvm.strip():
-                classe = classe_cvm
-            else:
-                classe = random.choice(RANDOM_CLASSES)
+        # 3. Só os fundos cujo hash de linha mudou chegam ao banco
+        skipped = {"unchanged": 0}
+        records = changed_records(fund_records(rows), get_fund_hashes(session), skipped)
+        if staging is not None:
+            stats = staging.stage_funds(session, records)
+            logging.info(
+                f"Fundos da CVM: {stats['staged']} novos ou alterados no staging, "
+                f"{skipped['unchanged']} inalterados"
+            )
+            content_hash = None if partial else content_hash or digest.hexdigest()
+            staging.defer_source_state(state_key, etag, last_modified, content_hash)
+            return True
 
-            rentabilidade = 0.0
-            risco = 0.0
-            sharpe = 0.0
+        stats = upsert_funds_bulk(session, records)
+        stats["unchanged"] += skipped["unchanged"]
+        logging.info(
+            f"Fundos da CVM: {stats['inserted']} inseridos, {stats['updated']} atualizados, "
+            f"{stats['unchanged']} inalterados"
+        )
 
-            if cnpj and nome:
-                upsert_fund(session, cnpj, nome, classe, rentabilidade, risco, sharpe)
+        # gerar histórico automático apenas para os fundos novos
+        if simulate_history and stats["inserted_ids"]:
+            progress.begin_phase("historico_simulado", total=len(stats["inserted_ids"]), unit="fundos")
+            generate_simulated_history_bulk(session, stats["inserted_ids"])
 
-                # gerar histórico automático
-                generate_simulated_history(session, cnpj)
+        # com limite o prefixo foi processado por inteiro: vale para a próxima execução com o mesmo limite
+        content_hash = None if partial else content_hash or digest.hexdigest()
+        save_source_state(session, state_key, etag, last_modified, content_hash)
 
-        except Exception as e:
-            logging.warning(f"Erro ao inserir fundo {f.get('DENOM_SOCIAL')}: {e}")
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Erro na ingestão da CVM: {e}")
+        return False
+    finally:
+        session.close()
 
-    session.close()
     logging.info("Job de ingestão finalizado com sucesso!")
+    return True
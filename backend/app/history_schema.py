@@ -0,0 +1,291 @@
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from backend.app import models
+
+# "monthly": no PostgreSQL, `fund_history` é criada particionada por mês (RANGE em date);
+# só vale na criação da tabela, uma tabela existente não é convertida
+FUND_HISTORY_PARTITIONING = os.getenv("FUND_HISTORY_PARTITIONING", "none").lower()
+
+# chave de `fund_history`: uma cota por fundo e dia
+HISTORY_KEY_INDEX = "ux_fund_history_fund_date"
+
+# índice parcial das cotas simuladas (ver crud.purge_simulated_history)
+SIMULATED_HISTORY_INDEX = "ix_fund_history_simulated"
+
+# índices da versão anterior, cobertos pela chave composta
+LEGACY_HISTORY_INDEXES = ("ix_fund_history_fund_id", "ix_fund_history_date", "ix_fund_history_id")
+
+# a chave primária precisa conter a coluna de particionamento; com INCLUDE (nav),
+# a série de um fundo é lida só do índice de cada partição
+PARTITIONED_HISTORY_DDL = """
+    CREATE TABLE fund_history (
+        id BIGSERIAL,
+        fund_id INTEGER NOT NULL REFERENCES funds (id) ON DELETE CASCADE,
+        date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        nav DOUBLE PRECISION NOT NULL,
+        CONSTRAINT fund_history_pkey PRIMARY KEY (fund_id, date) INCLUDE (nav)
+    ) PARTITION BY RANGE (date)
+"""
+
+
+def _month_start(day: datetime) -> datetime:
+    return datetime(day.year, day.month, 1)
+
+
+def _next_month(day: datetime) -> datetime:
+    return datetime(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """
+    Nome da partição mensal de `fund_history` (ex: fund_history_p202401).
+
+    Args:
+        month (datetime): Qualquer data do mês.
+
+    Returns:
+        str: Nome da partição.
+    """
+    return f"fund_history_p{month.year:04d}{month.month:02d}"
+
+
+def is_partitioned(db: Session) -> bool:
+    """
+    Informa se `fund_history` é uma tabela particionada.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        bool: True só no PostgreSQL com a tabela criada particionada.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('fund_history'))"
+    ))
+
+
+def ensure_history_partitions(db: Session, start: datetime, end: datetime):
+    """
+    Cria as partições mensais que faltam para cobrir [start, end], sem commit.
+
+    Não faz nada se a tabela não for particionada. Criar uma partição
+    bloqueia `fund_history` até o commit de quem chama; por isso o startup
+    e a ingestão criam antes as partições do mês corrente e do próximo, e
+    aqui só caem meses novos de cargas históricas.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        start (datetime | None): Primeira data a cobrir.
+        end (datetime | None): Última data a cobrir.
+
+    Returns:
+        list: Nomes das partições criadas.
+    """
+    if start is None or end is None or not is_partitioned(db):
+        return []
+
+    existing = set(db.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('fund_history')"
+    )))
+    created = []
+    month = _month_start(start)
+    while month <= end:
+        name = partition_name(month)
+        if name not in existing:
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF fund_history "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+            ))
+            created.append(name)
+        month = _next_month(month)
+    if created:
+        logging.info(f"[history] Partições criadas: {', '.join(created)}")
+    return created
+
+
+def ensure_upcoming_partitions(db: Session, now: datetime = None):
+    """
+    Cria (e faz commit) as partições do mês corrente e do próximo.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        now (datetime | None): Data de referência (default: agora).
+
+    Returns:
+        list: Nomes das partições criadas.
+    """
+    month = _month_start(now or datetime.utcnow())
+    created = ensure_history_partitions(db, month, _next_month(month))
+    db.commit()
+    return created
+
+
+def dedupe_history(db: Session) -> int:
+    """
+    Remove cotas repetidas de `fund_history`, mantendo a última inserida de cada fundo e dia.
+
+    Necessário antes de criar a chave única em bancos da versão anterior,
+    em que a mesma cota podia ser gravada mais de uma vez. Não faz commit.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        int: Quantidade de cotas removidas.
+    """
+    return db.execute(text("""
+        DELETE FROM fund_history WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY fund_id, date ORDER BY id DESC) AS rn
+                FROM fund_history
+            ) d WHERE rn > 1
+        )
+    """)).rowcount
+
+
+def index_state(bind, name: str):
+    """
+    Informa se um índice de `fund_history` existe e está válido.
+
+    No PostgreSQL, um CREATE INDEX CONCURRENTLY interrompido (ex: cota
+    repetida gravada durante o build) deixa o índice INVALID: ele existe,
+    mas não é usado nem garante unicidade, e o IF NOT EXISTS o considera
+    criado. Por isso a validade vem de pg_index.indisvalid, não só do nome.
+
+    Args:
+        bind (Engine): Engine do banco de dados.
+        name (str): Nome do índice.
+
+    Returns:
+        bool | None: True se válido, False se INVALID, None se não existir.
+    """
+    if bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            return conn.execute(
+                text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+                {"name": name},
+            ).scalar()
+    indexes = inspect(bind).get_indexes(models.FundHistory.__tablename__)
+    return True if any(index["name"] == name for index in indexes) else None
+
+
+def _create_index_concurrently(bind, name: str, ddl: str):
+    """
+    Cria um índice com CONCURRENTLY, descartando antes uma versão INVALID.
+
+    Se o build falhar, o índice INVALID que ele deixa é removido antes de
+    repassar o erro, e o próximo startup tenta de novo.
+    """
+    # CONCURRENTLY não roda em transação; leitores e escritores seguem durante o build
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        try:
+            conn.execute(text(ddl))
+        except Exception:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            raise
+
+
+def _create_history_key(bind):
+    if bind.dialect.name == "postgresql":
+        _create_index_concurrently(bind, HISTORY_KEY_INDEX, (
+            f"CREATE UNIQUE INDEX CONCURRENTLY {HISTORY_KEY_INDEX} "
+            "ON fund_history (fund_id, date) INCLUDE (nav)"
+        ))
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name in LEGACY_HISTORY_INDEXES:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        return
+
+    index = next(i for i in models.FundHistory.__table__.indexes if i.name == HISTORY_KEY_INDEX)
+    index.create(bind, checkfirst=True)
+    with bind.begin() as conn:
+        for name in LEGACY_HISTORY_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _create_simulated_index(bind):
+    """Cria o índice parcial das cotas simuladas em tabelas que ainda não o têm (ou o têm INVALID)."""
+    if not inspect(bind).has_table(models.FundHistory.__tablename__):
+        return
+    if index_state(bind, SIMULATED_HISTORY_INDEX):
+        return
+    index = next(i for i in models.FundHistory.__table__.indexes if i.name == SIMULATED_HISTORY_INDEX)
+    with Session(bind) as db:
+        partitioned = is_partitioned(db)
+    if bind.dialect.name == "postgresql" and not partitioned:
+        # CONCURRENTLY não vale para tabela particionada (lá o índice é criado em cada partição)
+        _create_index_concurrently(bind, SIMULATED_HISTORY_INDEX, (
+            f"CREATE INDEX CONCURRENTLY {SIMULATED_HISTORY_INDEX} "
+            f"ON fund_history (fund_id) WHERE {models.SIMULATED_NAV_WHERE['postgresql']}"
+        ))
+    else:
+        index.create(bind, checkfirst=True)
+    logging.info(f"[history] Índice {SIMULATED_HISTORY_INDEX} criado")
+
+
+def prepare_history_table(bind):
+    """
+    Prepara `fund_history` antes do create_all do startup.
+
+    Ajusta a chave (ver _prepare_history_key) e cria o índice parcial das
+    cotas simuladas em tabelas existentes (o create_all só cria índices
+    junto com a tabela).
+
+    Apaga cotas e cria índices: deve rodar em um único processo por vez
+    (o startup a chama sob job_lock("history_schema")).
+
+    Args:
+        bind (Engine): Engine do banco de dados.
+    """
+    _prepare_history_key(bind)
+    _create_simulated_index(bind)
+
+
+def _prepare_history_key(bind):
+    """
+    Cria ou migra `fund_history` para a chave (fund_id, date).
+
+    - Tabela nova com FUND_HISTORY_PARTITIONING=monthly (PostgreSQL): cria
+      a tabela particionada e as partições do mês corrente e do próximo.
+    - Tabela particionada existente: garante as partições do mês corrente e do próximo.
+    - Tabela da versão anterior, sem a chave (fund_id, date) ou com ela
+      INVALID: remove cotas repetidas e cria o índice único (no
+      PostgreSQL, com CONCURRENTLY).
+
+    Nos demais casos não faz nada: o create_all cria a tabela com a chave.
+    """
+    is_pg = bind.dialect.name == "postgresql"
+    inspector = inspect(bind)
+
+    if not inspector.has_table(models.FundHistory.__tablename__):
+        if is_pg and FUND_HISTORY_PARTITIONING == "monthly":
+            models.Fund.__table__.create(bind, checkfirst=True)
+            with bind.begin() as conn:
+                conn.execute(text(PARTITIONED_HISTORY_DDL))
+            logging.info("[history] fund_history criada com particionamento mensal")
+            with Session(bind) as db:
+                ensure_upcoming_partitions(db)
+        return
+
+    with Session(bind) as db:
+        if is_partitioned(db):
+            ensure_upcoming_partitions(db)
+            return
+
+    if index_state(bind, HISTORY_KEY_INDEX):
+        return
+
+    with Session(bind) as db:
+        removed = dedupe_history(db)
+        db.commit()
+    logging.info(f"[history] {removed} cotas repetidas removidas; criando a chave (fund_id, date)")
+    _create_history_key(bind)
@@ -0,0 +1,292 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from backend.app.benchmarks import load_benchmarks
+from backend.app.crud import (
+    ensure_fund_stats, export_nav_matrix, get_job_run, recompute_all_metrics, refresh_benchmark_metrics,
+    refresh_fund_metrics, save_job_run,
+)
+from backend.app.cvm_ingest import generate_simulated_history_bulk, run_cvm_ingestion
+from backend.app.db import SessionLocal
+from backend.app.history_schema import ensure_upcoming_partitions
+from backend.app.nav_ingest import CVM_INF_DIARIO_SOURCE, run_nav_ingestion
+from backend.app.locks import host_lock, job_lock
+from backend.app.models import Fund, FundStats
+from backend.app.progress import progress
+from backend.app.staging import StagedLoad
+
+# "direct": grava direto em funds/fund_history
+# "staging": carrega em tabelas de staging e aplica tudo em uma transação no final
+CVM_LOAD_MODE = os.getenv("CVM_LOAD_MODE", "direct")
+
+# intervalo da ingestão agendada (cada worker agenda a sua; só uma roda por intervalo)
+CVM_INGEST_INTERVAL_HOURS = float(os.getenv("CVM_INGEST_INTERVAL_HOURS", "6"))
+
+# o recálculo completo é diário
+METRICS_RECOMPUTE_INTERVAL = timedelta(days=1)
+
+# disparos do mesmo intervalo em workers diferentes chegam com alguns segundos ou minutos de
+# diferença; uma execução iniciada há menos de (intervalo - folga) conta como a do intervalo atual
+JOB_SCHEDULE_SLACK = timedelta(minutes=5)
+
+
+def run_ingestion(min_interval: timedelta = timedelta(hours=CVM_INGEST_INTERVAL_HOURS)):
+    """
+    Executa o pipeline completo de ingestão da CVM.
+
+    Etapas:
+        1. Cadastro de fundos (cad_fi.csv).
+        2. Cotas diárias (informe diário), se houver origem configurada.
+        3. Atualização das métricas pré-calculadas (`fund_metrics`) a partir dos acumuladores.
+        4. Índices de referência (BENCHMARK_DIR) e métricas relativas ao índice padrão.
+        5. Exportação da matriz de cotas compartilhada pelos workers (NAV_MATRIX_PATH).
+
+    Só um processo (entre todos os workers e hosts) executa por vez, e só
+    uma vez por intervalo: os demais workers, que disparam o mesmo job,
+    registram no log que pularam a execução.
+
+    Com CVM_LOAD_MODE=staging, as etapas carregam em tabelas de staging e
+    os leitores só enxergam o resultado após o merge final.
+
+    O andamento fica disponível em `progress` (endpoint /ready).
+
+    Args:
+        min_interval (timedelta | None): Pula a execução se outra tiver sido
+            concluída dentro do intervalo (None executa sempre).
+    """
+    with job_lock("cvm_ingestion") as acquired:
+        if not acquired:
+            logging.info(f"[lock] Ingestão da CVM já em execução em outro processo. Pulando (pid {os.getpid()}).")
+            progress.skip("ingestão em execução em outro processo")
+            return
+        if _completed_recently("cvm_ingestion", min_interval):
+            logging.info(f"[lock] Ingestão da CVM já concluída neste intervalo. Pulando (pid {os.getpid()}).")
+            progress.skip("ingestão concluída neste intervalo por outro processo")
+            return
+        started = datetime.utcnow()
+        _prepare_partitions()
+        if CVM_LOAD_MODE == "staging":
+            error = _run_staged()
+        else:
+            error = _run_stages()
+        # com erro, o próximo disparo (deste ou de outro worker) tenta de novo
+        if not error:
+            _record_run("cvm_ingestion", started)
+
+
+def _completed_recently(name: str, min_interval: timedelta) -> bool:
+    if min_interval is None:
+        return False
+    session = SessionLocal()
+    try:
+        run = get_job_run(session, name)
+    except Exception as e:
+        logging.warning(f"[lock] Não foi possível consultar a última execução de {name} ({e}); executando.")
+        return False
+    finally:
+        session.close()
+    return run is not None and datetime.utcnow() - run.started_at < min_interval - JOB_SCHEDULE_SLACK
+
+
+def _record_run(name: str, started: datetime):
+    session = SessionLocal()
+    try:
+        save_job_run(session, name, started)
+    except Exception as e:
+        session.rollback()
+        logging.error(f"[lock] Erro ao registrar a execução de {name}: {e}")
+    finally:
+        session.close()
+
+
+def _prepare_partitions():
+    # partições do mês corrente e do próximo em transação própria e curta: as
+    # cargas não precisam criar partição (o que bloquearia fund_history até o commit)
+    session = SessionLocal()
+    try:
+        ensure_upcoming_partitions(session)
+    except Exception as e:
+        session.rollback()
+        logging.error(f"[history] Erro ao criar partições de fund_history: {e}")
+    finally:
+        session.close()
+
+
+def _run_stages(staging=None):
+    progress.start()
+    error = None
+    # com origem de cotas reais, fundos novos não recebem histórico simulado
+    simulate_history = not CVM_INF_DIARIO_SOURCE
+    if not run_cvm_ingestion(staging=staging, simulate_history=simulate_history):
+        error = "Falha na ingestão do cadastro da CVM"
+    try:
+        run_nav_ingestion(staging=staging)
+    except Exception as e:
+        logging.error(f"[nav] Erro na ingestão das cotas diárias: {e}")
+        error = error or f"Falha na ingestão das cotas diárias: {e}"
+
+    if staging is not None:
+        # com erro o merge não acontece e funds/fund_history continuam como estavam
+        if not error:
+            error = _merge_staging(staging, simulate_history)
+        if error:
+            progress.finish(error)
+            return error
+
+    error = _recompute_metrics() or error
+    error = _refresh_benchmarks() or error
+    _export_nav_matrix()
+    progress.finish(error)
+    return error
+
+
+def _merge_staging(staging, simulate_history: bool = True):
+    session = SessionLocal()
+    try:
+        progress.begin_phase("merge")
+        stats = staging.merge(session)
+        if simulate_history and stats["inserted_ids"]:
+            progress.begin_phase("historico_simulado", total=len(stats["inserted_ids"]), unit="fundos")
+            generate_simulated_history_bulk(session, stats["inserted_ids"])
+    except Exception as e:
+        session.rollback()
+        logging.error(f"[staging] Erro no merge da ingestão: {e}")
+        return f"Falha no merge da ingestão: {e}"
+    finally:
+        session.close()
+    return None
+
+
+def _recompute_metrics():
+    session = SessionLocal()
+    try:
+        started = time.perf_counter()
+        # fundos sem acumuladores (ex: base anterior à tabela fund_stats)
+        created = ensure_fund_stats(session)
+        if created:
+            logging.info(f"[metrics] Acumuladores criados para {created} fundos")
+        progress.begin_phase("metricas", total=session.query(Fund).count(), unit="fundos")
+        updated = refresh_fund_metrics(session, on_batch=progress.advance)
+        logging.info(f"[metrics] Métricas atualizadas para {updated} fundos em {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        session.rollback()
+        logging.error(f"[metrics] Erro na atualização das métricas: {e}")
+        return f"Falha na atualização das métricas: {e}"
+    finally:
+        session.close()
+    return None
+
+
+def _refresh_benchmarks():
+    session = SessionLocal()
+    try:
+        started = time.perf_counter()
+        progress.begin_phase("benchmarks")
+        reloaded = load_benchmarks(session)
+        # com índice recarregado todos os fundos mudam; senão, só os que receberam cotas nesta execução
+        fund_ids = None
+        if not reloaded:
+            fund_ids = session.scalars(
+                select(FundStats.fund_id).where(FundStats.updated_at >= progress.started_at)
+            ).all()
+        updated = refresh_benchmark_metrics(session, fund_ids)
+        logging.info(
+            f"[benchmarks] Métricas relativas atualizadas para {updated} fundos "
+            f"em {time.perf_counter() - started:.1f}s"
+        )
+    except Exception as e:
+        session.rollback()
+        logging.error(f"[benchmarks] Erro na atualização das métricas relativas: {e}")
+        return f"Falha na atualização das métricas relativas: {e}"
+    finally:
+        session.close()
+    return None
+
+
+def _export_nav_matrix(only_if_stale: bool = False):
+    # falha na exportação não é erro da ingestão: os leitores usam `fund_series`
+    session = SessionLocal()
+    try:
+        started = time.perf_counter()
+        exported = export_nav_matrix(session, only_if_stale=only_if_stale)
+        if exported:
+            logging.info(
+                f"[nav_matrix] Matriz de cotas exportada: {exported['funds']} fundos x {exported['dates']} datas "
+                f"({exported['bytes'] / 2**20:.1f} MiB) em {time.perf_counter() - started:.1f}s"
+            )
+    except Exception as e:
+        logging.error(f"[nav_matrix] Erro na exportação da matriz de cotas: {e}")
+    finally:
+        session.close()
+
+
+def run_nav_matrix_refresh():
+    """
+    Exporta a matriz de cotas deste host se ela não existir ou estiver desatualizada.
+
+    A ingestão exporta a matriz só no host em que rodou; nos demais, este
+    job (um processo por host) a atualiza. Enquanto isso os workers leem
+    as cotas de `fund_series`.
+    """
+    with host_lock("nav_matrix") as acquired:
+        if not acquired:
+            return
+        _export_nav_matrix(only_if_stale=True)
+
+
+def run_metrics_recompute(min_interval: timedelta = METRICS_RECOMPUTE_INTERVAL):
+    """
+    Recalcula do zero, a partir do histórico, os acumuladores e as métricas de todos os fundos.
+
+    Usa o mesmo lock da ingestão: as duas rotinas escrevem em `fund_stats`
+    e não devem rodar ao mesmo tempo. Como a ingestão, roda uma vez por
+    intervalo entre todos os workers.
+
+    Args:
+        min_interval (timedelta | None): Pula a execução se outra tiver sido
+            concluída dentro do intervalo (None executa sempre).
+    """
+    with job_lock("cvm_ingestion") as acquired:
+        if not acquired:
+            logging.info(f"[lock] Ingestão ou recálculo em execução em outro processo. Pulando (pid {os.getpid()}).")
+            return
+        if _completed_recently("metrics_recompute", min_interval):
+            logging.info(f"[lock] Recálculo das métricas já concluído neste intervalo. Pulando (pid {os.getpid()}).")
+            return
+        started_at = datetime.utcnow()
+        session = SessionLocal()
+        try:
+            started = time.perf_counter()
+            load_benchmarks(session)
+            updated = recompute_all_metrics(session)
+            logging.info(f"[metrics] Métricas recalculadas para {updated} fundos em {time.perf_counter() - started:.1f}s")
+            _record_run("metrics_recompute", started_at)
+        except Exception as e:
+            session.rollback()
+            logging.error(f"[metrics] Erro no recálculo das métricas: {e}")
+        finally:
+            session.close()
+        # o recálculo atualiza `fund_stats` de todos os fundos: a matriz anterior deixa de valer
+        _export_nav_matrix()
+
+
+def _run_staged():
+    staging = StagedLoad()
+    session = SessionLocal()
+    try:
+        staging.prepare(session)
+    finally:
+        session.close()
+    try:
+        # com erro em alguma etapa o merge não acontece: funds/fund_history ficam intactos
+        return _run_stages(staging)
+    finally:
+        session = SessionLocal()
+        try:
+            staging.cleanup(session)
+        finally:
+            session.close()
@@ -0,0 +1,141 @@
+import logging
+import os
+import tempfile
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+
+from sqlalchemy import text
+
+from backend.app.db import engine
+
+# diretório dos locks em arquivo (fallback quando não há PostgreSQL)
+LOCK_DIR = os.getenv("FUNDMATCH_LOCK_DIR", tempfile.gettempdir())
+
+# intervalo entre tentativas de job_lock(wait=True), em segundos
+LOCK_POLL_SECONDS = 1.0
+
+
+def _advisory_key(name: str) -> int:
+    return zlib.crc32(f"fundmatch:{name}".encode())
+
+
+@contextmanager
+def _advisory_lock(name: str):
+    """
+    Tenta obter um advisory lock de sessão no PostgreSQL, sem esperar.
+
+    O lock fica preso à conexão, que permanece aberta (fora de transação)
+    até o fim do bloco. Vale para todos os processos e hosts do mesmo banco.
+    """
+    key = _advisory_key(name)
+    conn = engine.connect()
+    try:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar()
+        # encerra a transação: o lock de sessão continua válido
+        conn.commit()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                conn.commit()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _file_lock(name: str):
+    """
+    Tenta obter um lock exclusivo em arquivo, sem esperar.
+
+    Só coordena processos do mesmo host.
+    """
+    path = os.path.join(LOCK_DIR, f"fundmatch-{name}.lock")
+    fh = open(path, "a+b")
+    try:
+        try:
+            if os.name == "nt":
+                import msvcrt
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except OSError:
+            acquired = False
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                if os.name == "nt":
+                    import msvcrt
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    finally:
+        fh.close()
+
+
+def _try_job_lock(stack: ExitStack, name: str) -> bool:
+    acquired = None
+    if engine.dialect.name == "postgresql":
+        try:
+            acquired = stack.enter_context(_advisory_lock(name))
+        except Exception as e:
+            logging.warning(f"[lock] Advisory lock indisponível ({e}); usando lock em arquivo.")
+    if acquired is None:
+        acquired = stack.enter_context(_file_lock(name))
+    return acquired
+
+
+@contextmanager
+def job_lock(name: str, wait: bool = False):
+    """
+    Garante que um job rode em um único processo por vez.
+
+    Usa advisory lock do PostgreSQL (coordena todos os workers e hosts) e,
+    em outros bancos ou se o banco estiver indisponível, um lock em arquivo
+    local em LOCK_DIR.
+
+    Com `wait`, tenta de novo a cada LOCK_POLL_SECONDS até obter o lock.
+    A espera é feita sem transação aberta: um pg_advisory_lock bloqueante
+    manteria um snapshot, e um CREATE INDEX CONCURRENTLY de quem tem o
+    lock esperaria por ele.
+
+    Args:
+        name (str): Nome do job.
+        wait (bool): Esperar o lock em vez de desistir (default: False).
+
+    Yields:
+        bool: True se este processo obteve o lock e deve executar o job.
+    """
+    while True:
+        with ExitStack() as stack:
+            acquired = _try_job_lock(stack, name)
+            if acquired or not wait:
+                yield acquired
+                return
+        time.sleep(LOCK_POLL_SECONDS)
+
+
+@contextmanager
+def host_lock(name: str):
+    """
+    Garante que um job rode em um único processo por vez neste host.
+
+    Para jobs que atualizam arquivos locais (ex: a matriz de cotas
+    compartilhada), que cada host precisa rodar por conta própria.
+
+    Args:
+        name (str): Nome do job.
+
+    Yields:
+        bool: True se este processo obteve o lock e deve executar o job.
+    """
+    with _file_lock(name) as acquired:
+        yield acquired
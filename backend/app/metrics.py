@@ -1,5 +1,334 @@
 from typing import List
-from statistics import mean, pstdev
+
+import numpy as np
+
+# pregões por ano, usado para anualizar retorno e volatilidade diários
+PERIODS_PER_YEAR = 252
+
+
+def _previous_valid_index(valid: np.ndarray) -> np.ndarray:
+    """Índice, por coluna, da última cota válida anterior (-1 se não houver)."""
+    if valid.shape[1] == 0:
+        return np.full(valid.shape, -1, dtype=np.int64)
+    # índice da última cota válida até cada coluna (forward fill)
+    cols = np.where(valid, np.arange(valid.shape[1]), -1)
+    last = np.maximum.accumulate(cols, axis=1)
+    prev_idx = np.empty_like(last)
+    prev_idx[:, 0] = -1
+    prev_idx[:, 1:] = last[:, :-1]
+    return prev_idx
+
+
+def returns_matrix(navs: np.ndarray) -> np.ndarray:
+    """
+    Calcula os retornos simples de várias séries de cotas de uma vez.
+
+    Cada linha é um fundo e cada coluna uma data; datas sem cota são NaN.
+    O retorno em uma data é calculado contra a última cota válida anterior,
+    então lacunas não geram retornos espúrios.
+
+    Fórmula: (P_t / P_{t-1}) - 1
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas, com NaN onde não há cota.
+
+    Returns:
+        np.ndarray: Matriz do mesmo formato com os retornos (NaN onde não há retorno).
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    if navs.shape[1] == 0:
+        return np.full(navs.shape, np.nan)
+    valid = ~np.isnan(navs)
+    prev_idx = _previous_valid_index(valid)
+
+    prev = np.take_along_axis(navs, np.maximum(prev_idx, 0), axis=1)
+    has_return = valid & (prev_idx >= 0)
+
+    returns = np.full(navs.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed = navs / prev - 1.0
+    # proteger divisão por zero
+    computed[prev == 0] = 0.0
+    returns[has_return] = computed[has_return]
+    return returns
+
+
+def volatility_batch(returns: np.ndarray) -> np.ndarray:
+    """
+    Calcula a volatilidade (desvio padrão populacional) de cada linha de retornos.
+
+    Args:
+        returns (np.ndarray): Matriz (fundos x datas) de retornos, com NaN onde não há retorno.
+
+    Returns:
+        np.ndarray: Volatilidade por fundo (0.0 com menos de 2 retornos).
+    """
+    returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+    n = np.sum(~np.isnan(returns), axis=1)
+    vol = np.zeros(returns.shape[0])
+    enough = n >= 2
+    if enough.any():
+        sub = returns[enough]
+        mean = np.nanmean(sub, axis=1, keepdims=True)
+        vol[enough] = np.sqrt(np.nansum((sub - mean) ** 2, axis=1) / n[enough])
+    return vol
+
+
+def sharpe_batch(returns: np.ndarray, risk_free: float = 0.0) -> np.ndarray:
+    """
+    Calcula o índice de Sharpe de cada linha de retornos.
+
+    Fórmula: (média dos retornos - taxa livre de risco) / volatilidade
+
+    Args:
+        returns (np.ndarray): Matriz (fundos x datas) de retornos, com NaN onde não há retorno.
+        risk_free (float): Taxa livre de risco (default: 0.0).
+
+    Returns:
+        np.ndarray: Sharpe por fundo (0.0 sem retornos ou com volatilidade zero).
+    """
+    returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+    vol = volatility_batch(returns)
+    sharpe = np.zeros(returns.shape[0])
+    ok = vol != 0
+    if ok.any():
+        sharpe[ok] = (np.nanmean(returns[ok], axis=1) - risk_free) / vol[ok]
+    return sharpe
+
+
+def total_return_batch(navs: np.ndarray) -> np.ndarray:
+    """
+    Calcula o retorno total entre a primeira e a última cota válida de cada linha.
+
+    Fórmula: (P_final / P_inicial) - 1
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas, com NaN onde não há cota.
+
+    Returns:
+        np.ndarray: Retorno total por fundo (0.0 com menos de 2 cotas ou cota inicial zero).
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    if navs.shape[1] == 0:
+        return np.zeros(navs.shape[0])
+    valid = ~np.isnan(navs)
+    n = valid.sum(axis=1)
+    rows = np.arange(navs.shape[0])
+    first = navs[rows, np.argmax(valid, axis=1)]
+    last = navs[rows, navs.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)]
+
+    result = np.zeros(navs.shape[0])
+    ok = (n >= 2) & (first != 0)
+    result[ok] = last[ok] / first[ok] - 1.0
+    return result
+
+
+def batch_metrics(navs: np.ndarray, risk_free: float = 0.0, periods_per_year: int = PERIODS_PER_YEAR) -> dict:
+    """
+    Calcula as métricas de vários fundos em uma passada vetorizada.
+
+    Produz as mesmas métricas de OnlineMetrics.result() (ver a docstring da
+    classe), uma posição por fundo. Lacunas (NaN) não contam como cotas: os
+    retornos e as durações de drawdown consideram só as cotas válidas.
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas alinhadas por data, com NaN onde não há cota.
+        risk_free (float): Taxa livre de risco por período (default: 0.0).
+        periods_per_year (int): Períodos por ano para anualização (default: 252).
+
+    Returns:
+        dict: Um vetor por métrica ("rentability", "volatility", "sharpe", ..., "n").
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    valid = ~np.isnan(navs)
+    returns = returns_matrix(navs)
+    has_return = ~np.isnan(returns)
+    count = has_return.sum(axis=1)
+    some = count > 0
+
+    rent = total_return_batch(navs)
+    vol = volatility_batch(returns)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(some, np.nansum(returns, axis=1) / count, 0.0)
+        downside_sq = np.where(has_return, np.minimum(returns - risk_free, 0.0), 0.0) ** 2
+        downside = np.where(some, np.sqrt(downside_sq.sum(axis=1) / count), 0.0)
+        sortino = np.where(downside > 0, (mean - risk_free) / downside, 0.0)
+        hit_ratio = np.where(some, (has_return & (returns > 0)).sum(axis=1) / count, 0.0)
+
+        growth = 1.0 + rent
+        annual = np.where(growth > 0, np.abs(growth) ** (periods_per_year / np.maximum(count, 1)) - 1.0, -1.0)
+        annual = np.where(some, annual, 0.0)
+
+        # drawdown: pico corrente ignorando NaN e sequências de cotas válidas abaixo dele
+        peaks = np.fmax.accumulate(navs, axis=1)
+        below = valid & (navs < peaks)
+        drawdowns = np.where(below & (peaks > 0), navs / peaks - 1.0, 0.0)
+    max_drawdown = np.minimum(drawdowns.min(axis=1, initial=0.0), 0.0)
+    below_count = np.cumsum(below, axis=1)
+    reset = np.maximum.accumulate(np.where(valid & ~below, below_count, 0), axis=1)
+    duration = (below_count - reset).max(axis=1, initial=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        calmar = np.where(max_drawdown < 0, annual / np.abs(max_drawdown), 0.0)
+
+    return {
+        "rentability": rent,
+        "volatility": vol,
+        "sharpe": sharpe_batch(returns, risk_free),
+        "sortino": sortino,
+        "annualized_return": annual,
+        "annualized_volatility": vol * periods_per_year ** 0.5,
+        "max_drawdown": max_drawdown,
+        "max_drawdown_duration": duration,
+        "calmar": calmar,
+        "hit_ratio": hit_ratio,
+        "n": valid.sum(axis=1),
+    }
+
+
+def relative_metrics(navs: np.ndarray, benchmark: np.ndarray, risk_free: float = 0.0,
+                     periods_per_year: int = PERIODS_PER_YEAR) -> dict:
+    """
+    Calcula alfa, beta, tracking error e information ratio de vários fundos contra um benchmark.
+
+    O retorno do benchmark de cada período é medido entre as mesmas datas do
+    retorno do fundo (inclusive sobre lacunas); períodos sem valor do
+    benchmark em alguma das pontas são ignorados.
+
+    Fórmulas (r = retorno do fundo, b = do benchmark, rf = taxa livre de risco):
+        beta = cov(r, b) / var(b)
+        alpha = (média(r - rf) - beta * média(b - rf)) * periods_per_year
+        tracking_error = desvio(r - b) * sqrt(periods_per_year)
+        information_ratio = média(r - b) * periods_per_year / tracking_error
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas alinhadas por data, com NaN onde não há cota.
+        benchmark (np.ndarray): Valor do benchmark em cada data (colunas de `navs`), NaN onde não há.
+        risk_free (float): Taxa livre de risco por período (default: 0.0).
+        periods_per_year (int): Períodos por ano para anualização (default: 252).
+
+    Returns:
+        dict: Um vetor por métrica ("alpha", "beta", "tracking_error",
+            "information_ratio"), NaN para fundos com menos de 2 períodos em comum.
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    benchmark = np.asarray(benchmark, dtype=np.float64)
+    returns = returns_matrix(navs)
+    prev_idx = _previous_valid_index(~np.isnan(navs))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bench_returns = benchmark[None, :] / benchmark[np.maximum(prev_idx, 0)] - 1.0
+    paired = ~np.isnan(returns) & np.isfinite(bench_returns) & (prev_idx >= 0)
+    count = paired.sum(axis=1)
+    enough = count >= 2
+
+    r = np.where(paired, returns, 0.0)
+    b = np.where(paired, bench_returns, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_r = r.sum(axis=1) / count
+        mean_b = b.sum(axis=1) / count
+        dev_r = np.where(paired, r - mean_r[:, None], 0.0)
+        dev_b = np.where(paired, b - mean_b[:, None], 0.0)
+        var_b = (dev_b ** 2).sum(axis=1) / count
+        beta = np.where(var_b > 0, (dev_r * dev_b).sum(axis=1) / count / var_b, np.nan)
+        alpha = ((mean_r - risk_free) - beta * (mean_b - risk_free)) * periods_per_year
+
+        diff = np.where(paired, (dev_r - dev_b), 0.0)
+        tracking = np.sqrt((diff ** 2).sum(axis=1) / count)
+        active = (mean_r - mean_b) * periods_per_year
+        information = np.where(tracking > 0, active / (tracking * np.sqrt(periods_per_year)), np.nan)
+
+    return {
+        "alpha": np.where(enough, alpha, np.nan),
+        "beta": np.where(enough, beta, np.nan),
+        "tracking_error": np.where(enough, tracking * np.sqrt(periods_per_year), np.nan),
+        "information_ratio": np.where(enough, information, np.nan),
+    }
+
+
+def rolling_metrics(navs, windows, risk_free: float = 0.0) -> dict:
+    """
+    Calcula retorno, volatilidade e Sharpe em janelas móveis de uma série de cotas.
+
+    Usa somas acumuladas dos retornos e de seus quadrados, calculadas uma
+    única vez para todas as janelas: cada janela custa O(n), independente
+    do seu tamanho.
+
+    Args:
+        navs (array-like): Cotas em ordem cronológica (sem NaN).
+        windows (iterable): Tamanhos das janelas, em quantidade de retornos (ex: 21, 63, 252).
+        risk_free (float): Taxa livre de risco por período (default: 0.0).
+
+    Returns:
+        dict: Janela → {"return", "volatility", "sharpe"}, vetores alinhados às
+            cotas (NaN enquanto a janela não está completa).
+    """
+    navs = np.asarray(navs, dtype=np.float64)
+    returns = returns_matrix(navs)[0, 1:]
+    # centralizar reduz o cancelamento numérico em S2/w - média²
+    shift = returns.mean() if len(returns) else 0.0
+    centered = returns - shift
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    sums_sq = np.concatenate(([0.0], np.cumsum(centered * centered)))
+
+    result = {}
+    for window in windows:
+        ret = np.full(len(navs), np.nan)
+        vol = np.full(len(navs), np.nan)
+        sharpe = np.full(len(navs), np.nan)
+        if 0 < window <= len(returns):
+            mean = (sums[window:] - sums[:-window]) / window
+            var = np.maximum((sums_sq[window:] - sums_sq[:-window]) / window - mean * mean, 0.0)
+            vol[window:] = np.sqrt(var)
+            mean += shift
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ret[window:] = np.where(navs[:-window] != 0, navs[window:] / navs[:-window] - 1.0, 0.0)
+                sharpe[window:] = np.where(vol[window:] > 0, (mean - risk_free) / vol[window:], 0.0)
+        result[window] = {"return": ret, "volatility": vol, "sharpe": sharpe}
+    return result
+
+
+def pairwise_covariance(navs, min_periods: int = 2):
+    """
+    Calcula covariância e correlação dos retornos diários entre todos os pares de fundos.
+
+    Os retornos de cada dia só existem quando o fundo tem cota no dia e no
+    anterior; cada par usa apenas os dias em que ambos têm retorno
+    (pairwise-complete). Tudo é feito com produtos de matrizes, sem laços
+    por par.
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas alinhadas por data, com NaN onde não há cota.
+        min_periods (int): Mínimo de dias em comum para o par ter valor (default: 2).
+
+    Returns:
+        tuple: (covariância, correlação, dias em comum), matrizes fundos x fundos;
+            pares com menos de `min_periods` dias ficam NaN.
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = navs[:, 1:] / navs[:, :-1] - 1.0
+    returns[~np.isfinite(returns)] = np.nan
+
+    mask = (~np.isnan(returns)).astype(np.float64)
+    x = np.nan_to_num(returns, nan=0.0)
+
+    counts = mask @ mask.T
+    sums = x @ mask.T           # sums[i, j]: soma dos retornos de i nos dias em comum com j
+    sums_sq = (x * x) @ mask.T  # idem para os quadrados
+    products = x @ x.T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (products - sums * sums.T / counts) / (counts - 1)
+        var_i = (sums_sq - sums * sums / counts) / (counts - 1)
+        corr = cov / np.sqrt(var_i * var_i.T)
+
+    invalid = counts < max(min_periods, 2)
+    cov[invalid] = np.nan
+    corr[invalid] = np.nan
+    # erros de arredondamento podem empurrar |corr| levemente acima de 1
+    np.clip(corr, -1.0, 1.0, out=corr)
+    return cov, corr, counts.astype(np.int64)
+
 
 def calculate_returns(prices: List[float]) -> List[float]:
     """
@@ -15,14 +344,7 @@ def calculate_returns(prices: List[float]) -> List[float]:
     """
     if not prices or len(prices) < 2:
         return []
-    returns = []
-    for prev, cur in zip(prices[:-1], prices[1:]):
-        # proteger divisão por zero
-        if prev == 0:
-            returns.append(0.0)
-        else:
-            returns.append((cur / prev) - 1.0)
-    return returns
+    return returns_matrix([prices])[0, 1:].tolist()
 
 def calculate_volatility(returns: List[float]) -> float:
     """
@@ -36,7 +358,7 @@ def calculate_volatility(returns: List[float]) -> float:
     """
     if not returns or len(returns) < 2:
         return 0.0
-    return pstdev(returns)
+    return float(volatility_batch([returns])[0])
 
 def calculate_sharpe(returns: List[float], risk_free: float = 0.0) -> float:
     """
@@ -53,11 +375,7 @@ def calculate_sharpe(returns: List[float], risk_free: float = 0.0) -> float:
     """
     if not returns:
         return 0.0
-    avg = mean(returns)
-    vol = calculate_volatility(returns)
-    if vol == 0:
-        return 0.0
-    return (avg - risk_free) / vol
+    return float(sharpe_batch([returns], risk_free)[0])
 
 def total_return(prices: List[float]) -> float:
     """
@@ -73,8 +391,224 @@ def total_return(prices: List[float]) -> float:
     """
     if not prices or len(prices) < 2:
         return 0.0
-    first = prices[0]
-    last = prices[-1]
-    if first == 0:
-        return 0.0
-    return (last / first) - 1.0
+    return float(total_return_batch([prices])[0])
+
+
+class OnlineMetrics:
+    """
+    Calcula métricas de risco e retorno em uma única passada sobre as cotas.
+
+    Guarda só acumuladores de tamanho fixo (Welford para média e variância
+    dos retornos, pico e drawdown correntes), então históricos longos podem
+    ser lidos em streaming sem virar listas em memória.
+
+    Métricas de result():
+        rentability (float): Retorno total entre a primeira e a última cota.
+        volatility (float): Desvio padrão populacional dos retornos do período.
+        sharpe (float): (média dos retornos - taxa livre de risco) / volatilidade.
+        sortino (float): Como o Sharpe, mas dividindo pelo desvio só dos retornos abaixo da taxa livre de risco.
+        annualized_return / annualized_volatility (float): Retorno e volatilidade anualizados.
+        max_drawdown (float): Maior queda em relação ao pico anterior (valor negativo, ex: -0.25).
+        max_drawdown_duration (int): Maior quantidade de períodos abaixo do pico anterior.
+        calmar (float): Retorno anualizado / |max_drawdown|.
+        hit_ratio (float): Fração dos retornos positivos.
+        n (int): Quantidade de cotas consumidas.
+    """
+
+    # acumuladores que bastam para continuar a série (ver state() e from_state())
+    STATE_FIELDS = (
+        "n", "first", "last", "count", "mean", "m2", "downside_sq", "hits",
+        "peak", "max_drawdown", "underwater", "max_drawdown_duration",
+    )
+
+    def __init__(self, risk_free: float = 0.0, periods_per_year: int = PERIODS_PER_YEAR):
+        self.risk_free = risk_free
+        self.periods_per_year = periods_per_year
+        self.n = 0
+        self.first = None
+        self.last = None
+        # Welford
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+        self.hits = 0
+        # drawdown
+        self.peak = None
+        self.max_drawdown = 0.0
+        self.underwater = 0
+        self.max_drawdown_duration = 0
+
+    def update(self, nav: float):
+        """
+        Consome a próxima cota da série.
+
+        Args:
+            nav (float): Valor da cota.
+        """
+        nav = float(nav)
+        self.n += 1
+        if self.first is None:
+            self.first = nav
+        else:
+            # proteger divisão por zero
+            ret = 0.0 if self.last == 0 else nav / self.last - 1.0
+            self.count += 1
+            delta = ret - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (ret - self.mean)
+            excess = ret - self.risk_free
+            if excess < 0:
+                self.downside_sq += excess * excess
+            if ret > 0:
+                self.hits += 1
+        self.last = nav
+
+        if self.peak is None or nav >= self.peak:
+            self.peak = nav
+            self.underwater = 0
+        else:
+            self.underwater += 1
+            self.max_drawdown_duration = max(self.max_drawdown_duration, self.underwater)
+            if self.peak > 0:
+                self.max_drawdown = min(self.max_drawdown, nav / self.peak - 1.0)
+
+    def state(self) -> dict:
+        """
+        Retorna os acumuladores, para persistir e continuar a série depois.
+
+        Returns:
+            dict: Um item por campo de STATE_FIELDS.
+        """
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+
+    @classmethod
+    def from_state(cls, state: dict, risk_free: float = 0.0, periods_per_year: int = PERIODS_PER_YEAR):
+        """
+        Reconstrói o calculador a partir de acumuladores salvos com state().
+
+        Args:
+            state (dict | object): Acumuladores, como dicionário ou objeto com os mesmos atributos.
+            risk_free (float): Taxa livre de risco usada ao gerar o estado.
+            periods_per_year (int): Períodos por ano para anualização.
+
+        Returns:
+            OnlineMetrics: Calculador pronto para receber as próximas cotas.
+        """
+        calc = cls(risk_free, periods_per_year)
+        for field in cls.STATE_FIELDS:
+            value = state[field] if isinstance(state, dict) else getattr(state, field)
+            setattr(calc, field, value)
+        return calc
+
+    @classmethod
+    def from_array(cls, navs, risk_free: float = 0.0, periods_per_year: int = PERIODS_PER_YEAR):
+        """
+        Calcula os acumuladores de uma série inteira de uma vez, com NumPy.
+
+        Equivale a consume() sobre as mesmas cotas, mas sem o laço em Python;
+        usado para reconstruir o estado de muitos fundos.
+
+        Args:
+            navs (array-like): Cotas em ordem cronológica (sem NaN).
+            risk_free (float): Taxa livre de risco por período.
+            periods_per_year (int): Períodos por ano para anualização.
+
+        Returns:
+            OnlineMetrics: Calculador no mesmo estado que teria após consume(navs).
+        """
+        calc = cls(risk_free, periods_per_year)
+        navs = np.asarray(navs, dtype=np.float64)
+        if not len(navs):
+            return calc
+
+        calc.n = len(navs)
+        calc.first = float(navs[0])
+        calc.last = float(navs[-1])
+        if len(navs) >= 2:
+            returns = returns_matrix(navs)[0, 1:]
+            calc.count = len(returns)
+            calc.mean = float(returns.mean())
+            calc.m2 = float(((returns - calc.mean) ** 2).sum())
+            calc.downside_sq = float((np.minimum(returns - risk_free, 0.0) ** 2).sum())
+            calc.hits = int((returns > 0).sum())
+
+        peaks = np.maximum.accumulate(navs)
+        calc.peak = float(peaks[-1])
+        below = navs < peaks
+        if below.any():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                drawdowns = np.where(below & (peaks > 0), navs / peaks - 1.0, 0.0)
+            calc.max_drawdown = float(min(drawdowns.min(), 0.0))
+            # tamanho de cada sequência de cotas abaixo do pico
+            below_count = np.cumsum(below)
+            reset = np.maximum.accumulate(np.where(below, 0, below_count))
+            runs = below_count - reset
+            calc.underwater = int(runs[-1])
+            calc.max_drawdown_duration = int(runs.max())
+        return calc
+
+    def consume(self, navs):
+        """
+        Consome todas as cotas de um iterável.
+
+        Args:
+            navs (iterable): Cotas em ordem cronológica.
+
+        Returns:
+            OnlineMetrics: A própria instância, para encadear com result().
+        """
+        for nav in navs:
+            self.update(nav)
+        return self
+
+    def result(self) -> dict:
+        """
+        Retorna as métricas acumuladas até o momento.
+
+        Returns:
+            dict: Métricas descritas na docstring da classe.
+        """
+        rent = 0.0
+        if self.n >= 2 and self.first != 0:
+            rent = self.last / self.first - 1.0
+
+        vol = (self.m2 / self.count) ** 0.5 if self.count >= 2 else 0.0
+        sharpe = (self.mean - self.risk_free) / vol if vol else 0.0
+        downside = (self.downside_sq / self.count) ** 0.5 if self.count else 0.0
+        sortino = (self.mean - self.risk_free) / downside if downside else 0.0
+
+        annual_return = 0.0
+        if self.count:
+            growth = 1.0 + rent
+            annual_return = growth ** (self.periods_per_year / self.count) - 1.0 if growth > 0 else -1.0
+        calmar = annual_return / abs(self.max_drawdown) if self.max_drawdown < 0 else 0.0
+
+        return {
+            "rentability": rent,
+            "volatility": vol,
+            "sharpe": sharpe,
+            "sortino": sortino,
+            "annualized_return": annual_return,
+            "annualized_volatility": vol * self.periods_per_year ** 0.5,
+            "max_drawdown": self.max_drawdown,
+            "max_drawdown_duration": self.max_drawdown_duration,
+            "calmar": calmar,
+            "hit_ratio": self.hits / self.count if self.count else 0.0,
+            "n": self.n,
+        }
+
+
+def stream_metrics(navs, risk_free: float = 0.0, periods_per_year: int = PERIODS_PER_YEAR) -> dict:
+    """
+    Calcula as métricas estendidas de uma série de cotas em uma passada.
+
+    Args:
+        navs (iterable): Cotas em ordem cronológica (pode ser um gerador).
+        risk_free (float): Taxa livre de risco por período (default: 0.0).
+        periods_per_year (int): Períodos por ano para anualização (default: 252).
+
+    Returns:
+        dict: Métricas de OnlineMetrics.result().
+    """
+    return OnlineMetrics(risk_free, periods_per_year).consume(navs).result()
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric, Enum, Text, Float
+from sqlalchemy import (
+    BigInteger, Column, Integer, String, DateTime, ForeignKey, Numeric, Enum, Text, Float, Index, LargeBinary,
+    UniqueConstraint, text,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -79,10 +82,14 @@ class Fund(Base):
         rentability (float): Rentabilidade calculada.
         risk (float): Risco calculado.
         sharpe (float): Índice de Sharpe calculado.
+        source_hash (str): Hash dos campos vindos do cadastro da CVM.
         updated_at (datetime): Última atualização.
 
     Relacionamentos:
         history: Histórico de cotas (NAVs).
+        stats: Acumuladores das métricas (ver FundStats).
+        series: Série de cotas em formato colunar (ver FundSeries).
+        metrics: Métricas pré-calculadas (ver FundMetrics).
     """
     __tablename__ = "funds"
 
@@ -93,14 +100,31 @@ class Fund(Base):
     rentability = Column(Float, nullable=True)
     risk = Column(Float, nullable=True)
     sharpe = Column(Float, nullable=True)
+    source_hash = Column(String(32), nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
     history = relationship("FundHistory", back_populates="fund", cascade="all, delete-orphan")
+    stats = relationship("FundStats", back_populates="fund", uselist=False, cascade="all, delete-orphan")
+    series = relationship("FundSeries", back_populates="fund", uselist=False, cascade="all, delete-orphan")
+    metrics = relationship("FundMetrics", back_populates="fund", uselist=False, cascade="all, delete-orphan")
+
+# cotas simuladas (cvm_ingest.simulate_nav_rows) têm hora do dia; as do informe diário são só datas
+SIMULATED_NAV_WHERE = {
+    "postgresql": "date <> date_trunc('day', date)",
+    "sqlite": "time(date) <> '00:00:00'",
+}
 
 class FundHistory(Base):
     """
     Histórico de cotas (NAV) de um fundo.
 
+    Uma cota por fundo e dia: (fund_id, date) é único e a gravação é por
+    upsert (crud.upsert_history / crud.merge_history). O índice inclui a
+    cota, então a série de um fundo em ordem de data é lida só do índice no
+    PostgreSQL. Com FUND_HISTORY_PARTITIONING=monthly, a tabela é criada
+    particionada por mês (ver history_schema). Um índice parcial cobre só
+    as cotas simuladas, removidas quando o fundo recebe cotas reais.
+
     Campos:
         id (int): Identificador único.
         fund_id (int): ID do fundo (chave estrangeira).
@@ -111,14 +135,185 @@ class FundHistory(Base):
         fund: Referência ao fundo associado.
     """
     __tablename__ = "fund_history"
+    __table_args__ = (
+        Index("ux_fund_history_fund_date", "fund_id", "date", unique=True, postgresql_include=["nav"]),
+        Index(
+            "ix_fund_history_simulated", "fund_id",
+            postgresql_where=text(SIMULATED_NAV_WHERE["postgresql"]),
+            sqlite_where=text(SIMULATED_NAV_WHERE["sqlite"]),
+        ),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    fund_id = Column(Integer, ForeignKey("funds.id", ondelete="CASCADE"), index=True)
-    date = Column(DateTime, default=datetime.utcnow, index=True)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    fund_id = Column(Integer, ForeignKey("funds.id", ondelete="CASCADE"), nullable=False)
+    date = Column(DateTime, default=datetime.utcnow, nullable=False)
     nav = Column(Float, nullable=False)  # NAV / valor da cota
 
     fund = relationship("Fund", back_populates="history")
 
+class FundStats(Base):
+    """
+    Acumuladores das métricas de um fundo, atualizados a cada cota adicionada.
+
+    Guardam o estado de metrics.OnlineMetrics (com taxa livre de risco zero),
+    de modo que acrescentar cotas custa O(1) por cota e ler as métricas custa
+    uma consulta. Cotas fora de ordem (data <= last_date) forçam a
+    reconstrução a partir do histórico.
+
+    Campos:
+        fund_id (int): ID do fundo (chave primária e estrangeira).
+        n (int): Quantidade de cotas.
+        first / last (float): Primeira e última cota.
+        last_date (datetime): Data da última cota.
+        count (int): Quantidade de retornos.
+        mean / m2 (float): Média e soma dos quadrados dos desvios dos retornos (Welford).
+        downside_sq (float): Soma dos quadrados dos retornos negativos.
+        hits (int): Quantidade de retornos positivos.
+        peak (float): Maior cota até aqui.
+        max_drawdown (float): Maior queda em relação ao pico.
+        underwater (int): Cotas consecutivas abaixo do pico, até a última.
+        max_drawdown_duration (int): Maior sequência de cotas abaixo do pico.
+        updated_at (datetime): Última atualização.
+    """
+    __tablename__ = "fund_stats"
+
+    fund_id = Column(Integer, ForeignKey("funds.id", ondelete="CASCADE"), primary_key=True)
+    n = Column(Integer, nullable=False, default=0)
+    first = Column(Float, nullable=True)
+    last = Column(Float, nullable=True)
+    last_date = Column(DateTime, nullable=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    downside_sq = Column(Float, nullable=False, default=0.0)
+    hits = Column(Integer, nullable=False, default=0)
+    peak = Column(Float, nullable=True)
+    max_drawdown = Column(Float, nullable=False, default=0.0)
+    underwater = Column(Integer, nullable=False, default=0)
+    max_drawdown_duration = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    fund = relationship("Fund", back_populates="stats")
+
+class FundSeries(Base):
+    """
+    Série de cotas de um fundo em formato colunar, para as leituras analíticas.
+
+    Uma linha por fundo com as datas e as cotas empacotadas (ver series.py),
+    lidas com np.frombuffer sem montar um objeto por cota: as matrizes de
+    cotas de muitos fundos saem de uma consulta. É uma cópia de
+    `fund_history` (uma cota por dia, a última do dia), mantida em dia pelas
+    mesmas rotinas que atualizam `fund_stats`: cotas novas são anexadas e
+    cotas fora de ordem ou substituídas forçam a reconstrução.
+
+    Campos:
+        fund_id (int): ID do fundo (chave primária e estrangeira).
+        count (int): Quantidade de cotas.
+        first_date / last_date (datetime): Data da primeira e da última cota.
+        days (bytes): Dias desde 1970-01-01, int32 little-endian, em ordem.
+        navs (bytes): Cotas, float64 little-endian, na ordem de `days`.
+        updated_at (datetime): Última atualização.
+    """
+    __tablename__ = "fund_series"
+
+    fund_id = Column(Integer, ForeignKey("funds.id", ondelete="CASCADE"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    first_date = Column(DateTime, nullable=True)
+    last_date = Column(DateTime, nullable=True)
+    days = Column(LargeBinary, nullable=False)
+    navs = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    fund = relationship("Fund", back_populates="series")
+
+class FundMetrics(Base):
+    """
+    Métricas pré-calculadas de um fundo, servidas pelo endpoint de métricas.
+
+    Atualizadas pela ingestão e pelo job de recálculo a partir de FundStats
+    (taxa livre de risco zero); as leituras não escrevem no banco.
+
+    Campos:
+        fund_id (int): ID do fundo (chave primária e estrangeira).
+        rentability / volatility / sharpe / sortino (float): Métricas do período.
+        annualized_return / annualized_volatility (float): Métricas anualizadas.
+        max_drawdown (float): Maior queda em relação ao pico.
+        max_drawdown_duration (int): Maior sequência de cotas abaixo do pico.
+        calmar / hit_ratio (float): Calmar e fração de retornos positivos.
+        n (int): Quantidade de cotas consideradas.
+        benchmark (str): Código do benchmark das métricas relativas (None se não havia benchmark).
+        alpha / beta (float): Alfa de Jensen anualizado e beta contra o benchmark.
+        tracking_error / information_ratio (float): Tracking error anualizado e information ratio.
+        computed_at (datetime): Momento do cálculo (frescor dos dados).
+    """
+    __tablename__ = "fund_metrics"
+
+    fund_id = Column(Integer, ForeignKey("funds.id", ondelete="CASCADE"), primary_key=True)
+    rentability = Column(Float, nullable=False, default=0.0)
+    volatility = Column(Float, nullable=False, default=0.0)
+    sharpe = Column(Float, nullable=False, default=0.0)
+    sortino = Column(Float, nullable=False, default=0.0)
+    annualized_return = Column(Float, nullable=False, default=0.0)
+    annualized_volatility = Column(Float, nullable=False, default=0.0)
+    max_drawdown = Column(Float, nullable=False, default=0.0)
+    max_drawdown_duration = Column(Integer, nullable=False, default=0)
+    calmar = Column(Float, nullable=False, default=0.0)
+    hit_ratio = Column(Float, nullable=False, default=0.0)
+    n = Column(Integer, nullable=False, default=0)
+    benchmark = Column(String(20), nullable=True)
+    alpha = Column(Float, nullable=True)
+    beta = Column(Float, nullable=True)
+    tracking_error = Column(Float, nullable=True)
+    information_ratio = Column(Float, nullable=True)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    fund = relationship("Fund", back_populates="metrics")
+
+class Benchmark(Base):
+    """
+    Índice de referência (ex: CDI, Ibovespa) carregado de arquivo local.
+
+    Campos:
+        id (int): Identificador único.
+        code (str): Código do índice (nome do arquivo, ex: "CDI").
+        source_hash (str): Hash do arquivo carregado (evita recarregar o mesmo conteúdo).
+        updated_at (datetime): Última carga; serve de versão para o cache em memória.
+
+    Relacionamentos:
+        history: Valores do índice por data.
+    """
+    __tablename__ = "benchmarks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String(20), unique=True, index=True, nullable=False)
+    source_hash = Column(String(64), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    history = relationship("BenchmarkHistory", back_populates="benchmark", cascade="all, delete-orphan")
+
+class BenchmarkHistory(Base):
+    """
+    Valor de um índice de referência em uma data.
+
+    Campos:
+        id (int): Identificador único.
+        benchmark_id (int): ID do índice (chave estrangeira).
+        date (datetime): Data.
+        value (float): Número-índice (taxas diárias são acumuladas na carga).
+
+    Relacionamentos:
+        benchmark: Referência ao índice.
+    """
+    __tablename__ = "benchmark_history"
+    __table_args__ = (UniqueConstraint("benchmark_id", "date", name="uq_benchmark_history_benchmark_date"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    benchmark_id = Column(Integer, ForeignKey("benchmarks.id", ondelete="CASCADE"), nullable=False)
+    date = Column(DateTime, nullable=False)
+    value = Column(Float, nullable=False)
+
+    benchmark = relationship("Benchmark", back_populates="history")
+
 class Favorite(Base):
     """
     Associação entre usuário e fundo favoritado.
@@ -140,3 +335,46 @@ class Favorite(Base):
 
     user = relationship("User", back_populates="favorites")
     fund = relationship("Fund")
+
+class SourceState(Base):
+    """
+    Estado da última ingestão bem-sucedida de um arquivo de origem da CVM.
+
+    Campos:
+        id (int): Identificador único.
+        source (str): URL ou caminho do arquivo.
+        etag (str): ETag devolvido pelo servidor.
+        last_modified (str): Last-Modified do servidor (ou mtime/tamanho do arquivo local).
+        content_hash (str): SHA-256 do conteúdo processado. Se cotas do arquivo
+            foram ignoradas por CNPJ desconhecido, é o hash combinado com a
+            versão do cadastro (crud.fund_keyed_hash) e ETag/Last-Modified
+            não são gravados, para o arquivo voltar quando o cadastro mudar.
+        updated_at (datetime): Data da última ingestão.
+    """
+    __tablename__ = "ingestion_sources"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(500), unique=True, nullable=False)
+    etag = Column(String(200), nullable=True)
+    last_modified = Column(String(100), nullable=True)
+    content_hash = Column(String(64), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class JobRun(Base):
+    """
+    Última execução concluída de um job agendado (ex: ingestão da CVM).
+
+    Cada worker agenda os jobs por conta própria: o lock evita execuções
+    simultâneas e este registro evita que os demais workers repitam, no
+    mesmo intervalo, um job que outro processo acabou de concluir.
+
+    Campos:
+        name (str): Nome do job.
+        started_at (datetime): Início da última execução concluída.
+        finished_at (datetime): Fim da última execução concluída.
+    """
+    __tablename__ = "job_runs"
+
+    name = Column(String(100), primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=False)
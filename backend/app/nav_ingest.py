@@ -0,0 +1,596 @@
+import csv
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from queue import Empty
+
+from sqlalchemy.orm import Session
+
+from backend.app.crud import (
+    bulk_load_history, fund_keyed_hash, get_fund_id_map, get_fund_set_version, get_source_state, get_stats_last_dates,
+    purge_simulated_history, save_source_state, update_fund_stats,
+)
+from backend.app.cvm_ingest import (
+    CHUNK_SIZE, file_sha256, hash_chunks, is_remote, iter_decoded_lines, iter_source_chunks,
+    probe_source, source_unchanged,
+)
+from backend.app.db import SessionLocal
+from backend.app.progress import progress
+
+# Informe diário da CVM: um arquivo por mês com a cota de cada fundo por dia
+CVM_INF_DIARIO_URL = "https://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/"
+
+# diretório local, URL base (ex: CVM_INF_DIARIO_URL) ou arquivo único; vazio desativa a etapa
+CVM_INF_DIARIO_SOURCE = os.getenv("CVM_INF_DIARIO_SOURCE", "")
+
+# quantos meses (a partir do atual) baixar quando a origem é a URL base
+CVM_INF_DIARIO_MONTHS = int(os.getenv("CVM_INF_DIARIO_MONTHS", "1"))
+
+# processos usados para interpretar os arquivos; 0 = um por CPU, 1 = sequencial
+CVM_INGEST_WORKERS = int(os.getenv("CVM_INGEST_WORKERS", "0"))
+
+# cotas por lote compacto enviado pelos processos de parsing
+NAV_BATCH_SIZE = 50_000
+
+# lotes de cada arquivo que podem aguardar o escritor; com a fila cheia o worker espera
+NAV_QUEUE_BATCHES = 4
+
+NAV_FILE_RE = re.compile(r"inf_diario_fi_(\d{4})(\d{2})\.(csv|zip)$")
+
+# o layout mudou em 2024 (CVM 175): aceitamos os dois nomes de coluna
+CNPJ_COLUMNS = ("CNPJ_FUNDO", "CNPJ_FUNDO_CLASSE")
+
+
+def normalize_cnpj(value: str) -> str:
+    """
+    Remove a máscara de um CNPJ, mantendo apenas os dígitos.
+
+    Args:
+        value (str): CNPJ com ou sem pontuação.
+
+    Returns:
+        str: Os 14 dígitos do CNPJ.
+    """
+    return "".join(ch for ch in value if ch.isdigit())
+
+
+def list_nav_files(source: str = CVM_INF_DIARIO_SOURCE, months: int = CVM_INF_DIARIO_MONTHS):
+    """
+    Lista os arquivos do informe diário a processar.
+
+    Args:
+        source (str): Diretório local, URL base da CVM ou um arquivo específico.
+        months (int): Meses mais recentes a considerar quando a origem é a URL base.
+
+    Returns:
+        list: Caminhos ou URLs dos arquivos, em ordem cronológica.
+    """
+    if not source:
+        return []
+
+    if is_remote(source):
+        if NAV_FILE_RE.search(source):
+            return [source]
+        today = date.today()
+        refs = []
+        for i in range(months - 1, -1, -1):
+            year, month = divmod(today.year * 12 + today.month - 1 - i, 12)
+            refs.append(f"{source.rstrip('/')}/inf_diario_fi_{year}{month + 1:02d}.zip")
+        return refs
+
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if NAV_FILE_RE.search(name))
+        return [os.path.join(source, name) for name in names]
+
+    return [source]
+
+
+def file_month_range(ref: str):
+    """
+    Extrai do nome do arquivo o intervalo [início do mês, início do mês seguinte).
+
+    Args:
+        ref (str): Caminho ou URL de um arquivo inf_diario_fi_AAAAMM.
+
+    Returns:
+        tuple | None: (início, fim) como datetime, ou None se o nome não seguir o padrão.
+    """
+    match = NAV_FILE_RE.search(ref)
+    if not match:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def _iter_zip_lines(file):
+    with zipfile.ZipFile(file) as zf:
+        for member in zf.namelist():
+            if not member.lower().endswith(".csv"):
+                continue
+            with zf.open(member) as fh:
+                yield from iter_decoded_lines(iter(lambda: fh.read(CHUNK_SIZE), b""))
+
+
+def iter_nav_file_lines(ref: str, digest=None):
+    """
+    Percorre as linhas de um arquivo do informe diário (CSV ou ZIP), em streaming.
+
+    ZIPs remotos são baixados em blocos para um arquivo temporário, pois o
+    formato exige acesso aleatório ao índice central.
+
+    Args:
+        ref (str): Caminho ou URL do arquivo.
+        digest: Objeto de hashlib atualizado com o conteúdo bruto (opcional).
+
+    Yields:
+        str: Linhas decodificadas do CSV.
+    """
+    chunks = iter_source_chunks(ref)
+    if digest is not None:
+        chunks = hash_chunks(chunks, digest)
+
+    if not ref.lower().endswith(".zip"):
+        yield from iter_decoded_lines(chunks)
+        return
+
+    if not is_remote(ref):
+        if digest is not None:
+            for _ in chunks:
+                pass
+        yield from _iter_zip_lines(ref)
+        return
+
+    with tempfile.TemporaryFile() as tmp:
+        for chunk in chunks:
+            tmp.write(chunk)
+        tmp.seek(0)
+        yield from _iter_zip_lines(tmp)
+
+
+def iter_nav_rows(ref: str, digest=None):
+    """
+    Extrai (CNPJ, data, cota) de um arquivo do informe diário.
+
+    Args:
+        ref (str): Caminho ou URL do arquivo.
+        digest: Objeto de hashlib atualizado com o conteúdo bruto (opcional).
+
+    Yields:
+        tuple: (cnpj apenas com dígitos, datetime, nav).
+
+    Raises:
+        ValueError: Se o cabeçalho não tiver nenhuma das colunas de CNPJ.
+    """
+    reader = csv.reader(iter_nav_file_lines(ref, digest), delimiter=';')
+    header = next(reader, None)
+    if not header:
+        return
+
+    cnpj_col = next((header.index(col) for col in CNPJ_COLUMNS if col in header), None)
+    if cnpj_col is None:
+        raise ValueError(f"{ref}: coluna de CNPJ ausente no cabeçalho (esperada uma de {', '.join(CNPJ_COLUMNS)})")
+    date_col = header.index("DT_COMPTC")
+    nav_col = header.index("VL_QUOTA")
+    width = max(cnpj_col, date_col, nav_col)
+
+    for row in reader:
+        if len(row) <= width:
+            continue
+        try:
+            nav = float(row[nav_col])
+            day = datetime.fromisoformat(row[date_col])
+        except ValueError:
+            continue
+        if nav > 0:
+            yield normalize_cnpj(row[cnpj_col]), day, nav
+
+
+def parse_nav_file(ref: str, queue, batch_size: int = NAV_BATCH_SIZE):
+    """
+    Interpreta um arquivo do informe diário e envia os lotes ao escritor (executa nos workers).
+
+    Cada lote guarda o CNPJ como inteiro, a data como ordinal e a cota como
+    double em arrays tipados, o que reduz o custo de enviá-los ao processo
+    principal. Os lotes vão para `queue` assim que enchem, como
+    ("batch", lote); a fila é limitada, então o worker espera enquanto o
+    escritor não consome. No fim envia ("done", estatísticas) ou, se falhar,
+    ("error", mensagem).
+
+    Args:
+        ref (str): Caminho ou URL do arquivo.
+        queue: Fila (multiprocessing) do arquivo, lida pelo escritor.
+        batch_size (int): Quantidade de cotas por lote.
+
+    Returns:
+        dict: "pid", "rows", "seconds" e "content_hash".
+    """
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    cnpjs, days, navs = array("q"), array("i"), array("d")
+    rows = 0
+    try:
+        for cnpj, day, nav in iter_nav_rows(ref, digest):
+            if not cnpj:
+                continue
+            cnpjs.append(int(cnpj))
+            days.append(day.toordinal())
+            navs.append(nav)
+            if len(navs) >= batch_size:
+                queue.put(("batch", (cnpjs, days, navs)))
+                rows += len(navs)
+                cnpjs, days, navs = array("q"), array("i"), array("d")
+        if navs:
+            queue.put(("batch", (cnpjs, days, navs)))
+            rows += len(navs)
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+        raise
+    stats = {
+        "pid": os.getpid(),
+        "rows": rows,
+        "seconds": time.perf_counter() - started,
+        "content_hash": digest.hexdigest(),
+    }
+    queue.put(("done", stats))
+    return stats
+
+
+def iter_batch_rows(batches):
+    """
+    Expande lotes compactos de parse_nav_file em tuplas (cnpj, datetime, nav).
+
+    Args:
+        batches (list): Lotes (cnpjs, dias, cotas).
+
+    Yields:
+        tuple: (cnpj como inteiro, datetime, nav).
+    """
+    for cnpjs, days, navs in batches:
+        for cnpj, day, nav in zip(cnpjs, days, navs):
+            yield cnpj, datetime.fromordinal(day), nav
+
+
+def load_nav_rows(db: Session, ref: str, rows, fund_ids: dict, staging=None):
+    """
+    Carrega as cotas de um arquivo do informe diário em `fund_history` em uma transação.
+
+    Cotas já existentes do mesmo mês para os fundos presentes no arquivo são
+    substituídas, de modo que reprocessar um mês não duplica o histórico.
+    O histórico simulado dos fundos que recebem cotas reais é removido.
+    Os acumuladores de métricas (`fund_stats`) são atualizados na mesma transação.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        ref (str): Caminho ou URL de origem (define o mês substituído).
+        rows (iterable): Tuplas (cnpj, datetime, nav).
+        fund_ids (dict): CNPJ, no mesmo formato de `rows` → id do fundo.
+        staging (StagedLoad | None): Se informado, as cotas vão para o staging
+            e substituem as existentes (por fundo e dia, e no mês do arquivo)
+            só no merge.
+
+    Returns:
+        dict: Contadores "loaded" (cotas gravadas) e "skipped" (CNPJs desconhecidos).
+    """
+    month = file_month_range(ref)
+    if staging is not None:
+        return staging.stage_history(db, rows, fund_ids, replace=month)
+
+    seen = set()
+    skipped = 0
+    last_dates = get_stats_last_dates(db)
+    # cotas posteriores à última contabilizada só estendem a série e entram nos
+    # acumuladores em O(1) (o arquivo do mês corrente é republicado a cada dia
+    # com um dia a mais); só fundos com cotas já contabilizadas inseridas,
+    # alteradas ou removidas (informados pelo merge) são recalculados
+    appended = {}
+    rebuild = set()
+
+    def resolved():
+        nonlocal skipped
+        for cnpj, day, nav in rows:
+            fund_id = fund_ids.get(cnpj)
+            if fund_id is None:
+                skipped += 1
+                continue
+            seen.add(fund_id)
+            last_date = last_dates.get(fund_id)
+            if last_date is None:
+                rebuild.add(fund_id)
+            elif day > last_date:
+                # fundo e dia repetidos: vale a última, como no merge
+                appended[(fund_id, day)] = nav
+            yield fund_id, day, nav
+
+    try:
+        loaded = bulk_load_history(db, resolved(), replace=month, changed_funds=rebuild)
+        # fundos que tinham histórico simulado têm os acumuladores recalculados
+        rebuild |= purge_simulated_history(db, seen)
+        update_fund_stats(
+            db, [(fund_id, day, nav) for (fund_id, day), nav in appended.items() if fund_id not in rebuild],
+            rebuild=rebuild,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"loaded": loaded, "skipped": skipped}
+
+
+def load_nav_file(db: Session, ref: str, fund_ids: dict, staging=None):
+    """
+    Interpreta e carrega um arquivo do informe diário no processo atual.
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        ref (str): Caminho ou URL do arquivo.
+        fund_ids (dict): CNPJ (apenas dígitos) → id do fundo.
+        staging (StagedLoad | None): Staging de destino, se houver.
+
+    Returns:
+        dict: Contadores "loaded" e "skipped" e o "content_hash" do arquivo.
+    """
+    digest = hashlib.sha256()
+    stats = load_nav_rows(db, ref, iter_nav_rows(ref, digest), fund_ids, staging)
+    stats["content_hash"] = digest.hexdigest()
+    return stats
+
+
+def _mark_loaded(db: Session, staging, ref: str, etag: str, last_modified: str, content_hash: str, skipped: int = 0):
+    # com staging, a origem só é marcada como processada na transação do merge
+    if staging is not None:
+        staging.defer_source_state(ref, etag, last_modified, content_hash, nav=True)
+    elif skipped:
+        # cotas de CNPJs fora do cadastro: o arquivo volta a ser processado quando o cadastro mudar
+        save_source_state(db, ref, None, None, fund_keyed_hash(content_hash, get_fund_set_version(db)))
+    else:
+        save_source_state(db, ref, etag, last_modified, content_hash)
+
+
+def _already_loaded(state, content_hash: str, fund_version: str) -> bool:
+    # mesmo conteúdo, e o cadastro não mudou se cotas foram ignoradas na última carga
+    if state is None or not state.content_hash or fund_version is None:
+        return False
+    return state.content_hash == fund_keyed_hash(content_hash, fund_version)
+
+
+def _fund_version(db: Session, staging=None):
+    # com fundos novos no staging o cadastro muda no merge: nenhuma versão anterior vale
+    if staging is not None and staging.has_new_funds(db):
+        return None
+    return get_fund_set_version(db)
+
+
+def pending_nav_files(db: Session, refs, fund_version: str = None):
+    """
+    Filtra os arquivos que mudaram desde a última ingestão bem-sucedida.
+
+    Meses antigos do informe diário raramente são republicados, então na
+    maioria das execuções só o mês corrente precisa ser reprocessado.
+    Arquivos com cotas ignoradas por CNPJ desconhecido voltam quando o
+    cadastro de fundos muda (ver models.SourceState).
+
+    Args:
+        db (Session): Sessão do banco de dados.
+        refs (list): Arquivos candidatos.
+        fund_version (str | None): Versão do cadastro (ver _fund_version).
+
+    Returns:
+        list: Tuplas (ref, etag, last_modified, content_hash conhecido ou None).
+    """
+    pending = []
+    for ref in refs:
+        try:
+            etag, last_modified, _ = probe_source(ref)
+        except Exception as e:
+            logging.warning(f"[nav] Não foi possível consultar {ref}: {e}")
+            continue
+
+        state = get_source_state(db, ref)
+        if source_unchanged(state, etag, last_modified):
+            logging.info(f"[nav] {ref} inalterado desde a última ingestão. Pulando.")
+            continue
+
+        content_hash = None
+        if not is_remote(ref):
+            content_hash = file_sha256(ref)
+            if state and state.content_hash == content_hash:
+                save_source_state(db, ref, etag, last_modified, content_hash)
+                logging.info(f"[nav] {ref} com conteúdo idêntico ao já carregado. Pulando.")
+                continue
+            if _already_loaded(state, content_hash, fund_version):
+                logging.info(f"[nav] {ref} com conteúdo idêntico e cadastro inalterado. Pulando.")
+                continue
+        pending.append((ref, etag, last_modified, content_hash))
+    return pending
+
+
+class _UnchangedFile(Exception):
+    """O arquivo lido tem o mesmo conteúdo já carregado: a carga é desfeita."""
+
+
+def _iter_queued_rows(queue, future, done: dict, unchanged):
+    """
+    Expande os lotes de um arquivo à medida que o worker os envia.
+
+    Ao receber o fim do arquivo, guarda as estatísticas em `done` e, se
+    `unchanged(content_hash)` for verdadeiro, levanta _UnchangedFile antes
+    do commit de quem consome.
+    """
+    while True:
+        try:
+            kind, payload = queue.get(timeout=1)
+        except Empty:
+            # worker encerrado sem enviar o fim (ex: processo morto)
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+            continue
+        if kind == "batch":
+            yield from iter_batch_rows([payload])
+        elif kind == "error":
+            raise RuntimeError(payload)
+        else:
+            done.update(payload)
+            if unchanged(payload["content_hash"]):
+                raise _UnchangedFile()
+            return
+
+
+def _drain_queue(queue, future):
+    """Descarta os lotes restantes de um arquivo abandonado para liberar o worker."""
+    while not future.done():
+        try:
+            queue.get(timeout=1)
+        except Empty:
+            pass
+
+
+def _run_parallel(session: Session, pending, fund_ids: dict, workers: int, staging=None, fund_version: str = None,
+                  failed: list = None):
+    """
+    Distribui os arquivos entre processos e grava os lotes em um único escritor.
+
+    Cada arquivo tem uma fila limitada (NAV_QUEUE_BATCHES lotes): os workers
+    enviam os lotes à medida que os interpretam e o escritor grava os
+    arquivos na ordem de `pending`, consumindo a fila do arquivo atual
+    enquanto os demais continuam sendo interpretados. A memória do processo
+    principal fica limitada a alguns lotes por worker.
+
+    Args:
+        session (Session): Sessão usada pelo escritor (processo atual).
+        pending (list): Saída de pending_nav_files.
+        fund_ids (dict): CNPJ (apenas dígitos) → id do fundo.
+        workers (int): Quantidade de processos de parsing.
+        staging (StagedLoad | None): Staging de destino, se houver.
+        fund_version (str | None): Versão do cadastro (ver _fund_version).
+        failed (list | None): Se informada, recebe as refs dos arquivos que falharam.
+
+    Returns:
+        dict: Estatísticas por pid: "files", "rows" e "seconds" de parsing.
+    """
+    ids_by_int = {int(cnpj): fund_id for cnpj, fund_id in fund_ids.items()}
+    per_worker = {}
+
+    # spawn evita herdar locks de threads do scheduler via fork
+    ctx = multiprocessing.get_context("spawn")
+    # o Manager fecha antes do pool: se o escritor falhar, os workers bloqueados na fila são liberados
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool, ctx.Manager() as manager:
+        # a fila do executor é FIFO: quando o escritor chega a um arquivo, ele já está em um worker
+        queues = [manager.Queue(NAV_QUEUE_BATCHES) for _ in pending]
+        futures = [pool.submit(parse_nav_file, item[0], queue) for item, queue in zip(pending, queues)]
+        for (ref, etag, last_modified, _), queue, future in zip(pending, queues, futures):
+            progress.advance()
+            state = get_source_state(session, ref)
+
+            # URLs sem ETag/Last-Modified confiáveis: o hash só é conhecido no fim do arquivo
+            def unchanged(content_hash):
+                return (state is not None and state.content_hash == content_hash) or \
+                    _already_loaded(state, content_hash, fund_version)
+
+            done = {}
+            try:
+                rows = _iter_queued_rows(queue, future, done, unchanged)
+                stats = load_nav_rows(session, ref, rows, ids_by_int, staging)
+                progress.add_rows(stats["loaded"])
+                _mark_loaded(session, staging, ref, etag, last_modified, done["content_hash"], stats["skipped"])
+            except _UnchangedFile:
+                session.rollback()
+                if state is not None and state.content_hash == done["content_hash"]:
+                    save_source_state(session, ref, etag, last_modified, done["content_hash"])
+                    logging.info(f"[nav] {ref} com conteúdo idêntico ao já carregado. Pulando.")
+                else:
+                    logging.info(f"[nav] {ref} com conteúdo idêntico e cadastro inalterado. Pulando.")
+                continue
+            except Exception as e:
+                session.rollback()
+                _drain_queue(queue, future)
+                logging.error(f"[nav] Erro ao carregar {ref}: {e}")
+                if failed is not None:
+                    failed.append(ref)
+                continue
+            finally:
+                if done:
+                    worker = per_worker.setdefault(done["pid"], {"files": 0, "rows": 0, "seconds": 0.0})
+                    worker["files"] += 1
+                    worker["rows"] += done["rows"]
+                    worker["seconds"] += done["seconds"]
+
+            logging.info(f"[nav] {ref}: {stats['loaded']} cotas carregadas, {stats['skipped']} ignoradas")
+
+    for pid, worker in sorted(per_worker.items()):
+        rate = worker["rows"] / worker["seconds"] if worker["seconds"] else 0.0
+        logging.info(
+            f"[nav] worker {pid}: {worker['files']} arquivos, {worker['rows']} cotas "
+            f"em {worker['seconds']:.1f}s ({rate:,.0f} cotas/s)"
+        )
+    return per_worker
+
+
+def run_nav_ingestion(source: str = CVM_INF_DIARIO_SOURCE, months: int = CVM_INF_DIARIO_MONTHS,
+                      workers: int = CVM_INGEST_WORKERS, staging=None):
+    """
+    Etapa de ingestão das cotas diárias (informe diário da CVM).
+
+    Arquivos que não mudaram desde a última ingestão são ignorados. Com mais
+    de um worker e mais de um arquivo pendente, o parsing roda em um
+    ProcessPoolExecutor e o processo atual apenas grava os lotes no banco.
+
+    Args:
+        source (str): Diretório local, URL base da CVM ou um arquivo específico.
+        months (int): Meses mais recentes a considerar quando a origem é a URL base.
+        workers (int): Processos de parsing (0 = um por CPU, 1 = sequencial).
+        staging (StagedLoad | None): Se informado, as cotas vão para o staging.
+
+    Raises:
+        RuntimeError: Se algum arquivo falhou. Os demais continuam sendo
+        carregados, mas a execução é marcada como falha e o merge do staging
+        não acontece.
+    """
+    refs = list_nav_files(source, months)
+    if not refs:
+        logging.info("[nav] Nenhuma origem de informe diário configurada. Pulando.")
+        return
+
+    started = time.perf_counter()
+    failed = []
+    session: Session = SessionLocal()
+    try:
+        fund_version = _fund_version(session, staging)
+        pending = pending_nav_files(session, refs, fund_version)
+        if not pending:
+            logging.info("[nav] Nenhum arquivo novo ou alterado.")
+            return
+
+        progress.begin_phase("cotas", total=len(pending), unit="arquivos")
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        fund_ids = {normalize_cnpj(cnpj): fund_id for cnpj, fund_id in get_fund_id_map(session).items() if cnpj}
+        fund_ids.pop("", None)
+        if workers > 1:
+            _run_parallel(session, pending, fund_ids, workers, staging, fund_version, failed)
+        else:
+            for ref, etag, last_modified, _ in pending:
+                progress.advance()
+                try:
+                    stats = load_nav_file(session, ref, fund_ids, staging)
+                    progress.add_rows(stats["loaded"])
+                    _mark_loaded(session, staging, ref, etag, last_modified, stats["content_hash"], stats["skipped"])
+                    logging.info(f"[nav] {ref}: {stats['loaded']} cotas carregadas, {stats['skipped']} ignoradas")
+                except Exception as e:
+                    session.rollback()
+                    logging.error(f"[nav] Erro ao carregar {ref}: {e}")
+                    failed.append(ref)
+    finally:
+        session.close()
+    logging.info(f"[nav] {len(pending)} arquivos processados em {time.perf_counter() - started:.1f}s ({workers} workers)")
+    if failed:
+        raise RuntimeError(f"{len(failed)} de {len(pending)} arquivos com erro: {', '.join(failed)}")
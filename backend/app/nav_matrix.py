@@ -0,0 +1,258 @@
+import logging
+import os
+import struct
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# arquivo com a matriz de cotas compartilhada pelos workers do host; vazio desativa
+NAV_MATRIX_PATH = os.getenv("NAV_MATRIX_PATH", os.path.join(tempfile.gettempdir(), "fundmatch-nav-matrix.bin"))
+
+# folga da versão exportada, em segundos: deve cobrir a transação de escrita mais longa em
+# `fund_stats` (updated_at é definido na escrita, não no commit) e a diferença entre os relógios dos hosts
+NAV_MATRIX_VERSION_MARGIN = timedelta(seconds=float(os.getenv("NAV_MATRIX_VERSION_MARGIN_SECONDS", "120")))
+
+# cabeçalho: assinatura, fundos, datas, versão do histórico (µs desde 1970, -1 sem versão),
+# bytes dos CNPJs; completado com zeros até 64 bytes
+MAGIC = b"FMNAVMX1"
+HEADER = struct.Struct("<8sqqqq")
+HEADER_SIZE = 64
+
+ID_DTYPE = np.dtype("<i8")
+DATE_DTYPE = np.dtype("<i8")
+NAV_DTYPE = np.dtype("<f8")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def version_key(version: datetime) -> int:
+    """
+    Converte a versão do histórico (maior updated_at de `fund_stats`) em inteiro.
+
+    Args:
+        version (datetime | None): Versão do histórico.
+
+    Returns:
+        int: Microssegundos desde 1970-01-01 (-1 se não houver versão).
+    """
+    if version is None:
+        return -1
+    return (version - _EPOCH) // timedelta(microseconds=1)
+
+
+def write_nav_matrix(path: str, fund_ids, cnpjs, dates, blocks, version: datetime = None):
+    """
+    Grava a matriz de cotas no arquivo lido pelos workers, com troca atômica.
+
+    O arquivo é escrito ao lado do destino e só então renomeado sobre ele
+    (os.replace): quem já mapeou a versão anterior continua lendo-a até
+    recarregar, e nenhum leitor vê um arquivo pela metade.
+
+    Layout: cabeçalho (64 bytes), ids dos fundos (int64), datas como
+    ordinais (int64), matriz fundos x datas (float64, por linha) e os
+    CNPJs na ordem das linhas (UTF-8, um por linha). Tudo little-endian
+    e alinhado em 8 bytes.
+
+    Args:
+        path (str): Caminho do arquivo.
+        fund_ids (np.ndarray): IDs dos fundos, em ordem crescente (linhas da matriz).
+        cnpjs (list): CNPJ de cada linha.
+        dates (np.ndarray): Datas como ordinais, em ordem crescente (colunas da matriz).
+        blocks (iterable): Blocos consecutivos de linhas da matriz (np.ndarray fundos x datas).
+        version (datetime | None): Versão do histórico usada na exportação.
+
+    Returns:
+        int: Tamanho do arquivo em bytes.
+    """
+    fund_ids = np.asarray(fund_ids, dtype=ID_DTYPE)
+    dates = np.asarray(dates, dtype=DATE_DTYPE)
+    cnpj_bytes = "\n".join(cnpjs).encode()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".nav-matrix-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            header = HEADER.pack(MAGIC, len(fund_ids), len(dates), version_key(version), len(cnpj_bytes))
+            fh.write(header.ljust(HEADER_SIZE, b"\0"))
+            fh.write(fund_ids.tobytes())
+            fh.write(dates.tobytes())
+            written = 0
+            for block in blocks:
+                block = np.ascontiguousarray(block, dtype=NAV_DTYPE)
+                if block.ndim != 2 or block.shape[1] != len(dates):
+                    raise ValueError("bloco da matriz com número de datas diferente do índice")
+                fh.write(block.tobytes())
+                written += block.shape[0]
+            if written != len(fund_ids):
+                raise ValueError(f"matriz com {written} linhas para {len(fund_ids)} fundos")
+            fh.write(cnpj_bytes)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.path.getsize(path)
+
+
+class NavMatrixSnapshot:
+    """
+    Uma versão do arquivo da matriz de cotas, mapeada somente leitura.
+
+    Os vetores são views do mapeamento (np.memmap): não há cópia, e as
+    páginas ficam no page cache do sistema, compartilhadas por todos os
+    processos do host que mapearam o mesmo arquivo.
+    """
+
+    def __init__(self, path: str):
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(raw) < HEADER_SIZE:
+            raise ValueError("arquivo da matriz de cotas truncado")
+        magic, n_funds, n_dates, version, cnpj_size = HEADER.unpack_from(raw[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError("arquivo da matriz de cotas com formato desconhecido")
+
+        ids_end = HEADER_SIZE + n_funds * ID_DTYPE.itemsize
+        dates_end = ids_end + n_dates * DATE_DTYPE.itemsize
+        matrix_end = dates_end + n_funds * n_dates * NAV_DTYPE.itemsize
+        if len(raw) != matrix_end + cnpj_size:
+            raise ValueError("arquivo da matriz de cotas truncado")
+
+        self.version = version
+        self.fund_ids = raw[HEADER_SIZE:ids_end].view(ID_DTYPE)
+        self.dates = raw[ids_end:dates_end].view(DATE_DTYPE)
+        self.matrix = raw[dates_end:matrix_end].view(NAV_DTYPE).reshape(n_funds, n_dates)
+        cnpjs = raw[matrix_end:].tobytes().decode().split("\n") if cnpj_size else []
+        self.rows_by_cnpj = {cnpj: row for row, cnpj in enumerate(cnpjs)}
+
+    def rows(self, fund_ids: np.ndarray):
+        """
+        Localiza as linhas de vários fundos.
+
+        Args:
+            fund_ids (np.ndarray): IDs dos fundos.
+
+        Returns:
+            np.ndarray | None: Linhas, na ordem de `fund_ids` (None se algum fundo não estiver no arquivo).
+        """
+        rows = np.searchsorted(self.fund_ids, fund_ids)
+        found = rows < len(self.fund_ids)
+        found[found] = self.fund_ids[rows[found]] == fund_ids[found]
+        return rows if found.all() else None
+
+    def load(self, fund_ids: np.ndarray, start: int = None, end: int = None):
+        """
+        Extrai a matriz de um conjunto de fundos, no formato de series_matrix.
+
+        Só ficam as datas em que algum dos fundos tem cota. Com fundos em
+        linhas consecutivas e sem datas a descartar, a matriz devolvida é
+        uma view somente leitura do arquivo; nos demais casos, só as linhas
+        e datas pedidas são copiadas.
+
+        Args:
+            fund_ids (np.ndarray): IDs dos fundos, em ordem crescente.
+            start (int | None): Primeira data incluída, como ordinal.
+            end (int | None): Última data incluída, como ordinal.
+
+        Returns:
+            tuple | None: (ids dos fundos, datas como ordinais, matriz de cotas),
+                ou None se algum fundo não estiver no arquivo.
+        """
+        rows = self.rows(fund_ids)
+        if rows is None:
+            return None
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+            block = self.matrix[rows[0]:rows[-1] + 1]
+        else:
+            block = self.matrix[rows]
+
+        lo = 0 if start is None else np.searchsorted(self.dates, start, side="left")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, end, side="right")
+        block = block[:, lo:hi]
+        keep = ~np.isnan(block).all(axis=0) if len(rows) else np.zeros(hi - lo, dtype=bool)
+        dates = np.asarray(self.dates[lo:hi])
+        if keep.all():
+            return fund_ids, dates, np.asarray(block)
+        return fund_ids, dates[keep], block[:, keep]
+
+
+class SharedNavMatrix:
+    """
+    Leitor do arquivo da matriz de cotas, compartilhado pelas threads do worker.
+
+    Mapeia o arquivo na primeira leitura e o remapeia quando ele é trocado
+    (outro inode, tamanho ou mtime); a troca é detectada com um os.stat por
+    leitura. Sem arquivo (ou com arquivo inválido) as leituras devolvem
+    None e quem chama usa outra fonte.
+    """
+
+    def __init__(self, path: str = NAV_MATRIX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._key = None
+        self._snapshot = None
+
+    def snapshot(self):
+        """
+        Devolve a versão atual do arquivo, remapeando se ele foi trocado.
+
+        Returns:
+            NavMatrixSnapshot | None: Arquivo mapeado, ou None se não houver.
+        """
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if key != self._key:
+                try:
+                    self._snapshot = NavMatrixSnapshot(self.path)
+                except (OSError, ValueError) as e:
+                    logging.warning(f"[nav_matrix] Arquivo da matriz de cotas ignorado ({e})")
+                    self._snapshot = None
+                self._key = key
+            return self._snapshot
+
+    def load(self, fund_ids: np.ndarray, version: datetime = None, start: int = None, end: int = None):
+        """
+        Lê a matriz de um conjunto de fundos, se o arquivo estiver atualizado para eles.
+
+        O arquivo serve se contiver todos os fundos e tiver sido exportado
+        depois da última mudança no histórico deles, isto é, se `version`
+        (maior updated_at de `fund_stats` dos fundos) não for mais nova
+        que a versão gravada na exportação.
+
+        Args:
+            fund_ids (np.ndarray): IDs dos fundos, em ordem crescente.
+            version (datetime | None): Versão do histórico desses fundos.
+            start (int | None): Primeira data incluída, como ordinal.
+            end (int | None): Última data incluída, como ordinal.
+
+        Returns:
+            tuple | None: (ids dos fundos, datas como ordinais, matriz de cotas), ou None.
+        """
+        snapshot = self.snapshot()
+        if snapshot is None or version_key(version) > snapshot.version:
+            return None
+        return snapshot.load(fund_ids, start, end)
+
+    def version(self):
+        """
+        Versão do histórico do arquivo atual.
+
+        Returns:
+            int | None: Microssegundos desde 1970-01-01 (como version_key), ou None sem arquivo.
+        """
+        snapshot = self.snapshot()
+        return snapshot.version if snapshot is not None else None
+
+
+# leitor usado pelo crud (métricas, correlação e carteiras)
+shared_nav_matrix = SharedNavMatrix()
@@ -0,0 +1,403 @@
+import numpy as np
+
+from backend.app.metrics import PERIODS_PER_YEAR, pairwise_covariance
+
+# restrições por perfil de risco
+#   risk_aversion: peso da variância no mean-variance (maior = carteira mais defensiva)
+#   max_weight: fração máxima do valor em um único fundo
+PROFILE_SETTINGS = {
+    "conservador": {"risk_aversion": 20.0, "max_weight": 0.10},
+    "moderado": {"risk_aversion": 6.0, "max_weight": 0.20},
+    "arrojado": {"risk_aversion": 2.0, "max_weight": 0.35},
+}
+
+METHODS = ("mean_variance", "risk_parity")
+
+
+def estimate_moments(navs, min_periods: int = 20, periods_per_year: int = PERIODS_PER_YEAR):
+    """
+    Estima retorno esperado e covariância anualizados a partir da matriz de cotas.
+
+    Usa retornos diários entre datas consecutivas em que o fundo tem cota e
+    covariância pairwise-complete; pares sem dias em comum ficam com
+    covariância zero.
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas alinhadas por data, com NaN onde não há cota.
+        min_periods (int): Mínimo de retornos para o fundo ser considerado.
+        periods_per_year (int): Períodos por ano para anualização.
+
+    Returns:
+        tuple: (máscara dos fundos usados, retornos esperados, matriz de covariância),
+            os dois últimos só com os fundos usados.
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = navs[:, 1:] / navs[:, :-1] - 1.0
+    returns[~np.isfinite(returns)] = np.nan
+
+    usable = (~np.isnan(returns)).sum(axis=1) >= min_periods
+    if not usable.any():
+        return usable, np.zeros(0), np.zeros((0, 0))
+
+    mu = np.nanmean(returns[usable], axis=1) * periods_per_year
+    cov, _, _ = pairwise_covariance(navs[usable])
+    cov = np.nan_to_num(cov, nan=0.0) * periods_per_year
+    # covariâncias pairwise podem não ser positivas semidefinidas: corta os autovalores negativos
+    values, vectors = np.linalg.eigh((cov + cov.T) / 2)
+    floor = 1e-6 * max(np.trace(cov) / len(mu), 1e-12)
+    cov = (vectors * np.maximum(values, floor)) @ vectors.T
+    return usable, mu, cov
+
+
+def project_capped_simplex(v: np.ndarray, cap: float) -> np.ndarray:
+    """
+    Projeta um vetor no conjunto {w : soma(w) = 1, 0 <= w <= cap}.
+
+    Args:
+        v (np.ndarray): Vetor a projetar.
+        cap (float): Peso máximo por item (ajustado para pelo menos 1/n).
+
+    Returns:
+        np.ndarray: Projeção euclidiana de `v`.
+    """
+    cap = max(cap, 1.0 / len(v))
+    low, high = v.min() - cap, v.max()
+    # busca binária no deslocamento tau: soma(clip(v - tau, 0, cap)) é decrescente em tau
+    for _ in range(100):
+        tau = (low + high) / 2
+        total = np.clip(v - tau, 0.0, cap).sum()
+        if abs(total - 1.0) < 1e-12:
+            break
+        if total > 1.0:
+            low = tau
+        else:
+            high = tau
+    w = np.clip(v - tau, 0.0, cap)
+    return w / w.sum()
+
+
+def mean_variance_weights(mu: np.ndarray, cov: np.ndarray, risk_aversion: float, max_weight: float,
+                          start: np.ndarray = None, max_iter: int = 2000, tol: float = 1e-8):
+    """
+    Maximiza mu'w - (risk_aversion / 2) w'Σw com pesos no simplex limitado.
+
+    Gradiente projetado acelerado (FISTA) com passo 1/L, onde
+    L = risk_aversion * maior autovalor de Σ.
+
+    Args:
+        mu (np.ndarray): Retornos esperados.
+        cov (np.ndarray): Matriz de covariância.
+        risk_aversion (float): Aversão ao risco.
+        max_weight (float): Peso máximo por fundo.
+        start (np.ndarray | None): Solução inicial (warm start).
+        max_iter (int): Máximo de iterações.
+        tol (float): Tolerância na variação dos pesos.
+
+    Returns:
+        tuple: (pesos, iterações usadas).
+    """
+    n = len(mu)
+    w = project_capped_simplex(start if start is not None else np.full(n, 1.0 / n), max_weight)
+    lipschitz = risk_aversion * np.linalg.eigvalsh(cov)[-1]
+    step = 1.0 / lipschitz if lipschitz > 0 else 1.0
+
+    z, momentum = w, 1.0
+    for iteration in range(1, max_iter + 1):
+        grad = mu - risk_aversion * (cov @ z)
+        new_w = project_capped_simplex(z + step * grad, max_weight)
+        if np.abs(new_w - w).max() < tol:
+            return new_w, iteration
+        if (z - new_w) @ (new_w - w) > 0:
+            # reinício adaptativo: o momento está indo contra a descida
+            momentum = 1.0
+        new_momentum = (1 + np.sqrt(1 + 4 * momentum * momentum)) / 2
+        z = new_w + ((momentum - 1) / new_momentum) * (new_w - w)
+        w, momentum = new_w, new_momentum
+    return w, max_iter
+
+
+def risk_parity_weights(cov: np.ndarray, max_weight: float, start: np.ndarray = None,
+                        max_iter: int = 100, tol: float = 1e-10):
+    """
+    Calcula pesos com contribuições de risco iguais (risk parity).
+
+    Resolve min 0.5 y'Σy - (1/n) soma(log y) pelo método de Newton com busca
+    linear (cada passo é um sistema linear n x n) e normaliza; o teto por
+    fundo é aplicado no final, por projeção.
+
+    Args:
+        cov (np.ndarray): Matriz de covariância.
+        max_weight (float): Peso máximo por fundo.
+        start (np.ndarray | None): Solução inicial (warm start).
+        max_iter (int): Máximo de iterações de Newton.
+        tol (float): Tolerância no decremento de Newton.
+
+    Returns:
+        tuple: (pesos, iterações usadas).
+    """
+    n = len(cov)
+    budget = np.full(n, 1.0 / n)
+    if start is not None and (start > 0).all():
+        # reescala o warm start para perto do ótimo de y
+        y = start / np.sqrt(start @ cov @ start)
+    else:
+        y = 1.0 / np.sqrt(np.diag(cov) * n)
+
+    def objective(v):
+        return 0.5 * v @ cov @ v - budget @ np.log(v)
+
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        grad = cov @ y - budget / y
+        hessian = cov + np.diag(budget / (y * y))
+        delta = np.linalg.solve(hessian, grad)
+        decrement = grad @ delta
+        if decrement / 2 < tol:
+            break
+        # mantém y > 0 e exige descida suficiente (Armijo)
+        t = 1.0
+        while (y - t * delta <= 0).any():
+            t /= 2
+        current = objective(y)
+        while objective(y - t * delta) > current - 0.25 * t * decrement and t > 1e-12:
+            t /= 2
+        y = y - t * delta
+
+    w = y / y.sum()
+    if w.max() > max_weight:
+        w = project_capped_simplex(w, max_weight)
+    return w, iteration
+
+
+def optimize_allocation(mu: np.ndarray, cov: np.ndarray, risk_profile: str, method: str = "mean_variance",
+                        start: np.ndarray = None):
+    """
+    Calcula os pesos da carteira para um perfil de risco.
+
+    Args:
+        mu (np.ndarray): Retornos esperados anualizados.
+        cov (np.ndarray): Covariância anualizada.
+        risk_profile (str): "conservador", "moderado" ou "arrojado".
+        method (str): "mean_variance" ou "risk_parity".
+        start (np.ndarray | None): Pesos de uma solução anterior (warm start).
+
+    Returns:
+        dict: "weights", "expected_return", "expected_volatility" e "iterations".
+    """
+    settings = PROFILE_SETTINGS[risk_profile]
+    if method == "risk_parity":
+        weights, iterations = risk_parity_weights(cov, settings["max_weight"], start)
+    else:
+        weights, iterations = mean_variance_weights(
+            mu, cov, settings["risk_aversion"], settings["max_weight"], start
+        )
+    return {
+        "weights": weights,
+        "expected_return": float(mu @ weights),
+        "expected_volatility": float(np.sqrt(max(weights @ cov @ weights, 0.0))),
+        "iterations": iterations,
+    }
+
+
+SIMULATION_METHODS = ("bootstrap", "normal")
+
+# percentis devolvidos nas faixas da simulação
+SIMULATION_PERCENTILES = (5, 25, 50, 75, 95)
+
+# máximo de dias com faixas calculadas (o restante da trajetória não é devolvido)
+SIMULATION_POINTS = 64
+
+
+def portfolio_returns(navs, weights: np.ndarray) -> np.ndarray:
+    """
+    Calcula os retornos diários de uma carteira com pesos fixos.
+
+    Em cada data, fundos sem retorno ficam de fora e os pesos dos demais são
+    renormalizados; datas sem nenhum retorno são descartadas.
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas alinhadas por data, com NaN onde não há cota.
+        weights (np.ndarray): Peso de cada fundo.
+
+    Returns:
+        np.ndarray: Retornos diários da carteira.
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = navs[:, 1:] / navs[:, :-1] - 1.0
+    valid = np.isfinite(returns)
+    weights = np.asarray(weights, dtype=np.float64)[:, None]
+    covered = (weights * valid).sum(axis=0)
+    total = (weights * np.where(valid, returns, 0.0)).sum(axis=0)
+    keep = covered > 0
+    return total[keep] / covered[keep]
+
+
+def simulate_portfolio(daily_returns: np.ndarray, amount: float, horizon: int, paths: int = 10_000,
+                       seed: int = 0, method: str = "bootstrap", percentiles=SIMULATION_PERCENTILES,
+                       points: int = SIMULATION_POINTS):
+    """
+    Projeta o valor de uma carteira por Monte Carlo.
+
+    Todas as trajetórias são sorteadas de uma vez em uma matriz
+    (dias x trajetórias): por bootstrap dos retornos diários históricos ou
+    por uma normal com a média e o desvio padrão dos log-retornos. As faixas
+    são calculadas só em até `points` dias igualmente espaçados, e sobre os
+    log-valores (exp é monotônica, então os percentis são os mesmos).
+
+    Args:
+        daily_returns (np.ndarray): Retornos diários históricos da carteira.
+        amount (float): Valor inicial.
+        horizon (int): Dias úteis projetados.
+        paths (int): Quantidade de trajetórias.
+        seed (int): Semente do gerador (mesma semente, mesmo resultado).
+        method (str): "bootstrap" ou "normal".
+        percentiles (tuple): Percentis das faixas.
+        points (int): Máximo de dias com faixas calculadas.
+
+    Returns:
+        dict: "days" (dias com faixas, terminando no horizonte), "bands"
+            (percentil → valores nesses dias) e "final" (média, percentis e
+            probabilidade de perda no último dia).
+    """
+    rng = np.random.default_rng(seed)
+    # log-retornos: a trajetória vira uma soma acumulada em vez de um produto
+    log_returns = np.log1p(np.maximum(np.asarray(daily_returns, dtype=np.float64), -0.999999))
+    # float32 e índices int32 para caber o dobro de trajetórias na mesma memória
+    if method == "normal":
+        sampled = rng.standard_normal(size=(horizon, paths), dtype=np.float32)
+        sampled *= np.float32(log_returns.std(ddof=1))
+        sampled += np.float32(log_returns.mean())
+    else:
+        index = rng.integers(0, len(log_returns), size=(horizon, paths), dtype=np.int32)
+        sampled = log_returns.astype(np.float32)[index]
+        del index
+    np.cumsum(sampled, axis=0, out=sampled)
+
+    days = np.unique(np.linspace(1, horizon, min(points, horizon)).round().astype(np.int64))
+    bands = amount * np.exp(np.percentile(sampled[days - 1], percentiles, axis=1).astype(np.float64))
+    final = amount * np.exp(sampled[-1].astype(np.float64))
+    return {
+        "days": days.tolist(),
+        "bands": {str(p): band.tolist() for p, band in zip(percentiles, bands)},
+        "final": {
+            "mean": float(final.mean()),
+            "percentiles": {str(p): float(band[-1]) for p, band in zip(percentiles, bands)},
+            "probability_of_loss": float((final < amount).mean()),
+        },
+    }
+
+
+# frequências de rebalanceamento → unidade do numpy.datetime64 que define o período
+REBALANCE_FREQUENCIES = {
+    "none": None,
+    "daily": "D",
+    "weekly": "W",
+    "monthly": "M",
+    "quarterly": "Q",
+    "yearly": "Y",
+}
+
+# ordinal (date.toordinal) de 1970-01-01, origem do numpy.datetime64
+_EPOCH_ORDINAL = 719163
+
+
+def rebalance_points(dates: np.ndarray, frequency: str) -> np.ndarray:
+    """
+    Identifica as datas de rebalanceamento: a primeira data de cada período.
+
+    Args:
+        dates (np.ndarray): Datas como ordinais (date.toordinal), em ordem crescente.
+        frequency (str): Chave de REBALANCE_FREQUENCIES.
+
+    Returns:
+        np.ndarray: Índices das datas de rebalanceamento (sempre inclui 0).
+    """
+    unit = REBALANCE_FREQUENCIES[frequency]
+    if unit is None or len(dates) == 0:
+        return np.zeros(min(len(dates), 1), dtype=np.int64)
+
+    ordinals = np.asarray(dates, dtype=np.int64)
+    if unit == "W":
+        # semanas de segunda a domingo: o ordinal 1 (0001-01-01) é uma segunda-feira;
+        # datetime64[W] alinharia as semanas a 1970-01-01, uma quinta-feira
+        periods = (ordinals - 1) // 7
+        return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+    days = (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]")
+    if unit == "Q":
+        periods = days.astype("datetime64[M]").astype(np.int64) // 3
+    else:
+        periods = days.astype(f"datetime64[{unit}]").astype(np.int64)
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+
+def backtest(navs, weights: np.ndarray, dates: np.ndarray, frequency: str = "monthly",
+             initial: float = 1.0):
+    """
+    Simula uma carteira com pesos-alvo fixos e rebalanceamento periódico.
+
+    Lacunas usam a última cota conhecida; fundos que ainda não têm cota em um
+    rebalanceamento ficam de fora dele e os pesos dos demais são
+    renormalizados. A carteira começa na primeira data com alguma cota. Como os pesos de cada período não dependem do valor da
+    carteira, o cálculo é todo vetorizado: dentro do período k o valor é
+    V_k * soma(alvo_k * P_t / P_k), e V_k é o produto acumulado dos
+    crescimentos dos períodos anteriores.
+
+    Args:
+        navs (np.ndarray): Matriz (fundos x datas) de cotas alinhadas por data, com NaN onde não há cota.
+        weights (np.ndarray): Peso-alvo de cada fundo.
+        dates (np.ndarray): Datas como ordinais, uma por coluna de `navs`.
+        frequency (str): Chave de REBALANCE_FREQUENCIES.
+        initial (float): Valor inicial da carteira.
+
+    Returns:
+        tuple: (curva de patrimônio, índices dos rebalanceamentos, giro total).
+    """
+    navs = np.atleast_2d(np.asarray(navs, dtype=np.float64))
+    weights = np.asarray(weights, dtype=np.float64)
+    has_price = (~np.isnan(navs[weights > 0])).any(axis=0)
+    if not has_price.any():
+        return np.full(navs.shape[1], np.nan), np.zeros(0, dtype=np.int64), 0.0
+
+    # antes da primeira cota não há carteira
+    first = int(np.argmax(has_price))
+    if first > 0:
+        equity, points, turnover = backtest(navs[:, first:], weights, np.asarray(dates)[first:], frequency, initial)
+        return np.r_[np.full(first, np.nan), equity], points + first, turnover
+
+    columns = navs.shape[1]
+    # forward fill: índice da última cota válida até cada coluna
+    valid = ~np.isnan(navs)
+    last = np.maximum.accumulate(np.where(valid, np.arange(columns), 0), axis=1)
+    prices = np.take_along_axis(navs, last, axis=1)
+    prices[~np.maximum.accumulate(valid, axis=1)] = np.nan
+
+    points = rebalance_points(dates, frequency)
+    base = prices[:, points]
+    targets = np.where(np.isnan(base), 0.0, weights[:, None])
+    totals = targets.sum(axis=0)
+    active = totals > 0
+    targets[:, active] /= totals[active]
+
+    # valor relativo de cada coluna dentro do seu período: soma(alvo * P_t / P_inicio)
+    segment = np.searchsorted(points, np.arange(columns), side="right") - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.where(targets[:, segment] > 0, prices / base[:, segment], 0.0)
+    growth_path = (targets[:, segment] * relative).sum(axis=0)
+
+    # crescimento de cada período até o próximo rebalanceamento
+    ends = np.r_[points[1:], columns - 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        end_relative = np.where(targets > 0, prices[:, ends] / base, 0.0)
+    growth = np.where(active, (targets * end_relative).sum(axis=0), 1.0)
+    start_value = initial * np.r_[1.0, np.cumprod(growth[:-1])]
+
+    equity = np.where(active[segment], start_value[segment] * growth_path, np.nan)
+
+    # giro: distância entre os pesos que derivaram no período e os novos alvos
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drifted = targets[:, :-1] * end_relative[:, :-1] / growth[:-1]
+    turnover = float(np.abs(targets[:, 1:] - drifted)[:, active[:-1] & active[1:]].sum()) / 2
+    return equity, points[active], turnover
@@ -0,0 +1,138 @@
+import threading
+import time
+from datetime import datetime
+
+
+class IngestionProgress:
+    """
+    Acompanha o andamento da ingestão em execução neste processo.
+
+    É atualizado pela thread do scheduler e lido pelo endpoint /ready, por
+    isso todo acesso passa por um lock.
+
+    Campos do snapshot:
+        phase (str): Etapa atual ("idle", "cadastro", "cotas", "done", "error", "skipped"...).
+        rows_processed (int): Linhas processadas desde o início da execução.
+        done / total / unit: Avanço da etapa atual (ex: bytes, arquivos).
+        eta_seconds (float | None): Estimativa para o fim da etapa atual.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phase = "idle"
+        self.rows_processed = 0
+        self.done = 0
+        self.total = None
+        self.unit = None
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.completed_runs = 0
+        self._phase_started = None
+
+    def start(self):
+        """Marca o início de uma nova execução."""
+        with self._lock:
+            self.phase = "starting"
+            self.rows_processed = 0
+            self.done = 0
+            self.total = None
+            self.unit = None
+            self.started_at = datetime.utcnow()
+            self.finished_at = None
+            self.error = None
+            self._phase_started = time.monotonic()
+
+    def begin_phase(self, phase: str, total=None, unit: str = None):
+        """
+        Inicia uma etapa da execução.
+
+        Args:
+            phase (str): Nome da etapa.
+            total (int | None): Tamanho total da etapa, se conhecido.
+            unit (str | None): Unidade de `total` (ex: "bytes", "arquivos").
+        """
+        with self._lock:
+            self.phase = phase
+            self.done = 0
+            self.total = total
+            self.unit = unit
+            self._phase_started = time.monotonic()
+
+    def advance(self, amount: int = 1):
+        """Soma `amount` ao avanço da etapa atual."""
+        with self._lock:
+            self.done += amount
+
+    def add_rows(self, amount: int = 1):
+        """Soma `amount` às linhas processadas."""
+        with self._lock:
+            self.rows_processed += amount
+
+    def track(self, rows):
+        """
+        Repassa os itens de um iterável contando-os como linhas processadas.
+
+        Args:
+            rows (iterable): Linhas da etapa atual.
+
+        Yields:
+            Os mesmos itens recebidos.
+        """
+        for row in rows:
+            self.add_rows()
+            yield row
+
+    def finish(self, error: str = None):
+        """
+        Marca o fim da execução.
+
+        Args:
+            error (str | None): Mensagem de erro, se a execução falhou.
+        """
+        with self._lock:
+            self.phase = "error" if error else "done"
+            self.error = error
+            self.finished_at = datetime.utcnow()
+            self.completed_runs += 1
+
+    def skip(self, reason: str):
+        """
+        Registra que este processo não executou a ingestão agendada.
+
+        Args:
+            reason (str): Motivo (ex: outro processo detém o lock).
+        """
+        with self._lock:
+            self.phase = "skipped"
+            self.error = reason
+            self.finished_at = datetime.utcnow()
+
+    def snapshot(self) -> dict:
+        """
+        Retorna uma cópia consistente do estado atual.
+
+        Returns:
+            dict: Etapa, linhas processadas, avanço e ETA da etapa atual.
+        """
+        with self._lock:
+            eta = None
+            if self.total and self.done and self._phase_started is not None:
+                elapsed = time.monotonic() - self._phase_started
+                eta = max(0.0, elapsed * (self.total - self.done) / self.done)
+            return {
+                "phase": self.phase,
+                "rows_processed": self.rows_processed,
+                "done": self.done,
+                "total": self.total,
+                "unit": self.unit,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "error": self.error,
+                "completed_runs": self.completed_runs,
+            }
+
+
+# instância compartilhada pelo scheduler e pela API
+progress = IngestionProgress()
@@ -1,35 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ..db import get_db
-from ..auth import get_current_user_from_token
-from .. import crud
+from ..db import get_async_db, get_async_read_db, get_read_db, mark_write
+from ..auth import get_current_user_async, get_current_user_async_read, get_current_user_from_token
+from .. import async_crud, crud
 
 router = APIRouter(prefix="/favorites", tags=["favorites"])
 
 @router.post("/{fund_id}")
-def add_to_favorites(fund_id: int, db: Session = Depends(get_db), user=Depends(get_current_user_from_token)):
+async def add_to_favorites(fund_id: int, request: Request, response: Response,
+                           db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
     """
     Adiciona um fundo à lista de favoritos do usuário autenticado.
 
     Args:
         fund_id (int): ID do fundo a ser adicionado aos favoritos.
-        db (Session): Sessão do banco de dados.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
         user: Usuário autenticado extraído do token JWT.
 
     Returns:
         dict: Mensagem de confirmação e ID do favorito criado.
     """
-    fav = crud.add_favorite(db, user.id, fund_id)
+    fav = await async_crud.add_favorite(db, user.id, fund_id)
+    mark_write(request, response)
     return {"message": "Added to favorites", "favorite_id": fav.id}
 
 @router.delete("/{fund_id}")
-def remove_from_favorites(fund_id: int, db: Session = Depends(get_db), user=Depends(get_current_user_from_token)):
+async def remove_from_favorites(fund_id: int, request: Request, response: Response,
+                                db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user_async)):
     """
     Remove um fundo da lista de favoritos do usuário autenticado.
 
     Args:
         fund_id (int): ID do fundo a ser removido dos favoritos.
-        db (Session): Sessão do banco de dados.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
         user: Usuário autenticado extraído do token JWT.
 
     Returns:
@@ -38,22 +42,42 @@ def remove_from_favorites(fund_id: int, db: Session = Depends(get_db), user=Depe
     Raises:
         HTTPException: Se o favorito não for encontrado.
     """
-    removed = crud.remove_favorite(db, user.id, fund_id)
+    removed = await async_crud.remove_favorite(db, user.id, fund_id)
     if not removed:
         raise HTTPException(status_code=404, detail="Favorite not found")
+    mark_write(request, response)
     return {"message": "Removed from favorites"}
 
 @router.get("/")
-def list_user_favorites(db: Session = Depends(get_db), user=Depends(get_current_user_from_token)):
+async def list_user_favorites(db: AsyncSession = Depends(get_async_read_db),
+                              user=Depends(get_current_user_async_read)):
     """
     Lista todos os fundos favoritos do usuário autenticado.
 
     Args:
-        db (Session): Sessão do banco de dados.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
         user: Usuário autenticado extraído do token JWT.
 
     Returns:
         list: Lista de fundos marcados como favoritos pelo usuário.
     """
-    favorites = crud.list_favorites(db, user.id)
+    favorites = await async_crud.list_favorites(db, user.id)
     return favorites
+
+@router.get("/correlation")
+def favorites_correlation(min_periods: int = 2, include_covariance: bool = False, db: Session = Depends(get_read_db),
+                          user=Depends(get_current_user_from_token)):
+    """
+    Retorna a matriz de correlação dos retornos diários entre os fundos favoritos do usuário.
+
+    Args:
+        min_periods (int): Mínimo de dias em comum para o par ter valor (default: 2).
+        include_covariance (bool): Inclui também a matriz de covariância.
+        db (Session): Sessão do banco de dados.
+        user: Usuário autenticado extraído do token JWT.
+
+    Returns:
+        dict: Mesmo formato de /funds/correlation.
+    """
+    fund_ids = [fund.id for fund in crud.list_favorites(db, user.id)]
+    return crud.get_correlation(db, fund_ids, min_periods=min_periods, include_covariance=include_covariance)
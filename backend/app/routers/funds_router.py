@@ -1,29 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime, timedelta
 import random
 
-from .. import crud, models
-from ..db import get_db
+from .. import async_crud, crud, models, schemas
+from ..db import get_async_read_db, get_db, get_read_db
 
 router = APIRouter(prefix="/funds", tags=["funds"])
 
 @router.get("/", summary="List all funds")
-def get_funds(db: Session = Depends(get_db)):
+async def get_funds(db: AsyncSession = Depends(get_async_read_db)):
     """
     Lista todos os fundos disponíveis no banco de dados.
 
     Args:
-        db (Session): Sessão do banco de dados.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
 
     Returns:
         list: Lista de fundos registrados.
     """
-    return crud.list_funds(db)
+    return await async_crud.list_funds(db)
+
+@router.post("/metrics:batch", summary="Return metrics for many funds")
+def get_metrics_batch(payload: schemas.FundMetricsBatchRequest, db: Session = Depends(get_read_db)):
+    """
+    Retorna as métricas de vários fundos em uma única requisição.
+
+    Usa uma consulta às métricas pré-calculadas e, para os fundos restantes
+    (ou com `risk_free` diferente de zero), um único cálculo vetorizado.
+
+    Args:
+        payload (FundMetricsBatchRequest): CNPJs e taxa livre de risco.
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        dict: CNPJ → métricas (mesmo formato de /funds/{cnpj}/metrics).
+            CNPJs não encontrados não aparecem na resposta.
+    """
+    return crud.get_fund_metrics_batch(db, payload.cnpjs, risk_free=payload.risk_free)
+
+@router.get("/correlation", summary="Correlation matrix between funds")
+def get_correlation(cnpj: List[str] = Query(None), class_name: str = None, min_periods: int = 2,
+                    include_covariance: bool = False, db: Session = Depends(get_read_db)):
+    """
+    Retorna a matriz de correlação dos retornos diários entre fundos.
+
+    Os fundos são escolhidos repetindo o parâmetro `cnpj` ou por `class_name`.
+    Cada par considera só os dias em que ambos têm retorno.
+
+    Args:
+        cnpj (List[str]): CNPJs dos fundos (opcional).
+        class_name (str): Classe dos fundos, usada se nenhum CNPJ for informado (opcional).
+        min_periods (int): Mínimo de dias em comum para o par ter valor (default: 2).
+        include_covariance (bool): Inclui também a matriz de covariância.
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        dict: "cnpjs" (ordem das linhas/colunas), "correlation", "observations",
+            "history_version" e, opcionalmente, "covariance". Pares sem dias
+            suficientes vêm como null.
+
+    Raises:
+        HTTPException: Se nenhum filtro for informado ou houver fundos demais.
+    """
+    if not cnpj and not class_name:
+        raise HTTPException(status_code=400, detail="Provide cnpj or class_name")
+    fund_ids = crud.list_fund_ids(db, cnpjs=cnpj, class_name=class_name)
+    if len(fund_ids) > crud.MAX_CORRELATION_FUNDS:
+        raise HTTPException(status_code=400, detail=f"Too many funds (max {crud.MAX_CORRELATION_FUNDS})")
+    return crud.get_correlation(db, fund_ids, min_periods=min_periods, include_covariance=include_covariance)
 
 @router.get("/{cnpj:path}/history", summary="Get fund history")
-def get_history(cnpj: str, db: Session = Depends(get_db)):
+async def get_history(cnpj: str, db: AsyncSession = Depends(get_async_read_db)):
     """
     Retorna o histórico de cotas (NAV) de um fundo específico.
 
@@ -31,7 +81,7 @@ def get_history(cnpj: str, db: Session = Depends(get_db)):
 
     Args:
         cnpj (str): CNPJ do fundo.
-        db (Session): Sessão do banco de dados.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
 
     Returns:
         list: Lista de dicionários com data e valor da cota (NAV).
@@ -39,10 +89,10 @@ def get_history(cnpj: str, db: Session = Depends(get_db)):
     Raises:
         HTTPException: Se o fundo não for encontrado.
     """
-    fund = crud.get_fund_by_cnpj(db, cnpj)
+    fund = await async_crud.get_fund_by_cnpj(db, cnpj)
     if not fund:
         raise HTTPException(status_code=404, detail="Fund not found")
-    history = crud.list_history_for_fund(db, fund.id, limit=1000)
+    history = await async_crud.list_history_for_fund(db, fund.id, limit=1000)
     # serializar history simples
     return [{"date": h.date.isoformat(), "nav": h.nav} for h in history]
 
@@ -82,25 +132,60 @@ def add_history_test(cnpj: str, db: Session = Depends(get_db)):
     crud.add_history_bulk(db, fund.id, rows)
     return {"msg": f"Added {len(rows)} simulated history rows for fund {cnpj}"}
 
-@router.get("/{cnpj:path}/metrics", summary="Compute and return metrics for a fund")
-def get_metrics(cnpj: str, risk_free: float = 0.0, db: Session = Depends(get_db)):
+@router.get("/{cnpj:path}/metrics/rolling", summary="Rolling metrics for a fund")
+def get_rolling_metrics(cnpj: str, window: List[int] = Query([21, 63, 252]), risk_free: float = 0.0,
+                        db: Session = Depends(get_read_db)):
+    """
+    Retorna séries móveis de retorno, volatilidade e Sharpe de um fundo, para gráficos.
+
+    Várias janelas podem ser pedidas repetindo o parâmetro
+    (ex: ?window=21&window=63); todas são calculadas na mesma passada.
+
+    Args:
+        cnpj (str): CNPJ do fundo.
+        window (List[int]): Tamanhos das janelas, em pregões (default: 21, 63 e 252).
+        risk_free (float): Taxa livre de risco usada no Sharpe (opcional).
+        db (Session): Sessão do banco de dados.
+
+    Returns:
+        dict: "dates" e, por janela, as séries "return", "volatility" e "sharpe"
+            (null enquanto a janela não está completa).
+
+    Raises:
+        HTTPException: Se alguma janela for menor que 2 ou o fundo não for encontrado.
     """
-    Calcula e retorna métricas financeiras para um fundo com base no histórico de cotas.
+    if any(w < 2 for w in window):
+        raise HTTPException(status_code=400, detail="window must be >= 2")
+    rolling = crud.get_rolling_metrics(db, cnpj, window, risk_free=risk_free)
+    if rolling is None:
+        raise HTTPException(status_code=404, detail="Fund not found")
+    return rolling
+
+@router.get("/{cnpj:path}/metrics", summary="Return precomputed metrics for a fund")
+def get_metrics(cnpj: str, risk_free: float = 0.0, benchmark: str = None, db: Session = Depends(get_read_db)):
+    """
+    Retorna as métricas financeiras de um fundo, sem escrever no banco.
 
-    As métricas podem incluir retorno, volatilidade, Sharpe ratio, entre outras.
+    Inclui rentabilidade total, volatilidade, Sharpe e Sortino, retorno e
+    volatilidade anualizados, drawdown máximo e sua duração (em pregões),
+    Calmar, hit ratio (fração de retornos positivos) e, contra um índice de
+    referência, alfa, beta, tracking error e information ratio. Com a taxa
+    livre de risco padrão (zero) e o índice padrão, vem das métricas
+    pré-calculadas pela ingestão; `computed_at` indica quando foram calculadas.
 
     Args:
         cnpj (str): CNPJ do fundo.
         risk_free (float): Taxa livre de risco usada no cálculo (opcional).
+        benchmark (str | None): Código do índice (ex: "IBOV"); padrão: DEFAULT_BENCHMARK.
         db (Session): Sessão do banco de dados.
 
     Returns:
-        dict: Dicionário com métricas calculadas.
+        dict: Dicionário com métricas e `computed_at`.
 
     Raises:
-        HTTPException: Se o fundo não for encontrado ou não tiver histórico suficiente.
+        HTTPException: Se o fundo não for encontrado.
     """
-    metrics = crud.compute_metrics_from_history(db, cnpj, risk_free=risk_free)
+    metrics = crud.get_fund_metrics(db, cnpj, risk_free=risk_free, benchmark=benchmark)
     if metrics is None:
         raise HTTPException(status_code=404, detail="Fund not found")
     return metrics
@@ -0,0 +1,166 @@
+from datetime import date, datetime, time
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from ..db import get_read_db
+from ..auth import get_current_user_from_token
+from .. import crud
+from ..portfolio import METHODS, REBALANCE_FREQUENCIES, SIMULATION_METHODS
+
+router = APIRouter(prefix="/portfolio", tags=["portfolio"])
+
+@router.get("/allocation", summary="Split the available amount across candidate funds")
+def get_allocation(method: str = "mean_variance", cnpj: List[str] = Query(None), class_name: str = None,
+                   db: Session = Depends(get_read_db), user=Depends(get_current_user_from_token)):
+    """
+    Distribui o valor disponível do perfil do usuário entre fundos candidatos.
+
+    Os candidatos são os CNPJs informados, os fundos de uma classe ou, se
+    nenhum dos dois for informado, os favoritos do usuário. As restrições
+    (aversão ao risco e peso máximo por fundo) dependem do perfil de risco.
+
+    Args:
+        method (str): "mean_variance" ou "risk_parity".
+        cnpj (List[str] | None): CNPJs dos fundos candidatos (parâmetro repetido).
+        class_name (str | None): Classe dos fundos candidatos.
+        db (Session): Sessão do banco de dados.
+        user: Usuário autenticado extraído do token JWT.
+
+    Returns:
+        dict: Pesos e valores por fundo, retorno e volatilidade esperados.
+
+    Raises:
+        HTTPException: Se o método for inválido, o perfil não existir ou não houver candidatos.
+    """
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of: {', '.join(METHODS)}")
+
+    profile = crud.get_profile_by_user(db, user.id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if cnpj or class_name:
+        fund_ids = crud.list_fund_ids(db, cnpjs=cnpj, class_name=class_name)
+    else:
+        fund_ids = [fund.id for fund in crud.list_favorites(db, user.id)]
+    if not fund_ids:
+        raise HTTPException(status_code=400, detail="No candidate funds")
+    if len(fund_ids) > crud.MAX_ALLOCATION_FUNDS:
+        raise HTTPException(status_code=400, detail=f"Too many funds (max {crud.MAX_ALLOCATION_FUNDS})")
+
+    risk_profile = getattr(profile.risk_profile, "value", profile.risk_profile)
+    amount = float(profile.amount_available or 0)
+    result = crud.get_portfolio_allocation(db, fund_ids, risk_profile, amount, method)
+    result.update({"risk_profile": risk_profile, "amount_available": amount, "method": method})
+    return result
+
+@router.get("/simulation", summary="Monte Carlo projection of the favorites portfolio")
+def get_simulation(horizon: int = 252, paths: int = 10_000, seed: int = Query(0, ge=0), method: str = "bootstrap",
+                   weighting: str = "equal", db: Session = Depends(get_read_db),
+                   user=Depends(get_current_user_from_token)):
+    """
+    Projeta o valor disponível investido nos fundos favoritos do usuário.
+
+    Retorna faixas de percentis do valor da carteira ao longo do horizonte.
+    A mesma consulta (favoritos, horizonte, semente e demais parâmetros)
+    é servida do cache enquanto o histórico dos fundos não mudar.
+
+    Args:
+        horizon (int): Dias úteis projetados (default: 252).
+        paths (int): Quantidade de trajetórias (default: 10.000).
+        seed (int): Semente do gerador, não negativa (default: 0).
+        method (str): "bootstrap" (retornos históricos) ou "normal".
+        weighting (str): "equal", "mean_variance" ou "risk_parity".
+        db (Session): Sessão do banco de dados.
+        user: Usuário autenticado extraído do token JWT.
+
+    Returns:
+        dict: Faixas por dia, distribuição do valor final e pesos usados.
+
+    Raises:
+        HTTPException: Se algum parâmetro for inválido, o perfil não existir ou não houver favoritos.
+    """
+    if method not in SIMULATION_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of: {', '.join(SIMULATION_METHODS)}")
+    if weighting != "equal" and weighting not in METHODS:
+        raise HTTPException(status_code=400, detail=f"weighting must be one of: equal, {', '.join(METHODS)}")
+    if horizon < 1 or paths < 1:
+        raise HTTPException(status_code=400, detail="horizon and paths must be positive")
+    if horizon * paths > crud.MAX_SIMULATION_CELLS:
+        raise HTTPException(status_code=400, detail=f"horizon * paths must be at most {crud.MAX_SIMULATION_CELLS}")
+
+    profile = crud.get_profile_by_user(db, user.id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    fund_ids = [fund.id for fund in crud.list_favorites(db, user.id)]
+    if not fund_ids:
+        raise HTTPException(status_code=400, detail="No favorite funds")
+
+    risk_profile = getattr(profile.risk_profile, "value", profile.risk_profile)
+    amount = float(profile.amount_available or 0)
+    result = crud.get_portfolio_simulation(
+        db, fund_ids, amount, horizon, paths, seed, method, weighting, risk_profile
+    )
+    return {**result, "amount_available": amount, "horizon": horizon, "paths": paths, "seed": seed,
+            "method": method, "weighting": weighting}
+
+@router.get("/backtest", summary="Backtest a fixed-weight portfolio of the user's favorites")
+def get_backtest(rebalance: str = "monthly", start: date = None, end: date = None,
+                 cnpj: List[str] = Query(None), weight: List[float] = Query(None), risk_free: float = 0.0,
+                 db: Session = Depends(get_read_db), user=Depends(get_current_user_from_token)):
+    """
+    Simula a carteira de favoritos do usuário com pesos fixos e rebalanceamento periódico.
+
+    Sem `cnpj`, usa todos os favoritos com pesos iguais; com `cnpj` (e,
+    opcionalmente, `weight` na mesma ordem), usa só esses favoritos. O
+    valor inicial é o valor disponível do perfil (1.0 se não houver perfil).
+
+    Args:
+        rebalance (str): "none", "daily", "weekly", "monthly", "quarterly" ou "yearly".
+        start (date | None): Início do backtest.
+        end (date | None): Fim do backtest.
+        cnpj (List[str] | None): CNPJs dos favoritos incluídos (parâmetro repetido).
+        weight (List[float] | None): Pesos dos CNPJs, na mesma ordem.
+        risk_free (float): Taxa livre de risco por período, usada nas métricas.
+        db (Session): Sessão do banco de dados.
+        user: Usuário autenticado extraído do token JWT.
+
+    Returns:
+        dict: Curva de patrimônio, datas de rebalanceamento, giro e métricas da carteira.
+
+    Raises:
+        HTTPException: Se algum parâmetro for inválido ou não houver favoritos.
+    """
+    if rebalance not in REBALANCE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"rebalance must be one of: {', '.join(REBALANCE_FREQUENCIES)}")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    favorites = {fund.cnpj: fund.id for fund in crud.list_favorites(db, user.id)}
+    if not favorites:
+        raise HTTPException(status_code=400, detail="No favorite funds")
+
+    if cnpj:
+        if weight and len(weight) != len(cnpj):
+            raise HTTPException(status_code=400, detail="weight must have one value per cnpj")
+        unknown = [c for c in cnpj if c not in favorites]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Not in favorites: {', '.join(unknown)}")
+        if weight and (min(weight) < 0 or sum(weight) <= 0):
+            raise HTTPException(status_code=400, detail="weights must be non-negative and not all zero")
+        weights = {favorites[c]: (weight[i] if weight else 1.0) for i, c in enumerate(cnpj)}
+    else:
+        weights = {fund_id: 1.0 for fund_id in favorites.values()}
+
+    profile = crud.get_profile_by_user(db, user.id)
+    initial = float(profile.amount_available or 0) if profile else 0.0
+    result = crud.get_portfolio_backtest(
+        db, weights, rebalance,
+        datetime.combine(start, time.min) if start else None,
+        datetime.combine(end, time.max) if end else None,
+        initial if initial > 0 else 1.0,
+        risk_free,
+    )
+    return {**result, "rebalance": rebalance, "initial": initial if initial > 0 else 1.0}
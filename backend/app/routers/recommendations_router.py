@@ -1,24 +1,25 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from ..db import get_db
-from ..auth import get_current_user_from_token
-from .. import crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_read_db
+from ..auth import get_current_user_async_read
+from .. import async_crud
 
 router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 
 @router.get("/")
-def get_user_recommendations(db: Session = Depends(get_db), user=Depends(get_current_user_from_token)):
+async def get_user_recommendations(db: AsyncSession = Depends(get_async_read_db),
+                                   user=Depends(get_current_user_async_read)):
     """
     Retorna recomendações personalizadas de fundos para o usuário autenticado.
 
     As recomendações são geradas com base no perfil e histórico do usuário.
 
     Args:
-        db (Session): Sessão do banco de dados.
+        db (AsyncSession): Sessão assíncrona do banco de dados.
         user: Usuário autenticado extraído do token JWT.
 
     Returns:
         list: Lista de fundos recomendados para o usuário.
     """
-    recs = crud.get_recommendations(db, user.id)
+    recs = await async_crud.get_recommendations(db, user.id)
     return recs
@@ -7,7 +7,7 @@ from reportlab.lib.units import cm
 from reportlab.pdfgen import canvas
 from fastapi.responses import StreamingResponse
 
-from ..db import get_db
+from ..db import get_read_db
 from ..auth import get_current_user_from_token
 from .. import crud
 
@@ -46,7 +46,7 @@ def ensure_space(pdf, y, height, margin=2*cm):
 
 
 @router.get("/generate", summary="Gera relatório PDF do usuário atual")
-def generate_report(db: Session = Depends(get_db),
+def generate_report(db: Session = Depends(get_read_db),
                     user=Depends(get_current_user_from_token)):
 
     buffer = BytesIO()
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import List
 from .. import schemas, crud, models, auth
-from ..db import get_db
+from ..db import get_db, get_read_db, mark_write
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -53,7 +53,7 @@ def health():
 
 # list users (protected)
 @router.get("/", response_model=List[schemas.UserOut])
-def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
+def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user_from_token)):
     """
     Lista todos os usuários cadastrados (requer autenticação).
 
@@ -70,7 +70,7 @@ def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), c
 
 # get single user (protected)
 @router.get("/{user_id}", response_model=schemas.UserOut)
-def get_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
+def get_user(user_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user_from_token)):
     """
     Retorna os dados de um usuário específico pelo ID (requer autenticação).
 
@@ -92,7 +92,7 @@ def get_user(user_id: int, db: Session = Depends(get_db), current_user: models.U
 
 # update logged-in user's name/email
 @router.put("/me", response_model=schemas.UserOut)
-def update_me(payload: schemas.UserCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
+def update_me(payload: schemas.UserCreate, request: Request, response: Response, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
     """
     Atualiza nome e e-mail do usuário autenticado.
 
@@ -106,6 +106,7 @@ def update_me(payload: schemas.UserCreate, db: Session = Depends(get_db), curren
     """
     # payload reuses UserCreate (name/email/password) — we will only update name/email here
     updated = crud.update_user(db, current_user, name=payload.name, email=payload.email)
+    mark_write(request, response)
     return updated
 
 # delete logged-in user
@@ -126,7 +127,7 @@ def delete_me(db: Session = Depends(get_db), current_user: models.User = Depends
 
 # Profile endpoints (create/update and read)
 @router.get("/me/profile", response_model=schemas.InvestorProfileOut)
-def get_my_profile(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
+def get_my_profile(db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user_from_token)):
     """
     Retorna o perfil de investidor do usuário autenticado.
 
@@ -146,7 +147,7 @@ def get_my_profile(db: Session = Depends(get_db), current_user: models.User = De
     return prof
 
 @router.post("/me/profile", response_model=schemas.InvestorProfileOut)
-def create_or_update_profile(payload: schemas.InvestorProfileCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
+def create_or_update_profile(payload: schemas.InvestorProfileCreate, request: Request, response: Response, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_from_token)):
     """
     Cria ou atualiza o perfil de investidor do usuário autenticado.
 
@@ -159,4 +160,5 @@ def create_or_update_profile(payload: schemas.InvestorProfileCreate, db: Session
         schemas.InvestorProfileOut: Perfil atualizado ou recém-criado.
     """
     prof = crud.create_or_update_profile(db, user_id=current_user.id, risk_profile=payload.risk_profile.value, amount_available=payload.amount_available)
+    mark_write(request, response)
     return prof
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
@@ -127,3 +127,14 @@ class PasswordResetConfirm(BaseModel):
     """
     token: str
     new_password: str = Field(..., min_length=6)
+
+class FundMetricsBatchRequest(BaseModel):
+    """
+    Schema para consulta de métricas de vários fundos em uma requisição.
+
+    Campos:
+        cnpjs (List[str]): CNPJs dos fundos (até 1000).
+        risk_free (float): Taxa livre de risco usada no cálculo (default: 0.0).
+    """
+    cnpjs: List[str] = Field(..., min_length=1, max_length=1000)
+    risk_free: float = 0.0
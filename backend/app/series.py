@@ -0,0 +1,112 @@
+import numpy as np
+
+# datas da série colunar: dias desde 1970-01-01 (ordinal 719163), int32 little-endian
+SERIES_EPOCH = 719163
+DAY_DTYPE = np.dtype("<i4")
+
+# cotas da série colunar: float64 little-endian
+NAV_DTYPE = np.dtype("<f8")
+
+
+def series_days(ordinals) -> np.ndarray:
+    """
+    Converte datas ordinais (date.toordinal()) em dias desde 1970-01-01.
+
+    Args:
+        ordinals (array-like): Datas como ordinais.
+
+    Returns:
+        np.ndarray: Dias como int32.
+    """
+    return (np.asarray(ordinals, dtype=np.int64) - SERIES_EPOCH).astype(DAY_DTYPE)
+
+
+def pack_series(days: np.ndarray, navs: np.ndarray):
+    """
+    Converte uma série de cotas para o formato binário de `fund_series`.
+
+    Args:
+        days (np.ndarray): Dias desde 1970-01-01, em ordem crescente.
+        navs (np.ndarray): Cotas, na ordem de `days`.
+
+    Returns:
+        tuple: (bytes das datas, bytes das cotas).
+    """
+    return np.asarray(days, dtype=DAY_DTYPE).tobytes(), np.asarray(navs, dtype=NAV_DTYPE).tobytes()
+
+
+def unpack_series(days: bytes, navs: bytes):
+    """
+    Lê uma série de `fund_series` sem copiar os dados (np.frombuffer).
+
+    Os vetores devolvidos são somente leitura e apontam para o buffer
+    recebido do driver.
+
+    Args:
+        days (bytes | memoryview): Datas empacotadas.
+        navs (bytes | memoryview): Cotas empacotadas.
+
+    Returns:
+        tuple: (dias desde 1970-01-01 como int32, cotas como float64).
+    """
+    return np.frombuffer(days, dtype=DAY_DTYPE), np.frombuffer(navs, dtype=NAV_DTYPE)
+
+
+def daily_series(days: np.ndarray, navs: np.ndarray):
+    """
+    Reduz cotas ordenadas por data a uma por dia, mantendo a última de cada dia.
+
+    Args:
+        days (np.ndarray): Datas como ordinais, em ordem não decrescente.
+        navs (np.ndarray): Cotas, na ordem de `days`.
+
+    Returns:
+        tuple: (ordinais sem repetição, cotas correspondentes).
+    """
+    days = np.asarray(days, dtype=np.int64)
+    navs = np.asarray(navs, dtype=np.float64)
+    if len(days) < 2:
+        return days, navs
+    last = np.append(days[1:] != days[:-1], True)
+    return days[last], navs[last]
+
+
+def series_matrix(fund_ids: np.ndarray, series: dict, start: int = None, end: int = None):
+    """
+    Alinha as séries de vários fundos em uma matriz fundos x datas.
+
+    Datas em que um fundo não tem cota (e fundos sem série) ficam como NaN.
+
+    Args:
+        fund_ids (np.ndarray): IDs dos fundos, em ordem crescente (linhas da matriz).
+        series (dict): ID do fundo → (dias desde 1970-01-01, cotas), como em unpack_series.
+        start (int | None): Primeira data incluída, como ordinal.
+        end (int | None): Última data incluída, como ordinal.
+
+    Returns:
+        tuple: (ids dos fundos, datas como ordinais, matriz de cotas).
+    """
+    rows, offsets, values = [], [], []
+    for row, fund_id in enumerate(fund_ids.tolist()):
+        entry = series.get(fund_id)
+        if entry is None or not len(entry[0]):
+            continue
+        days, navs = entry
+        if start is not None or end is not None:
+            keep = np.ones(len(days), dtype=bool)
+            if start is not None:
+                keep &= days >= start - SERIES_EPOCH
+            if end is not None:
+                keep &= days <= end - SERIES_EPOCH
+            days, navs = days[keep], navs[keep]
+        rows.append(np.full(len(days), row, dtype=np.int64))
+        offsets.append(days)
+        values.append(navs)
+
+    if not rows:
+        return fund_ids, np.empty(0, dtype=np.int64), np.full((len(fund_ids), 0), np.nan)
+
+    offsets, date_idx = np.unique(np.concatenate(offsets), return_inverse=True)
+    matrix = np.full((len(fund_ids), len(offsets)), np.nan)
+    matrix[np.concatenate(rows), date_idx] = np.concatenate(values)
+    return fund_ids, offsets.astype(np.int64) + SERIES_EPOCH, matrix
@@ -0,0 +1,315 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Float, Integer, MetaData, String, Table, literal, or_, select, text, true,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from backend.app import models
+from backend.app.crud import (
+    copy_rows, fund_keyed_hash, get_fund_set_version, merge_history, purge_simulated_history, rebuild_fund_stats,
+    save_source_state, update_fund_stats,
+)
+
+# metadata própria: as tabelas de staging não entram no create_all da aplicação
+staging_metadata = MetaData()
+
+funds_staging = Table(
+    "funds_staging", staging_metadata,
+    Column("cnpj", String(20), primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("class_name", String(100)),
+    Column("source_hash", String(32)),
+)
+
+fund_history_staging = Table(
+    "fund_history_staging", staging_metadata,
+    Column("seq", Integer, primary_key=True),  # ordem de chegada: desempata fundo/dia repetidos
+    Column("fund_id", Integer),   # já resolvido, quando o fundo existe
+    Column("cnpj", String(20)),   # para fundos que só existirão após o merge
+    Column("date", DateTime, nullable=False),
+    Column("nav", Float, nullable=False),
+    # período substituído pelo arquivo de origem (ver crud.merge_history)
+    Column("replace_start", DateTime),
+    Column("replace_end", DateTime),
+)
+
+# preenche o fund_id das cotas de fundos que só passaram a existir no merge
+RESOLVE_STAGED_FUNDS = """
+    UPDATE fund_history_staging
+    SET fund_id = (SELECT f.id FROM funds f WHERE f.cnpj = fund_history_staging.cnpj)
+    WHERE fund_id IS NULL
+"""
+
+# cotas do staging, depois de RESOLVE_STAGED_FUNDS (fund_id nulo: CNPJ fora do cadastro)
+RESOLVED_HISTORY = """
+    SELECT seq, fund_id, date, nav, replace_start, replace_end FROM fund_history_staging
+"""
+
+# cotas posteriores à última contabilizada em `fund_stats`, dos fundos do staging (após o merge)
+APPENDED_HISTORY = f"""
+    SELECT h.fund_id, h.date, h.nav
+    FROM fund_history h
+    JOIN fund_stats st ON st.fund_id = h.fund_id
+    WHERE h.date > st.last_date
+      AND h.fund_id IN (SELECT r.fund_id FROM ({RESOLVED_HISTORY}) r)
+"""
+
+# fundos do staging ainda sem acumuladores
+UNTRACKED_FUNDS = f"""
+    SELECT DISTINCT r.fund_id FROM ({RESOLVED_HISTORY}) r
+    LEFT JOIN fund_stats st ON st.fund_id = r.fund_id
+    WHERE r.fund_id IS NOT NULL AND st.last_date IS NULL
+"""
+
+
+def format_cnpj(digits: str) -> str:
+    """
+    Aplica a máscara da CVM (00.000.000/0000-00) a um CNPJ só com dígitos.
+
+    Args:
+        digits (str | int): CNPJ sem pontuação.
+
+    Returns:
+        str: CNPJ formatado.
+    """
+    d = str(digits).zfill(14)
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+
+
+class StagedLoad:
+    """
+    Carga da ingestão em tabelas de staging, aplicada em uma única transação curta.
+
+    Durante a carga (a parte demorada) nada é escrito em `funds` ou
+    `fund_history`, então os leitores não disputam locks com o loader. No
+    final, merge() aplica tudo de uma vez: os leitores veem o estado anterior
+    completo até o commit e o novo estado completo depois dele.
+    """
+
+    def __init__(self):
+        self.source_states = []
+
+    def prepare(self, db: Session):
+        """
+        Recria as tabelas de staging vazias.
+
+        Args:
+            db (Session): Sessão do banco de dados.
+        """
+        bind = db.get_bind()
+        staging_metadata.drop_all(bind)
+        staging_metadata.create_all(bind)
+        if bind.dialect.name == "postgresql":
+            # sem WAL: o conteúdo é descartável e a carga fica mais rápida
+            for table in staging_metadata.sorted_tables:
+                db.execute(text(f"ALTER TABLE {table.name} SET UNLOGGED"))
+            db.commit()
+
+    def stage_funds(self, db: Session, records):
+        """
+        Grava os fundos novos ou alterados em `funds_staging`.
+
+        Args:
+            db (Session): Sessão do banco de dados.
+            records (iterable): Dicionários com cnpj, name, class_name e source_hash.
+
+        Returns:
+            dict: Contador "staged".
+        """
+        unique = {}
+        for record in records:
+            unique[record["cnpj"]] = record
+        staged = copy_rows(
+            db, funds_staging, ["cnpj", "name", "class_name", "source_hash"],
+            ((r["cnpj"], r["name"], r["class_name"], r["source_hash"]) for r in unique.values()),
+        )
+        db.commit()
+        return {"staged": staged}
+
+    def stage_history(self, db: Session, rows, fund_ids: dict, replace=None):
+        """
+        Grava cotas em `fund_history_staging`.
+
+        Fundos já existentes entram com o fund_id; os demais com o CNPJ
+        formatado, resolvido no merge.
+
+        Args:
+            db (Session): Sessão do banco de dados.
+            rows (iterable): Tuplas (cnpj só com dígitos, datetime, nav).
+            fund_ids (dict): CNPJ, no mesmo formato de `rows` → id do fundo.
+            replace (tuple | None): Intervalo [início, fim) do arquivo, substituído
+                no merge para os fundos presentes nele (como na carga direta).
+
+        Returns:
+            dict: Contadores "loaded" e "skipped" (sempre 0: a resolução é no merge).
+        """
+        start, end = replace or (None, None)
+
+        def resolved():
+            for cnpj, day, nav in rows:
+                fund_id = fund_ids.get(cnpj)
+                yield fund_id, None if fund_id is not None else format_cnpj(cnpj), day, nav, start, end
+
+        loaded = copy_rows(
+            db, fund_history_staging, ["fund_id", "cnpj", "date", "nav", "replace_start", "replace_end"], resolved(),
+        )
+        db.commit()
+        return {"loaded": loaded, "skipped": 0}
+
+    def has_new_funds(self, db: Session) -> bool:
+        """
+        Informa se o merge vai inserir fundos (CNPJs do staging ainda fora de `funds`).
+
+        Args:
+            db (Session): Sessão do banco de dados.
+
+        Returns:
+            bool: True se o cadastro vai mudar no merge.
+        """
+        return db.scalar(text(
+            "SELECT EXISTS (SELECT 1 FROM funds_staging s WHERE NOT EXISTS "
+            "(SELECT 1 FROM funds f WHERE f.cnpj = s.cnpj))"
+        ))
+
+    def defer_source_state(self, source: str, etag: str, last_modified: str, content_hash: str, nav: bool = False):
+        """
+        Adia o registro de uma origem para a transação do merge.
+
+        Assim, se o merge falhar, a próxima execução volta a processar o arquivo.
+        Origens de cotas (`nav`) com CNPJs fora do cadastro no merge ficam
+        atreladas à versão do cadastro; o próprio cadastro não.
+        """
+        self.source_states.append((source, etag, last_modified, content_hash, nav))
+
+    def _fund_merge_statement(self, db: Session, now: datetime):
+        fields = ["name", "class_name", "source_hash"]
+        dialect = db.get_bind().dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+
+        source = select(
+            funds_staging.c.cnpj, funds_staging.c.name, funds_staging.c.class_name,
+            funds_staging.c.source_hash, literal(now, DateTime),
+        ).where(true())  # o WHERE evita ambiguidade do ON CONFLICT no SQLite
+        stmt = insert(models.Fund).from_select(["cnpj", *fields, "updated_at"], source)
+        changed = or_(*[getattr(models.Fund, f).is_distinct_from(stmt.excluded[f]) for f in fields])
+        set_ = {f: stmt.excluded[f] for f in fields}
+        set_["updated_at"] = stmt.excluded.updated_at
+        stmt = stmt.on_conflict_do_update(index_elements=[models.Fund.cnpj], set_=set_, where=changed)
+        if dialect == "postgresql":
+            return stmt.returning(models.Fund.id, text("xmax = 0"))
+        return stmt.returning(models.Fund.id, models.Fund.cnpj)
+
+    def merge(self, db: Session):
+        """
+        Aplica o conteúdo do staging em `funds` e `fund_history` em uma transação.
+
+        Cotas do staging substituem as existentes para o mesmo fundo e dia (e,
+        no mês de cada arquivo, as que não vieram nele), e o histórico
+        simulado dos fundos que receberam cotas é removido. Como na carga
+        direta, cotas posteriores à última contabilizada entram nos
+        acumuladores de métricas em O(1); só fundos com cotas já
+        contabilizadas alteradas ou removidas, com histórico simulado ou
+        ainda sem acumuladores são recalculados do histórico, depois do
+        commit e em lotes, para que a transação do merge continue curta.
+
+        Args:
+            db (Session): Sessão do banco de dados.
+
+        Returns:
+            dict: "inserted", "updated", "history", "inserted_ids" (fundos novos) e
+                "rebuilt" (fundos recalculados do histórico).
+        """
+        bind = db.get_bind()
+        is_pg = bind.dialect.name == "postgresql"
+
+        # índice e estatísticas antes da transação do merge, que deve ser curta
+        # DDL direto: um Index() do SQLAlchemy ficaria preso à tabela e seria
+        # recriado pelo create_all do próximo prepare() no mesmo processo
+        db.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_fund_history_staging_fund_date ON fund_history_staging (fund_id, date)"
+        ))
+        if is_pg:
+            db.execute(text("ANALYZE funds_staging"))
+            db.execute(text("ANALYZE fund_history_staging"))
+        db.commit()
+
+        try:
+            existing = set()
+            if not is_pg:
+                existing = set(db.scalars(
+                    select(models.Fund.cnpj).where(models.Fund.cnpj.in_(select(funds_staging.c.cnpj)))
+                ))
+            returned = db.execute(self._fund_merge_statement(db, datetime.utcnow())).all()
+            if is_pg:
+                inserted_ids = [fund_id for fund_id, inserted in returned if inserted]
+            else:
+                inserted_ids = [fund_id for fund_id, cnpj in returned if cnpj not in existing]
+
+            db.execute(text(RESOLVE_STAGED_FUNDS))
+            rebuild = set()
+            history = merge_history(db, RESOLVED_HISTORY, replace=True, changed_funds=rebuild)
+
+            fund_ids = db.scalars(text(
+                f"SELECT DISTINCT fund_id FROM ({RESOLVED_HISTORY}) r WHERE r.fund_id IS NOT NULL"
+            )).all()
+            # fundos com cotas reais deixam de ter histórico simulado
+            rebuild |= purge_simulated_history(db, fund_ids)
+            rebuild.update(db.scalars(text(UNTRACKED_FUNDS)))
+            appended = db.execute(
+                text(APPENDED_HISTORY).columns(fund_id=Integer, date=DateTime, nav=Float)
+            ).all()
+            # recálculos completos só depois do commit, fora dos locks do merge
+            rebuild = update_fund_stats(
+                db, [row for row in appended if row.fund_id not in rebuild], rebuild=rebuild, defer_rebuild=True,
+            )
+
+            # cotas de CNPJs fora do cadastro são descartadas; os arquivos desta
+            # carga voltam a ser processados quando o cadastro mudar
+            unresolved = db.scalar(text(f"SELECT COUNT(*) FROM ({RESOLVED_HISTORY}) r WHERE r.fund_id IS NULL"))
+            fund_version = get_fund_set_version(db) if unresolved else None
+            for source, etag, last_modified, content_hash, nav in self.source_states:
+                if unresolved and nav:
+                    etag, last_modified = None, None
+                    content_hash = fund_keyed_hash(content_hash, fund_version)
+                save_source_state(db, source, etag, last_modified, content_hash, commit=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        self.source_states = []
+        stats = {
+            "inserted": len(inserted_ids),
+            "updated": len(returned) - len(inserted_ids),
+            "history": history,
+            "inserted_ids": inserted_ids,
+            "rebuilt": self._rebuild_stats(db, rebuild),
+        }
+        logging.info(
+            f"[staging] Merge concluído: {stats['inserted']} fundos inseridos, "
+            f"{stats['updated']} atualizados, {stats['history']} cotas, "
+            f"{stats['rebuilt']} fundos recalculados do histórico"
+        )
+        return stats
+
+    def _rebuild_stats(self, db: Session, fund_ids) -> int:
+        """Recalcula, após o merge, os fundos cujas cotas já contabilizadas mudaram (commit por lote)."""
+        try:
+            return rebuild_fund_stats(db, fund_ids, commit=True)
+        except Exception as e:
+            # sem acumuladores as leituras usam fund_history; o ensure_fund_stats da ingestão os recria
+            db.rollback()
+            logging.warning(f"[staging] Falha ao recalcular acumuladores após o merge: {e}")
+            return 0
+
+    def cleanup(self, db: Session):
+        """
+        Remove as tabelas de staging.
+
+        Args:
+            db (Session): Sessão do banco de dados.
+        """
+        staging_metadata.drop_all(db.get_bind())
@@ -39,15 +39,18 @@ export default function FundsDashboard() {
   }, []);
 
   // ============================================================
-  // 2. computeMetrics (igual ao botão)
+  // 2. computeMetrics (uma requisição para vários fundos)
   // ============================================================
-  async function computeMetrics(cnpj) {
+  async function computeMetrics(cnpjs) {
+    const pending = [...new Set(cnpjs)].filter((cnpj) => !metrics[cnpj]);
+    if (!pending.length) return;
+
     try {
-      const res = await api.get(`/funds/${cnpj}/metrics`);
+      const res = await api.post("/funds/metrics:batch", { cnpjs: pending });
 
       setMetrics((prev) => ({
         ...prev,
-        [cnpj]: res.data,
+        ...res.data,
       }));
     } catch (err) {
       console.error("Erro ao obter métricas:", err);
@@ -58,18 +61,14 @@ export default function FundsDashboard() {
   // 3. Carregar métricas para FUNDS
   // ============================================================
   useEffect(() => {
-    funds.forEach((fund) => {
-      if (!metrics[fund.cnpj]) computeMetrics(fund.cnpj);
-    });
+    computeMetrics(funds.map((fund) => fund.cnpj));
   }, [funds]);
 
   // ============================================================
   // 4. Carregar métricas para RECOMMENDATIONS
   // ============================================================
   useEffect(() => {
-    recommendations.forEach((fund) => {
-      if (!metrics[fund.cnpj]) computeMetrics(fund.cnpj);
-    });
+    computeMetrics(recommendations.map((fund) => fund.cnpj));
   }, [recommendations]);
 
   // ============================================================
@@ -1,20 +1,31 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from backend.app.db import engine, Base
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from datetime import datetime
+from backend.app.db import engine, Base, get_db, pool_status
+from backend.app.history_schema import prepare_history_table
+from backend.app.locks import job_lock
+from backend.app.models import Fund
+from backend.app.progress import progress
 from backend.app.routers import (
     auth_router,
     users_router,
     funds_router,
     favorites_router,
     recommendations_router,
-    report_router
+    report_router,
+    portfolio_router
 )
 from apscheduler.schedulers.background import BackgroundScheduler
-from backend.app.cvm_ingest import run_cvm_ingestion
+from backend.app.ingestion import CVM_INGEST_INTERVAL_HOURS, run_ingestion, run_metrics_recompute, run_nav_matrix_refresh
 import atexit
 
 # uvicorn main:app --reload
-Base.metadata.create_all(bind=engine)
+# migração do histórico e create_all em um worker por vez: os demais esperam e encontram tudo pronto
+with job_lock("history_schema", wait=True):
+    prepare_history_table(engine)
+    Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="FundMatch API", version="0.2.0")
 
@@ -33,20 +44,49 @@ app.include_router(funds_router.router)
 app.include_router(favorites_router.router)
 app.include_router(recommendations_router.router)
 app.include_router(report_router.router)
+app.include_router(portfolio_router.router)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/health/pool")
+def health_pool():
+    """
+    Informa o estado do pool de conexões do banco neste processo.
+
+    Inclui conexões em uso, livres e em overflow, e os contadores de
+    retiradas: quantas esperaram por uma conexão livre, por quanto tempo
+    e quantas estouraram o DB_POOL_TIMEOUT.
+    """
+    return pool_status()
+
+@app.get("/ready")
+def ready(db: Session = Depends(get_db)):
+    """
+    Informa se a API já tem dados para servir e o andamento da ingestão.
+
+    A API fica pronta assim que houver fundos no banco (ex: após um restart)
+    ou quando a primeira ingestão terminar; enquanto isso responde 503.
+    """
+    ingestion = progress.snapshot()
+    has_data = db.query(Fund.id).first() is not None
+    is_ready = has_data or ingestion["completed_runs"] > 0
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "ingestion": ingestion},
+    )
+
 # Scheduler
+# a primeira execução roda imediatamente, em background: o startup não espera a CVM;
+# todos os workers agendam, mas só um executa por intervalo (ver run_ingestion)
 scheduler = BackgroundScheduler()
-scheduler.add_job(run_cvm_ingestion, "interval", hours=6, id="cvm_ingestion")
+scheduler.add_job(run_ingestion, "interval", hours=CVM_INGEST_INTERVAL_HOURS, id="cvm_ingestion",
+                  next_run_time=datetime.now())
+# recálculo completo diário, a partir do histórico (a ingestão só atualiza incrementalmente)
+scheduler.add_job(run_metrics_recompute, "cron", hour=3, id="metrics_recompute")
+# matriz de cotas compartilhada: a ingestão só exporta no host em que rodou
+scheduler.add_job(run_nav_matrix_refresh, "interval", minutes=10, id="nav_matrix_refresh")
 scheduler.start()
 
 atexit.register(lambda: scheduler.shutdown())
-
-@app.on_event("startup")
-def startup_event():
-    print(">> Executando ingestão inicial da CVM...")
-    run_cvm_ingestion()
-    print(">> Ingestão inicial concluída!")
@@ -0,0 +1,18 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from backend.app.db import create_db_engine
+from backend.app.models import Base
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Sessão em um banco SQLite novo, com o schema da aplicação."""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'fundmatch.db'}")
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
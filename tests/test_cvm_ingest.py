@@ -0,0 +1,38 @@
+import requests
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import cvm_ingest, models
+
+
+def _write_cadastro(path, funds):
+    lines = ["CNPJ_FUNDO;DENOM_SOCIAL;CLASSE"] + [f"11.111.111/{i:04d}-00;FUNDO {i};Ações" for i in range(funds)]
+    path.write_bytes("\n".join(lines).encode("latin1"))
+    return str(path)
+
+
+def test_probe_source_without_head_falls_back_to_no_validators(monkeypatch):
+    def failing_head(*args, **kwargs):
+        raise requests.ConnectionError("HEAD recusado")
+
+    monkeypatch.setattr(cvm_ingest.requests, "head", failing_head)
+
+    assert cvm_ingest.probe_source("https://example.com/cad_fi.csv") == (None, None, None)
+
+
+def test_limited_run_is_skipped_only_for_the_same_limit(db, tmp_path, monkeypatch, caplog):
+    source = _write_cadastro(tmp_path / "cad_fi.csv", 5)
+    monkeypatch.setattr(cvm_ingest, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    caplog.set_level("INFO")
+
+    assert cvm_ingest.run_cvm_ingestion(limit=2, source=source, simulate_history=False)
+    assert db.scalar(select(func.count()).select_from(models.Fund)) == 2
+    caplog.clear()
+    assert cvm_ingest.run_cvm_ingestion(limit=2, source=source, simulate_history=False)
+    assert "Cadastro da CVM inalterado" in caplog.text
+
+    # outro limite não reaproveita o estado do prefixo anterior
+    caplog.clear()
+    assert cvm_ingest.run_cvm_ingestion(limit=0, source=source, simulate_history=False)
+    assert "inalterado desde" not in caplog.text
+    assert db.scalar(select(func.count()).select_from(models.Fund)) == 5
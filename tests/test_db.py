@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from backend.app.db import create_async_db_engine, create_db_engine
+
+
+def test_sync_and_async_engines_share_sqlite_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'fundmatch.db'}"
+    engine = create_db_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE funds (id INTEGER PRIMARY KEY)"))
+
+    async def tables():
+        async_engine = create_async_db_engine(url)
+        try:
+            async with async_engine.connect() as conn:
+                result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+                return [row[0] for row in result]
+        finally:
+            await async_engine.dispose()
+
+    try:
+        assert asyncio.run(tables()) == ["funds"]
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "sqlite:///:memory:"])
+def test_async_engine_rejects_in_memory_sqlite(url):
+    with pytest.raises(ValueError, match="memória"):
+        create_async_db_engine(url)
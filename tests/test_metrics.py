@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from backend.app import metrics
+
+KEYS = (
+    "rentability", "volatility", "sharpe", "sortino", "annualized_return", "annualized_volatility",
+    "max_drawdown", "max_drawdown_duration", "calmar", "hit_ratio", "n",
+)
+
+
+def _random_navs(funds, days, seed=7):
+    rng = np.random.default_rng(seed)
+    return 100 * np.cumprod(1 + rng.normal(0.0005, 0.01, size=(funds, days)), axis=1)
+
+
+def test_batch_streaming_and_from_array_agree():
+    navs = _random_navs(3, 300)
+    batch = metrics.batch_metrics(navs, risk_free=0.0001)
+
+    for row, series in enumerate(navs):
+        streamed = metrics.stream_metrics(iter(series), risk_free=0.0001)
+        rebuilt = metrics.OnlineMetrics.from_array(series, risk_free=0.0001).result()
+        for key in KEYS:
+            assert batch[key][row] == pytest.approx(streamed[key], rel=1e-9, abs=1e-12), key
+            assert rebuilt[key] == pytest.approx(streamed[key], rel=1e-9, abs=1e-12), key
+
+
+def test_batch_agrees_with_legacy_functions():
+    navs = _random_navs(2, 50)
+    batch = metrics.batch_metrics(navs)
+
+    for row, series in enumerate(navs.tolist()):
+        returns = metrics.calculate_returns(series)
+        assert batch["rentability"][row] == pytest.approx(metrics.total_return(series))
+        assert batch["volatility"][row] == pytest.approx(metrics.calculate_volatility(returns))
+        assert batch["sharpe"][row] == pytest.approx(metrics.calculate_sharpe(returns))
+
+
+def test_gaps_are_skipped_like_a_shorter_series():
+    navs = _random_navs(1, 60)
+    gapped = navs.copy()
+    gapped[0, [5, 6, 30]] = np.nan
+
+    batch = metrics.batch_metrics(gapped)
+    streamed = metrics.stream_metrics(gapped[0][~np.isnan(gapped[0])])
+    for key in KEYS:
+        assert batch[key][0] == pytest.approx(streamed[key], rel=1e-9, abs=1e-12), key
+
+
+@pytest.mark.parametrize("shape", [(0, 5), (3, 0), (0, 0)])
+def test_empty_matrices(shape):
+    navs = np.empty(shape)
+
+    assert metrics.returns_matrix(navs).shape == shape
+    result = metrics.batch_metrics(navs)
+    for key in KEYS:
+        assert result[key].shape == (shape[0],)
+        assert not result[key].any()
+
+
+def test_all_nan_matrix():
+    result = metrics.batch_metrics(np.full((2, 4), np.nan))
+
+    for key in KEYS:
+        assert np.array_equal(result[key], np.zeros(2)), key
+    assert np.isnan(metrics.returns_matrix(np.full((2, 4), np.nan))).all()
+    cov, corr, counts = metrics.pairwise_covariance(np.full((2, 4), np.nan))
+    assert np.isnan(cov).all() and np.isnan(corr).all() and not counts.any()
+
+
+def test_rolling_metrics_match_direct_windows():
+    navs = _random_navs(1, 80)[0]
+    returns = navs[1:] / navs[:-1] - 1
+    result = metrics.rolling_metrics(navs, [1, 21, 79, 200])
+
+    window = result[21]
+    assert np.isnan(window["return"][:21]).all()
+    for end in (21, 50, 79):
+        chunk = returns[end - 21:end]
+        assert window["return"][end] == pytest.approx(navs[end] / navs[end - 21] - 1)
+        assert window["volatility"][end] == pytest.approx(chunk.std(), rel=1e-8)
+        assert window["sharpe"][end] == pytest.approx(chunk.mean() / chunk.std(), rel=1e-6)
+    assert not np.isnan(result[79]["return"][79])
+    assert np.isnan(result[200]["return"]).all()
+
+
+def test_rolling_metrics_without_returns():
+    for navs in ([], [100.0]):
+        window = metrics.rolling_metrics(navs, [5])[5]
+        assert len(window["return"]) == len(navs)
+        assert np.isnan(window["volatility"]).all()
+
+
+def test_pairwise_covariance_matches_numpy_on_complete_data():
+    navs = _random_navs(4, 120)
+    returns = navs[:, 1:] / navs[:, :-1] - 1
+
+    cov, corr, counts = metrics.pairwise_covariance(navs)
+
+    np.testing.assert_allclose(cov, np.cov(returns), rtol=1e-8, atol=1e-14)
+    np.testing.assert_allclose(corr, np.corrcoef(returns), rtol=1e-8, atol=1e-12)
+    assert (counts == 119).all()
+
+
+def test_pairwise_covariance_uses_only_common_days():
+    navs = _random_navs(2, 40)
+    navs[1, :20] = np.nan
+    returns = navs[:, 1:] / navs[:, :-1] - 1
+    common = ~np.isnan(returns).any(axis=0)
+
+    cov, _, counts = metrics.pairwise_covariance(navs)
+
+    assert counts[0, 1] == common.sum()
+    assert cov[0, 1] == pytest.approx(np.cov(returns[:, common])[0, 1], rel=1e-8)
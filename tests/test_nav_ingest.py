@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import models, nav_ingest
+
+HEADER = "TP_FUNDO;CNPJ_FUNDO;DT_COMPTC;VL_TOTAL;VL_QUOTA;VL_PATRIM_LIQ;CAPTC_DIA;RESG_DIA;NR_COTST\n"
+
+
+def _write_nav_file(path, header, rows):
+    path.write_text(header + "".join(f"FI;11.111.111/0001-11;{day};1;{nav};1;0;0;1\n" for day, nav in rows))
+    return str(path)
+
+
+def test_missing_cnpj_column_names_file_and_column(tmp_path):
+    ref = _write_nav_file(tmp_path / "inf_diario_fi_202401.csv", HEADER.replace("CNPJ_FUNDO", "CNPJ"),
+                          [("2024-01-02", "1.0")])
+
+    with pytest.raises(ValueError, match="inf_diario_fi_202401.csv.*CNPJ_FUNDO"):
+        list(nav_ingest.iter_nav_rows(ref))
+
+
+def test_failed_file_fails_the_run_and_keeps_loading_the_others(db, tmp_path, monkeypatch):
+    db.add(models.Fund(id=1, cnpj="11.111.111/0001-11", name="Fundo 1"))
+    db.commit()
+    _write_nav_file(tmp_path / "inf_diario_fi_202401.csv", HEADER.replace("CNPJ_FUNDO", "CNPJ"),
+                    [("2024-01-02", "1.0")])
+    _write_nav_file(tmp_path / "inf_diario_fi_202402.csv", HEADER,
+                    [("2024-02-01", "1.0"), ("2024-02-02", "1.1")])
+    monkeypatch.setattr(nav_ingest, "SessionLocal", sessionmaker(bind=db.get_bind()))
+
+    with pytest.raises(RuntimeError, match="1 de 2 arquivos"):
+        nav_ingest.run_nav_ingestion(source=str(tmp_path), workers=1)
+
+    assert db.scalar(select(func.count()).select_from(models.FundHistory)) == 2
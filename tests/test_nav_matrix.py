@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from backend.app import crud, models
+from backend.app.nav_matrix import NavMatrixSnapshot, SharedNavMatrix, version_key, write_nav_matrix
+
+START = datetime(2024, 1, 1)
+
+
+def _seed_funds(db, navs_by_fund):
+    for fund_id, navs in navs_by_fund.items():
+        db.add(models.Fund(id=fund_id, cnpj=f"00.000.000/0000-{fund_id:02d}", name=f"Fundo {fund_id}"))
+        db.flush()
+        crud.add_history_bulk(db, fund_id, [(START + timedelta(days=i), nav) for i, nav in enumerate(navs)])
+
+
+def _fund_version(db, fund_id):
+    return crud._history_updated_at(db, [fund_id])
+
+
+def test_append_committed_during_export_is_not_served_as_fresh(db, tmp_path, monkeypatch):
+    _seed_funds(db, {1: [1.0, 1.1, 1.2], 2: [2.0, 2.1, 2.2]})
+    path = str(tmp_path / "nav-matrix.bin")
+    # gravada por uma transação iniciada antes da última escrita de fund_stats
+    # e que só faz commit enquanto a exportação lê as séries
+    stale_write_time = crud._history_updated_at(db) - timedelta(milliseconds=1)
+
+    load_fund_series = crud.load_fund_series
+    appended = []
+
+    def load_during_append(session, fund_ids):
+        if not appended:
+            with Session(db.get_bind()) as writer:
+                crud.add_history_entry(writer, 2, START + timedelta(days=3), 2.3)
+                writer.execute(update(models.FundStats).where(models.FundStats.fund_id == 2)
+                               .values(updated_at=stale_write_time))
+                writer.commit()
+            appended.append(True)
+        return load_fund_series(session, fund_ids)
+
+    monkeypatch.setattr(crud, "load_fund_series", load_during_append)
+    assert crud.export_nav_matrix(db, path) is not None
+    monkeypatch.setattr(crud, "load_fund_series", load_fund_series)
+
+    reader = SharedNavMatrix(path)
+    ids = np.array([2], dtype=np.int64)
+    assert reader.load(ids, _fund_version(db, 2)) is None
+    # e a próxima atualização periódica refaz o arquivo
+    assert crud.export_nav_matrix(db, path, only_if_stale=True) is not None
+
+
+def test_export_is_fresh_once_writes_are_older_than_the_margin(db, tmp_path, monkeypatch):
+    _seed_funds(db, {1: [1.0, 1.1, 1.2], 2: [2.0, 2.1]})
+    path = str(tmp_path / "nav-matrix.bin")
+    monkeypatch.setattr(crud, "NAV_MATRIX_VERSION_MARGIN", timedelta(0))
+
+    assert crud.export_nav_matrix(db, path)["funds"] == 2
+    assert crud.export_nav_matrix(db, path, only_if_stale=True) is None
+
+    ids = np.array([1, 2], dtype=np.int64)
+    loaded = SharedNavMatrix(path).load(ids, crud._history_updated_at(db, [1, 2]))
+    assert loaded is not None
+    expected = crud.series_matrix(ids, crud.load_fund_series(db, [1, 2]))
+    np.testing.assert_array_equal(loaded[1], expected[1])
+    np.testing.assert_array_equal(loaded[2], expected[2])
+
+
+def test_write_and_map_round_trip(tmp_path):
+    path = str(tmp_path / "nav-matrix.bin")
+    fund_ids = np.array([3, 5, 8, 9], dtype=np.int64)
+    dates = np.array([738000, 738001, 738002], dtype=np.int64)
+    matrix = np.array([[1.0, np.nan, 1.2], [2.0, 2.1, 2.2], [np.nan, np.nan, np.nan], [4.0, 4.1, np.nan]])
+    cnpjs = [f"00.000.000/0000-{fund_id:02d}" for fund_id in fund_ids]
+    version = datetime(2024, 3, 1, 12, 30, 15, 123456)
+
+    # blocos de tamanhos diferentes, como na exportação em streaming
+    write_nav_matrix(path, fund_ids, cnpjs, dates, [matrix[:1], matrix[1:]], version)
+    snapshot = NavMatrixSnapshot(path)
+
+    assert snapshot.version == version_key(version)
+    np.testing.assert_array_equal(snapshot.fund_ids, fund_ids)
+    np.testing.assert_array_equal(snapshot.dates, dates)
+    np.testing.assert_array_equal(snapshot.matrix, matrix)
+    assert snapshot.rows_by_cnpj == {cnpj: row for row, cnpj in enumerate(cnpjs)}
+
+    # linhas consecutivas: view do arquivo; as demais são copiadas, sem datas vazias
+    ids, loaded_dates, loaded = snapshot.load(np.array([5, 8], dtype=np.int64))
+    assert ids.tolist() == [5, 8] and loaded_dates.tolist() == dates.tolist()
+    np.testing.assert_array_equal(loaded, matrix[1:3])
+    _, loaded_dates, loaded = snapshot.load(np.array([3, 9], dtype=np.int64), start=738001)
+    assert loaded_dates.tolist() == [738001, 738002]
+    np.testing.assert_array_equal(loaded, matrix[[0, 3], 1:])
+    assert snapshot.load(np.array([3, 4], dtype=np.int64)) is None
+
+
+def test_write_rejects_mismatched_blocks_and_reader_rejects_truncated_file(tmp_path):
+    path = str(tmp_path / "nav-matrix.bin")
+    fund_ids = np.array([1, 2], dtype=np.int64)
+    dates = np.array([738000, 738001], dtype=np.int64)
+
+    with pytest.raises(ValueError):
+        write_nav_matrix(path, fund_ids, ["a", "b"], dates, [np.ones((1, 2))])
+    assert list(tmp_path.iterdir()) == []
+
+    write_nav_matrix(path, fund_ids, ["a", "b"], dates, [np.ones((2, 2))])
+    with open(path, "r+b") as fh:
+        fh.truncate(100)
+    with pytest.raises(ValueError, match="truncado"):
+        NavMatrixSnapshot(path)
+    assert SharedNavMatrix(path).load(fund_ids) is None
@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from backend.app import portfolio
+
+
+def _weekdays(start, end):
+    days, day = [], start
+    while day <= end:
+        if day.weekday() < 5:
+            days.append(day.toordinal())
+        day += timedelta(days=1)
+    return np.array(days)
+
+
+def test_weekly_rebalance_starts_on_monday():
+    dates = _weekdays(date(2024, 2, 1), date(2024, 2, 16))
+
+    points = portfolio.rebalance_points(dates, "weekly")
+
+    assert [date.fromordinal(int(dates[i])) for i in points] == [
+        date(2024, 2, 1), date(2024, 2, 5), date(2024, 2, 12),
+    ]
+
+
+def test_monthly_and_none_rebalance_points():
+    dates = _weekdays(date(2024, 1, 29), date(2024, 3, 4))
+
+    monthly = [date.fromordinal(int(dates[i])) for i in portfolio.rebalance_points(dates, "monthly")]
+    assert monthly == [date(2024, 1, 29), date(2024, 2, 1), date(2024, 3, 1)]
+    assert portfolio.rebalance_points(dates, "none").tolist() == [0]
+    assert portfolio.rebalance_points(dates[:0], "weekly").tolist() == []
+
+
+@pytest.mark.parametrize("cap", [0.05, 0.2, 0.35, 1.0])
+def test_capped_simplex_sums_to_one_within_bounds(cap):
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        v = rng.normal(size=10) * 3
+
+        w = portfolio.project_capped_simplex(v, cap)
+
+        assert w.sum() == pytest.approx(1.0)
+        assert (w >= 0).all()
+        assert (w <= max(cap, 0.1) + 1e-9).all()
+
+
+def test_capped_simplex_keeps_points_already_inside():
+    v = np.array([0.1, 0.2, 0.3, 0.4])
+
+    np.testing.assert_allclose(portfolio.project_capped_simplex(v, 0.5), v)
+
+
+def _covariance(n, seed=11):
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=(n, n)) * 0.01
+    return a @ a.T + np.diag(np.full(n, 1e-4))
+
+
+def test_mean_variance_weights_respect_bounds_and_prefer_return():
+    mu = np.array([0.01, 0.05, 0.10, 0.02])
+
+    weights, _ = portfolio.mean_variance_weights(mu, np.eye(4) * 0.04, risk_aversion=3.0, max_weight=0.6)
+
+    assert weights.sum() == pytest.approx(1.0)
+    assert (weights >= 0).all() and (weights <= 0.6 + 1e-9).all()
+    assert np.argmax(weights) == 2
+
+
+def test_risk_parity_equalizes_risk_contributions():
+    cov = _covariance(5)
+
+    weights, _ = portfolio.risk_parity_weights(cov, max_weight=1.0)
+
+    contributions = weights * (cov @ weights)
+    assert weights.sum() == pytest.approx(1.0)
+    np.testing.assert_allclose(contributions, contributions.mean(), rtol=1e-4)
+
+
+def test_risk_parity_applies_cap():
+    cov = np.diag([0.0001, 0.04, 0.04, 0.04])
+
+    weights, _ = portfolio.risk_parity_weights(cov, max_weight=0.3)
+
+    assert weights.sum() == pytest.approx(1.0)
+    assert weights.max() <= 0.3 + 1e-9
+
+
+def test_backtest_without_rebalance_is_buy_and_hold():
+    navs = np.array([[1.0, 1.1, 1.2, 1.3], [2.0, 1.8, 2.2, 2.4]])
+    weights = np.array([0.5, 0.5])
+    dates = _weekdays(date(2024, 1, 1), date(2024, 1, 4))
+
+    equity, points, turnover = portfolio.backtest(navs, weights, dates, "none", initial=100.0)
+
+    expected = 100.0 * (weights[:, None] * navs / navs[:, :1]).sum(axis=0)
+    np.testing.assert_allclose(equity, expected)
+    assert points.tolist() == [0]
+    assert turnover == 0.0
+
+
+def test_backtest_daily_rebalance_compounds_weighted_returns():
+    navs = np.array([[1.0, 1.1, 1.0, 1.2], [1.0, 0.9, 1.0, 1.0]])
+    weights = np.array([0.25, 0.75])
+    dates = _weekdays(date(2024, 1, 1), date(2024, 1, 4))
+
+    equity, points, turnover = portfolio.backtest(navs, weights, dates, "daily")
+
+    daily = (weights[:, None] * (navs[:, 1:] / navs[:, :-1])).sum(axis=0)
+    np.testing.assert_allclose(equity, np.r_[1.0, np.cumprod(daily)])
+    assert points.tolist() == [0, 1, 2, 3]
+    assert turnover > 0
+
+
+def test_backtest_starts_at_first_price_and_renormalizes():
+    navs = np.array([[np.nan, 1.0, 1.1, 1.2], [np.nan, np.nan, 2.0, 2.2]])
+    dates = _weekdays(date(2024, 1, 1), date(2024, 1, 4))
+
+    equity, points, _ = portfolio.backtest(navs, np.array([0.5, 0.5]), dates, "daily")
+
+    assert np.isnan(equity[0])
+    # só o primeiro fundo tem cota no primeiro rebalanceamento: recebe todo o peso
+    assert equity[1:3].tolist() == pytest.approx([1.0, 1.1])
+    assert equity[3] == pytest.approx(1.1 * (0.5 * 1.2 / 1.1 + 0.5 * 2.2 / 2.0))
+    assert points.tolist() == [1, 2, 3]
@@ -0,0 +1,49 @@
+from datetime import date
+
+import numpy as np
+
+from backend.app.series import SERIES_EPOCH, daily_series, pack_series, series_days, series_matrix, unpack_series
+
+
+def _series(days, navs):
+    return unpack_series(*pack_series(series_days(days), navs))
+
+
+def test_series_matrix_aligns_funds_by_date():
+    d1, d2, d3 = (date(2024, 1, day).toordinal() for day in (2, 3, 4))
+    series = {1: _series([d1, d3], [1.0, 1.2]), 3: _series([d2, d3], [5.0, 5.5])}
+
+    fund_ids, dates, matrix = series_matrix(np.array([1, 2, 3]), series)
+
+    assert fund_ids.tolist() == [1, 2, 3]
+    assert dates.tolist() == [d1, d2, d3]
+    np.testing.assert_array_equal(matrix, [[1.0, np.nan, 1.2], [np.nan] * 3, [np.nan, 5.0, 5.5]])
+
+
+def test_series_matrix_date_range():
+    days = [date(2024, 1, day).toordinal() for day in (2, 3, 4, 5)]
+    series = {1: _series(days, [1.0, 1.1, 1.2, 1.3])}
+
+    _, dates, matrix = series_matrix(np.array([1]), series, start=days[1], end=days[2])
+
+    assert dates.tolist() == days[1:3]
+    assert matrix.tolist() == [[1.1, 1.2]]
+
+
+def test_series_matrix_without_series():
+    fund_ids, dates, matrix = series_matrix(np.array([4, 5]), {5: _series([], [])})
+
+    assert fund_ids.tolist() == [4, 5]
+    assert dates.shape == (0,)
+    assert matrix.shape == (2, 0)
+
+
+def test_series_round_trip_and_daily_dedup():
+    ordinals = np.array([SERIES_EPOCH + 10, SERIES_EPOCH + 10, SERIES_EPOCH + 12])
+    days, navs = daily_series(ordinals, [1.0, 1.5, 2.0])
+
+    assert days.tolist() == [SERIES_EPOCH + 10, SERIES_EPOCH + 12]
+    assert navs.tolist() == [1.5, 2.0]
+    packed_days, packed_navs = _series(days, navs)
+    assert packed_days.tolist() == [10, 12]
+    assert packed_navs.tolist() == [1.5, 2.0]